@@ -0,0 +1,7 @@
+__all__ = [
+    "cfg",
+    "dependence",
+    "hazards",
+    "pipeline",
+    "profile"
+]
@@ -0,0 +1,176 @@
+import bisect
+from dlx_parser.grammar import i_opcode, i_rs1, i_immediate, i_label
+from instructions.instruction import Instruction
+import instructions.operands as operands
+
+
+# A straight line sequence of instructions, entered only at the first
+# instruction and left only after the last.
+class BasicBlock(object):
+    # Input:
+    #   labels - Names of the labels at the start of the block.
+    def __init__(self, labels):
+        self.labels = labels
+        self.instructions = []
+        # blocks control may pass to next, set by build_graph
+        self.successors = []
+        # blocks called by a jal at the end of the block, set by build_graph
+        self.callees = []
+
+    # Returns the address of the block.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The address of the first instruction.
+    def address(self):
+        return self.instructions[0].address
+
+    # Returns a name for the block, which is its first label or its address.
+    # Input:
+    #   n/a
+    # Returns:
+    #   String
+    def name(self):
+        if self.labels:
+            return self.labels[0]
+        return "0x{0:08x}".format(self.address())
+
+    # Returns the last instruction of the block.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The instruction.
+    def last(self):
+        return self.instructions[-1]
+
+
+# Returns the labels at each address.
+# Input:
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   Dictionary mapping addresses to sorted lists of label names.
+def labels_by_address(symbol_table):
+    labels = {}
+    for name, address in symbol_table.iteritems():
+        labels.setdefault(address, []).append(name)
+    for names in labels.itervalues():
+        names.sort()
+    return labels
+
+
+# Returns true if execution continues from an instruction into the next
+# instruction. Calls and traps return to the next instruction, except trap 0,
+# which halts.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def falls_through(instr):
+    op = instr.source[i_opcode]
+    if op == "trap":
+        return instr.source.get(i_immediate) != 0
+    return op not in ("j", "jr")
+
+
+# Returns true if an instruction returns from a call, which is jr through the
+# link register.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def returns(instr):
+    return instr.source[i_opcode] == "jr" and \
+        instr.source.get(i_rs1) == operands.link_register
+
+
+# Returns the address a branch or direct jump goes to.
+# Input:
+#   instr - The instruction.
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   The address, or None if the instruction has no fixed target.
+def target_address(instr, symbol_table):
+    op = instr.source[i_opcode]
+    if op not in operands.branches and op not in operands.direct_jumps:
+        return None
+    if i_label in instr.source:
+        return symbol_table.get(instr.source[i_label])
+    return instr.source.get(i_immediate)
+
+
+# Returns the addresses of branch and jump targets given as numbers rather
+# than labels.
+# Input:
+#   program - The program (mapping addresses to memory).
+# Returns:
+#   Set of addresses.
+def numeric_targets(program):
+    targets = set()
+    for mem in program.itervalues():
+        if isinstance(mem, Instruction) and i_immediate in mem.source:
+            op = mem.source[i_opcode]
+            if op in operands.branches or op in operands.direct_jumps:
+                targets.add(mem.source[i_immediate])
+    return targets
+
+
+# Splits the instructions of a program into basic blocks. Blocks start at the
+# first instruction, at labeled instructions and other branch targets, after
+# instructions that end a block, and wherever the instructions are not
+# contiguous.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   List of basic blocks in address order.
+def build_blocks(program, symbol_table):
+    labels = labels_by_address(symbol_table)
+    targets = numeric_targets(program)
+    blocks = []
+    block = None
+    prev = None
+    for address in sorted(program):
+        mem = program[address]
+        if not isinstance(mem, Instruction):
+            prev = None
+            continue
+        if prev is None or address in labels or address in targets or \
+           operands.ends_block(prev) or prev.address + prev.size != address:
+            block = BasicBlock(labels.get(address, []))
+            blocks.append(block)
+        block.instructions.append(mem)
+        prev = mem
+    return blocks
+
+
+# Splits the instructions of a program into basic blocks and links them into
+# a control flow graph. A branch goes to its target and the next block, and a
+# jal calls its target and returns to the next block. jalr calls an unknown
+# target, and jr (a return when it is jr r31) and trap 0 have no successors.
+# Execution falls through padding between blocks, but not through data.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   List of basic blocks in address order.
+def build_graph(program, symbol_table):
+    blocks = build_blocks(program, symbol_table)
+    by_address = dict((b.address(), b) for b in blocks)
+    addresses = sorted(program)
+    for n, block in enumerate(blocks):
+        last = block.last()
+        target = by_address.get(target_address(last, symbol_table))
+        if target is not None:
+            if last.source[i_opcode] in operands.calls:
+                block.callees.append(target)
+            else:
+                block.successors.append(target)
+        following = None
+        after = bisect.bisect_right(addresses, last.address)
+        if n + 1 < len(blocks) and after < len(addresses) and \
+           blocks[n + 1].address() == addresses[after]:
+            following = blocks[n + 1]
+        if following is not None and falls_through(last) and \
+           following not in block.successors:
+            block.successors.append(following)
+    return blocks
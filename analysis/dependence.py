@@ -0,0 +1,70 @@
+from dlx_parser.grammar import i_opcode
+import instructions.operands as operands
+
+
+# The dependences between a sequence of instructions, which must keep their
+# relative order. Registers give read after write, write after read, and
+# write after write dependences. Memory is not disambiguated, so stores are
+# ordered with all other loads and stores.
+class DependenceGraph(object):
+    # Input:
+    #   instrs - The instructions, in program order.
+    def __init__(self, instrs):
+        self.instrs = instrs
+        # index -> set of indices that must come before it
+        self.preds = [set() for _ in instrs]
+        # index -> set of indices that must come after it
+        self.succs = [set() for _ in instrs]
+        # (producer index, consumer index) -> registers read
+        self.flow = {}
+        self._build()
+
+    # Adds a dependence.
+    # Input:
+    #   earlier - Index of the earlier instruction.
+    #   later - Index of the later instruction.
+    # Returns:
+    #   n/a
+    def _add(self, earlier, later):
+        self.preds[later].add(earlier)
+        self.succs[earlier].add(later)
+
+    # Finds the dependences between the instructions.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _build(self):
+        last_write = {}
+        reads_since_write = {}
+        last_store = None
+        loads_since_store = []
+        for j, instr in enumerate(self.instrs):
+            for reg in operands.reads(instr):
+                if reg in last_write:
+                    i = last_write[reg]
+                    self._add(i, j)
+                    self.flow.setdefault((i, j), []).append(reg)
+            for reg in operands.writes(instr):
+                if reg in last_write:
+                    self._add(last_write[reg], j)
+                for i in reads_since_write.get(reg, []):
+                    if i != j:
+                        self._add(i, j)
+            for reg in operands.reads(instr):
+                reads_since_write.setdefault(reg, []).append(j)
+            for reg in operands.writes(instr):
+                last_write[reg] = j
+                reads_since_write[reg] = []
+            op = instr.source[i_opcode]
+            if op in operands.stores:
+                if last_store is not None:
+                    self._add(last_store, j)
+                for i in loads_since_store:
+                    self._add(i, j)
+                last_store = j
+                loads_since_store = []
+            elif op in operands.loads:
+                if last_store is not None:
+                    self._add(last_store, j)
+                loads_since_store.append(j)
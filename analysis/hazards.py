@@ -0,0 +1,384 @@
+from analysis.pipeline import normal_read, branch_read, store_read
+from dlx_parser.grammar import i_opcode
+import instructions.operands as operands
+
+# hazard kinds
+raw_hazard = "RAW"
+load_use_hazard = "load-use"
+waw_hazard = "WAW"
+structural_hazard = "structural"
+
+
+# A pipeline stall caused by an instruction.
+class Hazard(object):
+    # Input:
+    #   instr - The stalled instruction.
+    #   kind - The hazard kind.
+    #   cycles - The number of stall cycles.
+    #   producer - The earlier instruction causing the stall.
+    #   register - The register causing the stall, if any.
+    def __init__(self, instr, kind, cycles, producer, register=None):
+        self.instr = instr
+        self.kind = kind
+        self.cycles = cycles
+        self.producer = producer
+        self.register = register
+
+    # Returns a description of the hazard.
+    # Input:
+    #   n/a
+    # Returns:
+    #   String
+    def description(self):
+        desc = "{0} stall{1} {2}".format(
+            self.cycles,
+            "" if self.cycles == 1 else "s",
+            self.kind
+        )
+        if self.register is not None:
+            desc += " on " + self.register
+        desc += " after {0} (line {1})".format(
+            self.producer.source[i_opcode],
+            self.producer.line_no
+        )
+        return desc
+
+
+# Tracks when the results of issued instructions are available, in order to
+# find the cycle each following instruction can issue. Cycles count the
+# issue of instructions into EX.
+class PipelineState(object):
+    # Input:
+    #   model - The pipeline model (see analysis.pipeline).
+    def __init__(self, model):
+        self.model = model
+        self.reset()
+
+    # Clears the state, as when the pipeline is entered from elsewhere.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def reset(self):
+        # issue cycle of the last instruction
+        self.cycle = -1
+        # register -> (producer, issue cycle)
+        self.ready = {}
+        # register -> cycle its last write completes
+        self.complete = {}
+        # first cycle the divider is free
+        self.divider_free = 0
+        # last instruction using the divider
+        self.divider_user = None
+
+    # Returns a copy of the state.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The new state.
+    def copy(self):
+        state = PipelineState(self.model)
+        state.cycle = self.cycle
+        state.ready = dict(self.ready)
+        state.complete = dict(self.complete)
+        state.divider_free = self.divider_free
+        state.divider_user = self.divider_user
+        return state
+
+    # Returns a copy of the state as seen by the next block, so that its
+    # first instruction issues at cycle 0 unless it stalls.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The new state.
+    def entering(self):
+        shift = -self.cycle - 1
+        state = PipelineState(self.model)
+        state.ready = dict(
+            (reg, (producer, issued + shift))
+            for reg, (producer, issued) in self.ready.iteritems()
+        )
+        state.complete = dict(
+            (reg, cycle + shift) for reg, cycle in self.complete.iteritems()
+        )
+        state.divider_free = self.divider_free + shift
+        state.divider_user = self.divider_user
+        return state
+
+    # Adds the pending results of another state at the same cycle, keeping
+    # whichever result of each register is ready later, so that the state
+    # holds for control arriving from either.
+    # Input:
+    #   other - The other state.
+    # Returns:
+    #   n/a
+    def merge(self, other):
+        for reg, (producer, issued) in other.ready.iteritems():
+            if reg not in self.ready or \
+               self._need(reg, other) > self._need(reg, self):
+                self.ready[reg] = (producer, issued)
+        for reg, cycle in other.complete.iteritems():
+            self.complete[reg] = max(cycle, self.complete.get(reg, cycle))
+        if other.divider_free > self.divider_free:
+            self.divider_free = other.divider_free
+            self.divider_user = other.divider_user
+
+    # Returns the cycles a register of a state is ready for normal reads and
+    # for stores, which order the results of different producers.
+    # Input:
+    #   reg - The register name.
+    #   state - The state.
+    # Returns:
+    #   (cycle, cycle)
+    def _need(self, reg, state):
+        producer, issued = state.ready[reg]
+        return (
+            issued + self.model.distance(producer),
+            issued + self.model.distance(producer, store_read)
+        )
+
+    # Returns a value comparing equal for states with the same pending
+    # results.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Tuple.
+    def key(self):
+        return (
+            self.cycle,
+            sorted((reg, id(p), c) for reg, (p, c) in self.ready.iteritems()),
+            sorted(self.complete.iteritems()),
+            self.divider_free
+        )
+
+    # Returns the earliest cycle an instruction can issue.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   (cycle, the hazard delaying the instruction or None)
+    def earliest(self, instr):
+        timing = self.model.timing
+        reads, writes, latency, uses_divider, _ = timing(instr)
+        ready = self.ready
+        cycle = self.cycle + 1
+        cause = None
+        for reg, kind in reads:
+            if reg not in ready:
+                continue
+            producer, issued = ready[reg]
+            need = issued + timing(producer)[4][kind]
+            if need > cycle:
+                cycle = need
+                if producer.source[i_opcode] in operands.loads:
+                    cause = (load_use_hazard, producer, reg)
+                else:
+                    cause = (raw_hazard, producer, reg)
+        # writes have to complete in order
+        for reg in writes:
+            if reg in self.complete and \
+               cycle + latency <= self.complete[reg]:
+                cycle = self.complete[reg] - latency + 1
+                cause = (waw_hazard, ready[reg][0], reg)
+        if uses_divider and self.divider_free > cycle:
+            cycle = self.divider_free
+            cause = (structural_hazard, self.divider_user, None)
+        hazard = None
+        if cause is not None:
+            kind, producer, reg = cause
+            hazard = Hazard(instr, kind, cycle - self.cycle - 1, producer,
+                            reg)
+        return cycle, hazard
+
+    # Issues an instruction at the earliest possible cycle.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   The hazard delaying the instruction, or None.
+    def issue(self, instr):
+        cycle, hazard = self.earliest(instr)
+        _, writes, latency, uses_divider, _ = self.model.timing(instr)
+        for reg in writes:
+            self.ready[reg] = (instr, cycle)
+            self.complete[reg] = cycle + latency
+        if uses_divider:
+            self.divider_free = cycle + latency + 1
+            self.divider_user = instr
+        self.cycle = cycle
+        return hazard
+
+    # Issues an instruction that can't stall (see never_stall) in the cycle
+    # after the last one, skipping the hazard checks.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   n/a
+    def advance(self, instr):
+        _, writes, latency, _, _ = self.model.timing(instr)
+        cycle = self.cycle + 1
+        for reg in writes:
+            self.ready[reg] = (instr, cycle)
+            self.complete[reg] = cycle + latency
+        self.cycle = cycle
+
+
+# The estimated execution of a basic block.
+class BlockResult(object):
+    # Input:
+    #   block - The basic block.
+    def __init__(self, block):
+        self.block = block
+        self.hazards = []
+        self.stalls = 0
+        self.branch_penalty = 0
+
+    # Returns the estimated cycles to execute the block once.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Cycles.
+    def cycles(self):
+        return len(self.block.instructions) + self.stalls + \
+            self.branch_penalty
+
+
+# The result of a hazard analysis.
+class HazardReport(object):
+    # Input:
+    #   model - The pipeline model used.
+    def __init__(self, model):
+        self.model = model
+        self.blocks = []
+
+    # Returns the hazards caused by each source line.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Dictionary mapping line numbers to lists of hazards.
+    def line_hazards(self):
+        lines = {}
+        for result in self.blocks:
+            for hazard in result.hazards:
+                lines.setdefault(hazard.instr.line_no, []).append(hazard)
+        return lines
+
+    # Returns the total estimated stall cycles.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Cycles.
+    def stalls(self):
+        return sum(result.stalls for result in self.blocks)
+
+    # Returns a human readable report.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Report string.
+    def report(self):
+        out = ["Pipeline hazards (forwarding {0}, branch penalty {1}):".format(
+            "on" if self.model.forwarding() else "off",
+            self.model.branch_penalty()
+        )]
+        out.append("{0:>15}   {1:>10} {2:>7} {3:>7} {4:>7} {5:>7}".format(
+            "block", "address", "instrs", "stalls", "branch", "cycles"
+        ))
+        total = 0
+        for result in self.blocks:
+            block = result.block
+            out.append(
+                "{0:>15} : 0x{1:08x} {2:7} {3:7} {4:7} {5:7}".format(
+                    block.name(),
+                    block.address(),
+                    len(block.instructions),
+                    result.stalls,
+                    result.branch_penalty,
+                    result.cycles()
+                )
+            )
+            total += result.cycles()
+        out.append("Total stalls: {0}, estimated cycles: {1} (taken "
+                   "branches)".format(self.stalls(), total))
+        lines = self.line_hazards()
+        if lines:
+            out.append("Stalls by line:")
+        for line_no in sorted(lines):
+            for hazard in lines[line_no]:
+                out.append("{0:>15} : {1}".format(
+                    "line " + repr(line_no),
+                    hazard.description()
+                ))
+        return "\n".join(out)
+
+
+# Returns the instructions of a program that never stall, whichever of its
+# instructions run before them: every producer of a register they read is
+# ready by the next cycle, no producer of a register they write completes
+# later than they do, and they don't use the divider.
+# Input:
+#   instructions - The instructions of the program.
+#   model - The pipeline model.
+# Returns:
+#   List of instructions.
+def never_stall(instructions, model):
+    distances = {}
+    latencies = {}
+    for producer in instructions:
+        latency = model.latency(producer)
+        for reg in operands.writes(producer):
+            latencies[reg] = max(latencies.get(reg, 0), latency)
+            for kind in (normal_read, branch_read, store_read):
+                distances[reg, kind] = max(distances.get((reg, kind), 0),
+                                           model.distance(producer, kind))
+    result = []
+    for instr in instructions:
+        if model.uses_divider(instr) or \
+           any(distances.get(read, 0) > 1 for read in model.reads(instr)):
+            continue
+        latency = model.latency(instr)
+        if all(latencies.get(reg, 0) <= latency
+               for reg in operands.writes(instr)):
+            result.append(instr)
+    return result
+
+
+# Returns true if execution can continue from an instruction into the next
+# block in address order.
+# Input:
+#   instr - The last instruction of a block.
+#   block - The next block.
+# Returns:
+#   bool
+def falls_through(instr, block):
+    op = instr.source[i_opcode]
+    return op not in operands.jumps and op not in operands.barriers and \
+        instr.address + instr.size == block.address()
+
+
+# Estimates the pipeline stalls of a program. The pipeline state flows from
+# each block into the next block in address order, unless the block ends in a
+# jump, call, or trap. Conditional branches are charged the branch penalty as
+# if taken.
+# Input:
+#   blocks - The basic blocks of the program (see analysis.cfg).
+#   model - The pipeline model.
+# Returns:
+#   The hazard report.
+def analyze(blocks, model):
+    report = HazardReport(model)
+    state = PipelineState(model)
+    prev = None
+    for block in blocks:
+        if prev is None or not falls_through(prev.last(), block):
+            state.reset()
+        result = BlockResult(block)
+        for instr in block.instructions:
+            hazard = state.issue(instr)
+            if hazard is not None and hazard.cycles > 0:
+                result.hazards.append(hazard)
+                result.stalls += hazard.cycles
+        op = block.last().source[i_opcode]
+        if op in operands.branches or op in operands.jumps:
+            result.branch_penalty = model.branch_penalty()
+        report.blocks.append(result)
+        prev = block
+    return report
@@ -0,0 +1,181 @@
+import string
+from dlx_parser.grammar import i_opcode, i_rs1
+import instructions.operands as operands
+
+# execution units
+int_unit = "int"
+load_unit = "load"
+fp_add_unit = "fp_add"
+fp_mult_unit = "fp_mult"
+fp_div_unit = "fp_div"
+fp_convert_unit = "fp_convert"
+
+# instructions executed by each unit other than the integer unit
+unit_instructions = {
+    load_unit: operands.loads,
+    fp_add_unit: ("addf", "subf", "addd", "subd"),
+    fp_mult_unit: ("multf", "multd", "mult", "multu"),
+    fp_div_unit: ("divf", "divd", "div", "divu"),
+    fp_convert_unit: ("cvtf2d", "cvtf2i", "cvtd2f", "cvtd2i", "cvti2f",
+                      "cvti2d")
+}
+
+# kinds of register reads
+normal_read = "normal"
+# read by a branch or jump, which is resolved in ID
+branch_read = "branch"
+# value read by a store, which is needed in MEM
+store_read = "store"
+
+
+# Timing model of the classic 5 stage DLX pipeline (IF, ID, EX, MEM, WB) with
+# multi cycle floating point units. Latencies are the number of stall cycles
+# between an instruction and a dependent ALU instruction that immediately
+# follows it when results are forwarded.
+class PipelineModel(object):
+    # Default model parameters.
+    defaults = {
+        # results are forwarded to EX (and to ID for branches)
+        "forwarding": 1,
+        # cycles lost on a taken branch or jump
+        "branch_penalty": 1,
+        # the divider accepts a new operation every cycle
+        "fp_div_pipelined": 0,
+        int_unit: 0,
+        load_unit: 1,
+        fp_add_unit: 3,
+        fp_mult_unit: 6,
+        fp_div_unit: 24,
+        fp_convert_unit: 3
+    }
+
+    def __init__(self):
+        self.params = dict(self.defaults)
+        # instruction -> timing (see timing)
+        self.timings = {}
+        self.units = {}
+        for unit, names in unit_instructions.iteritems():
+            for name in names:
+                self.units[name] = unit
+
+    # Loads model parameters from a file, with one "name value" pair per line.
+    # Parameters not in the file keep their default values.
+    # Input:
+    #   name - The file name.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - The file format isn't recognized.
+    #   ValueError - Unknown parameter name.
+    def load(self, name):
+        with open(name, "r") as f:
+            for line in f:
+                words = string.split(string.lower(line))
+                if len(words) is 0:
+                    continue
+                if len(words) is not 2:
+                    raise IOError("file {} has unknown format".format(name))
+                if words[0] not in self.defaults:
+                    raise ValueError("Unknown pipeline parameter " + words[0])
+                self.params[words[0]] = int(words[1])
+        self.timings = {}
+
+    # Returns true if results are forwarded.
+    # Input:
+    #   n/a
+    # Returns:
+    #   bool
+    def forwarding(self):
+        return self.params["forwarding"] != 0
+
+    # Returns the cycles lost on a taken branch or jump.
+    # Input:
+    #   n/a
+    # Returns:
+    #   int
+    def branch_penalty(self):
+        return self.params["branch_penalty"]
+
+    # Returns true if an instruction occupies the unpipelined divider.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   bool
+    def uses_divider(self, instr):
+        return self.unit(instr) == fp_div_unit and \
+            not self.params["fp_div_pipelined"]
+
+    # Returns the execution unit of an instruction.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   The unit name.
+    def unit(self, instr):
+        return self.units.get(instr.source[i_opcode], int_unit)
+
+    # Returns the latency of an instruction's unit.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   Cycles.
+    def latency(self, instr):
+        return self.params[self.unit(instr)]
+
+    # Returns the number of cycles a dependent instruction has to issue after
+    # the instruction producing its operand.
+    # Input:
+    #   producer - The instruction writing the register.
+    #   kind - The kind of read by the consumer.
+    # Returns:
+    #   Cycles (1 when there is no stall).
+    def distance(self, producer, kind=normal_read):
+        delay = self.latency(producer)
+        if not self.forwarding():
+            # wait for write back, with the register file written in the
+            # first half of the cycle and read in the second
+            delay += 1 if self.unit(producer) == load_unit else 2
+        elif kind == branch_read:
+            delay += 1
+        elif kind == store_read:
+            delay = max(0, delay - 1)
+        return delay + 1
+
+    # Returns the registers read by an instruction and the kind of each read.
+    # Input:
+    #   instr - The consumer instruction.
+    # Returns:
+    #   List of (register name, read kind).
+    @staticmethod
+    def reads(instr):
+        op = instr.source[i_opcode]
+        if op in operands.branches or op in operands.jumps:
+            return [(reg, branch_read) for reg in operands.reads(instr)]
+        if op in operands.stores:
+            regs = [(reg, store_read)
+                    for reg in operands.stored_registers(instr)]
+            base = instr.source.get(i_rs1, operands.zero_register)
+            if base != operands.zero_register:
+                regs.append((base, normal_read))
+            return regs
+        return [(reg, normal_read) for reg in operands.reads(instr)]
+
+    # Returns the timing of an instruction, which is looked up once and kept
+    # for the instruction.
+    # Input:
+    #   instr - The instruction.
+    # Returns:
+    #   (registers and kinds read (see reads), registers written, latency,
+    #    true if it uses the divider, dictionary mapping read kinds to the
+    #    distance of a consumer (see distance))
+    def timing(self, instr):
+        timing = self.timings.get(instr)
+        if timing is None:
+            timing = self.timings[instr] = (
+                self.reads(instr),
+                operands.writes(instr),
+                self.latency(instr),
+                self.uses_divider(instr),
+                dict((kind, self.distance(instr, kind))
+                     for kind in (normal_read, branch_read, store_read))
+            )
+        return timing
@@ -0,0 +1,169 @@
+import string
+import struct
+
+# first bytes of a binary profile
+binary_magic = "DLXPROF1"
+# binary profile record: address, taken count, not taken count
+binary_record = struct.Struct("<III")
+
+
+# Branch counts from an execution of a program. A text profile has one
+# "<branch> <taken> [<not taken>]" line per branch, where the branch is an
+# address or a label with an optional +/- offset, and # starts a comment. A
+# binary profile is binary_magic followed by binary_record entries.
+class BranchProfile(object):
+    def __init__(self):
+        # address or label -> [taken, not taken]
+        self.counts = {}
+
+    # Adds counts for a branch.
+    # Input:
+    #   key - The branch address, or label text.
+    #   taken - The number of times the branch was taken.
+    #   not_taken - The number of times the branch was not taken.
+    # Returns:
+    #   n/a
+    def add(self, key, taken, not_taken=0):
+        counts = self.counts.setdefault(key, [0, 0])
+        counts[0] += taken
+        counts[1] += not_taken
+
+    # Loads a text or binary profile, adding to the counts.
+    # Input:
+    #   name - The file name.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - The file couldn't be read.
+    #   ValueError - The file isn't a valid profile.
+    def load(self, name):
+        with open(name, "rb") as f:
+            data = f.read()
+        if data.startswith(binary_magic):
+            self._load_binary(data[len(binary_magic):], name)
+        else:
+            self._load_text(data, name)
+
+    # Adds the counts of a binary profile.
+    # Input:
+    #   data - The records.
+    #   name - The file name, for errors.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - The data isn't a whole number of records.
+    def _load_binary(self, data, name):
+        if len(data) % binary_record.size:
+            raise ValueError("truncated profile " + name)
+        for offset in range(0, len(data), binary_record.size):
+            address, taken, not_taken = binary_record.unpack_from(data, offset)
+            self.add(address, taken, not_taken)
+
+    # Adds the counts of a text profile.
+    # Input:
+    #   data - The text.
+    #   name - The file name, for errors.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - A line is invalid.
+    def _load_text(self, data, name):
+        for line_no, line in enumerate(data.splitlines()):
+            words = string.split(line.split("#")[0])
+            if len(words) is 0:
+                continue
+            if len(words) > 3 or len(words) < 2:
+                raise ValueError("{0} line {1}: expected <branch> <taken> "
+                                 "[<not taken>]".format(name, line_no + 1))
+            try:
+                counts = [int(w) for w in words[1:]]
+            except ValueError:
+                raise ValueError("{0} line {1}: invalid count".format(
+                    name,
+                    line_no + 1
+                ))
+            key = words[0]
+            try:
+                key = int(key, 0)
+            except ValueError:
+                pass
+            self.add(key, *counts)
+
+    # Records the conditional branches of a simulated run (see
+    # simulator.machine) in the profile.
+    # Input:
+    #   machine - The machine.
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        machine.branch_hooks.append(self.branch)
+
+    # Counts a branch of a simulated run.
+    # Input:
+    #   pc - The branch address.
+    #   taken - True if the branch was taken.
+    #   target - The address the branch goes to when taken.
+    # Returns:
+    #   n/a
+    def branch(self, pc, taken, target):
+        counts = self.counts.get(pc)
+        if counts is None:
+            counts = self.counts[pc] = [0, 0]
+        if taken:
+            counts[0] += 1
+        else:
+            counts[1] += 1
+
+    # Writes the profile in binary format. Counts keyed by label must be
+    # resolved first.
+    # Input:
+    #   name - The file name.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - The file couldn't be written.
+    def save(self, name):
+        with open(name, "wb") as f:
+            f.write(binary_magic)
+            for address in sorted(self.counts):
+                taken, not_taken = self.counts[address]
+                f.write(binary_record.pack(address, taken, not_taken))
+
+    # Returns the counts keyed by branch address.
+    # Input:
+    #   symbol_table - The symbol table (mapping strings to addresses).
+    # Returns:
+    #   Dictionary mapping addresses to (taken, not taken).
+    # Throws:
+    #   ValueError - A label isn't in the symbol table.
+    def resolve(self, symbol_table):
+        resolved = {}
+        for key, counts in self.counts.iteritems():
+            address = key
+            if not isinstance(key, (int, long)):
+                address = self._label_address(key, symbol_table)
+            taken, not_taken = resolved.get(address, (0, 0))
+            resolved[address] = (taken + counts[0], not_taken + counts[1])
+        return resolved
+
+    # Returns the address of a label with an optional offset.
+    # Input:
+    #   key - The label text, such as "loop" or "loop+8".
+    #   symbol_table - The symbol table (mapping strings to addresses).
+    # Returns:
+    #   The address.
+    # Throws:
+    #   ValueError - The label isn't in the symbol table.
+    @staticmethod
+    def _label_address(key, symbol_table):
+        offset = 0
+        for sign in "+-":
+            if sign in key:
+                key, number = key.split(sign, 1)
+                offset = int(number, 0)
+                if sign == "-":
+                    offset = -offset
+                break
+        if key not in symbol_table:
+            raise ValueError("unknown label in profile: " + key)
+        return symbol_table[key] + offset
@@ -1,18 +1,41 @@
 import sys
+import StringIO
 import instructions.instruction_table as instruction_table
+import stats
+from stats import Stats, NullStats
 from memory.mem_word import Word
 from memory.mem_string import String
 from memory.mem_double import Double
 from memory.mem_float import Float
+from memory.layout import Layout
 import dlx_parser.grammar as grammar
+from dlx_parser.context import ParseContext
 from dlx_parser.exception import ParseException
 from instructions.j_type import JType
 from instructions.r_type import RType
 from instructions.i_type import IType
+from instructions.instruction import Instruction
 
+# Assembler version, part of the key for cached output
+version = "1.2"
 
-# The main assembler application.
+
+# The main assembler application. Each assembler holds its own parse context
+# and program state, so separate assemblers may run concurrently in threads.
 class Assembler(object):
+    # Stats counter for each instruction type.
+    type_counters = {
+        instruction_table.InstructionType.R: stats.r_type,
+        instruction_table.InstructionType.I: stats.i_type,
+        instruction_table.InstructionType.J: stats.j_type
+    }
+    # Low address bits zeroed by auto alignment for each data directive.
+    data_alignment = {
+        grammar.d_double: 3,
+        grammar.d_float: 2,
+        grammar.d_word: 2
+    }
+
     # Input:
     #   options - The program options.
     def __init__(self, options):
@@ -23,13 +46,92 @@ class Assembler(object):
         self.no_output = options["no_output"]
         self.in_file = options["in_file"]
         self.out_file = options["out_file"]
-        # internal state
-        self.error = False
-        self.line_no = 0
-        self.address = 0
-        self.symbol_table = {}
-        self.program = {}
-        self.unresolved_instructions = []
+        # optional features import their modules on demand to keep start up
+        # fast (see bench_startup.py)
+        self.cache = None
+        if options.get("cache_dir"):
+            import cache
+            self.cache = cache.OutputCache(
+                options["cache_dir"],
+                options.get("cache_size") or cache.default_max_size,
+                version
+            )
+        # "human", "json", or None
+        self.stats_format = options.get("stats")
+        # called with the stats at the end of each run
+        self.stats_callback = options.get("stats_callback")
+        # trace file written at the end of each run
+        self.trace_file = options.get("trace")
+        # tracer shared with the caller, which writes it
+        self.tracer = options.get("tracer")
+        if self.tracer is None and self.trace_file:
+            from trace_events import Tracer
+            self.tracer = Tracer()
+        # number of lines in each parse slice of the trace, 0 for none
+        self.trace_slice = options.get("trace_slice") or 0
+        # report pipeline hazards after assembly
+        self.hazards = options.get("hazards", False)
+        # pipeline model file for the hazard report and optimization passes
+        self.pipeline_file = options.get("pipeline")
+        # optimization passes, run in this order
+        self.strength = options.get("strength", False)
+        # rewrite database from superopt.py
+        self.rewrites_file = options.get("rewrites")
+        self.peephole = options.get("peephole", False)
+        self.dead_code = options.get("dead_code", False)
+        # labels where execution may start, default the first instruction
+        self.entries = options.get("entries") or []
+        # branch profile for basic block layout
+        self.profile_file = options.get("profile")
+        self.schedule = options.get("schedule", False)
+        self.delay_slots = options.get("delay_slots", False)
+        # insert the nops a pipeline without interlocks needs
+        self.nops = options.get("nops", False)
+        # binary memory images written after assembly, as a raw file with
+        # holes skipped, as a list of segments, and as a shared image
+        self.raw_file = options.get("raw")
+        self.segments_file = options.get("segments")
+        self.publish_file = options.get("publish")
+        # run the program after assembly, reporting cache misses
+        self.simulate_caches = options.get("simulate_caches", False)
+        # cache configuration file for the simulation
+        self.cache_config_file = options.get("cache_config")
+        # run the program after assembly, reporting branch mispredictions
+        self.simulate_branches = options.get("simulate_branches", False)
+        # branch predictor descriptions, default all predictors
+        self.predictors = options.get("predictors")
+        # run the program after assembly, reporting the hot lines
+        self.hot_lines = options.get("hot_lines", False)
+        # files written with the profiled source listing and the folded call
+        # stacks of the run
+        self.annotate_file = options.get("annotate")
+        self.folded_file = options.get("folded_stacks")
+        # file the execution trace of the run is written to
+        self.exec_trace_file = options.get("exec_trace")
+        # file the branch profile of the run is written to, for --profile
+        self.record_profile_file = options.get("record_profile")
+        # labels simulations stop at, and snapshot files of the machine
+        # state written where they stop and restored before they start
+        self.breakpoints = options.get("breakpoints") or []
+        self.snapshot_file = options.get("snapshot")
+        self.restore_file = options.get("restore")
+        # most instructions simulated
+        self.max_steps = options.get("max_steps")
+        # simulate memory mapped devices, with the disk backed by a file
+        self.simulate_devices = options.get("devices", False)
+        self.disk_file = options.get("disk")
+        # give the program host files and the console through traps
+        self.host_io = options.get("host_io", False)
+        # align data directives to the size of their values
+        self.auto_align = options.get("auto_align", False)
+        # reorder data objects to reduce padding, which needs auto alignment
+        self.pack_data = options.get("pack_data", False)
+        if self.pack_data:
+            self.auto_align = True
+        # cache keys cover the source alone, so optimized output isn't cached
+        if self._optimizing():
+            self.cache = None
+        self._reset()
         if self.verbose:
             print "Input file:", self.in_file
             print "Output file:", self.out_file
@@ -41,35 +143,178 @@ class Assembler(object):
     #   n/a
     def run(self):
         instruction_table.load()
-        self.error = False
-        with open(self.in_file, "r") as f:
-            for line in f:
-                try:
-                    data = grammar.parser.parse(line, tracking=True)
-                    self.line_no = data[grammar.line_no]
-                    if grammar.label in data:
-                        self._add_label(data[grammar.label])
-                        if not grammar.directive in data and \
-                           not grammar.instruction in data:
-                            data[grammar.instruction] = {
-                                grammar.i_opcode: "nop"
-                            }
-                    if grammar.directive in data:
-                        self._handle_directive(data[grammar.directive])
-                    elif grammar.instruction in data:
-                        self._handle_instruction(data[grammar.instruction])
-                except ParseException as e:
-                    print e.message
-                    self.error = True
-
-        self._resolve_symbols()
+        self._reset()
+        with self.stats.timer(stats.total, self.in_file):
+            self._assemble()
+        if self.trace_file:
+            self.tracer.write(self.trace_file)
+        if self.stats_format == "human":
+            print self.stats.report()
+        elif self.stats_format == "json":
+            print self.stats.to_json()
+        if self.stats_callback is not None:
+            self.stats_callback(self.stats)
+
+    # Assembles the input file and saves the output.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _assemble(self):
+        with self.stats.timer(stats.read):
+            with open(self.in_file, "r") as f:
+                source = f.read()
+
+        cache_key = None
+        if self.cache is not None and not self.no_output:
+            with self.stats.timer(stats.cache):
+                cache_key = self.cache.key(source)
+                # the symbol table dump and the stages after assembly
+                # require a full assembly
+                output = None
+                if not self.dump and not self._post_assembly():
+                    output = self.cache.get(cache_key)
+            if output is not None:
+                output, warnings = output
+                self.stats.count(stats.cache_hits)
+                if self.verbose:
+                    print "Using cached output", cache_key
+                for warning in warnings:
+                    print warning
+                with self.stats.timer(stats.write):
+                    self._save_output(output)
+                return
+            self.stats.count(stats.cache_misses)
+
+        trace_slice = self.trace_slice if self.tracer is not None else 0
+        slice_start = stats.clock()
+        for n, line in enumerate(source.splitlines(True)):
+            if trace_slice and n and n % trace_slice == 0:
+                slice_start = self._trace_lines(n, slice_start)
+            self.stats.count(stats.lines)
+            try:
+                with self.stats.timer(stats.parse):
+                    data = self.context.parse(line)
+                self.line_no = data[grammar.line_no]
+                # data is aligned before its label
+                if self.auto_align and grammar.directive in data:
+                    self._align_data(data[grammar.directive])
+                if grammar.label in data:
+                    self._add_label(data[grammar.label])
+                    if not grammar.directive in data and \
+                       not grammar.instruction in data:
+                        data[grammar.instruction] = {
+                            grammar.i_opcode: "nop"
+                        }
+                if grammar.directive in data:
+                    self._handle_directive(data[grammar.directive])
+                elif grammar.instruction in data:
+                    self._handle_instruction(data[grammar.instruction])
+            except ParseException as e:
+                print e.message
+                self.error = True
+        if self.tracer is not None and self.stats.counters[stats.lines]:
+            self._trace_lines(self.stats.counters[stats.lines], slice_start)
+        # the parse timer includes the time spent in the lexer
+        self.stats.add_time(stats.lex, self.context.lex_time)
+        self.stats.add_time(stats.parse, -self.context.lex_time)
+
+        if not self.error:
+            self._optimize()
+        with self.stats.timer(stats.resolve):
+            self._resolve_symbols()
+        if self.hazards and not self.error:
+            self._report_hazards()
+        if not self.error and (self.raw_file or self.segments_file or
+                               self.publish_file):
+            self._write_images()
+        if self._simulating() and not self.error:
+            self._simulate(source)
         if not self.error and not self.no_output:
-            if self.console:
-                print "Assembled Output:"
-                self._write_output(sys.stdout)
-            else:
-                with open(self.out_file, "w") as f:
-                    self._write_output(f)
+            with self.stats.timer(stats.write):
+                buf = StringIO.StringIO()
+                self._write_output(buf)
+                output = buf.getvalue()
+                if cache_key is not None:
+                    try:
+                        self.cache.put(cache_key, output,
+                                       self.context.warnings)
+                    except (IOError, OSError) as e:
+                        print "WARNING: unable to write cache entry:", e
+                self._save_output(output)
+
+    # Returns true if stages that need the assembled program run after
+    # assembly, so cached output can't be used.
+    # Input:
+    #   n/a
+    # Returns:
+    #   bool
+    def _post_assembly(self):
+        return self.hazards or self._simulating() or \
+            bool(self.raw_file or self.segments_file or self.publish_file)
+
+    # Adds a trace span for the slice of lines ending before line n. Without
+    # a slice size all lines are in a single slice.
+    # Input:
+    #   n - The number of lines processed.
+    #   start - The start time of the slice.
+    # Returns:
+    #   The start time of the next slice.
+    def _trace_lines(self, n, start):
+        end = stats.clock()
+        first = 1
+        if self.trace_slice:
+            first = ((n - 1) // self.trace_slice) * self.trace_slice + 1
+        self.tracer.complete(
+            "lines {0}-{1}".format(first, n),
+            start,
+            end,
+            "parse"
+        )
+        return end
+
+    # Saves the assembled output to the console or the output file.
+    # Input:
+    #   output - The assembled output.
+    # Returns:
+    #   n/a
+    def _save_output(self, output):
+        if self.console:
+            print "Assembled Output:"
+            sys.stdout.write(output)
+        else:
+            with open(self.out_file, "w") as f:
+                f.write(output)
+
+    # Prints a warning about the source, recording it with the warnings of the
+    # parse context so it is stored with cached output.
+    # Input:
+    #   message - The warning.
+    # Returns:
+    #   n/a
+    def _warn(self, message):
+        print message
+        self.context.warnings.append(message)
+
+    # Resets the internal state so that the assembler can be run again.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _reset(self):
+        if self.stats_format or self.stats_callback or self.tracer:
+            self.stats = Stats(self.tracer)
+            self.context = ParseContext(stats.clock)
+        else:
+            self.stats = NullStats()
+            self.context = ParseContext()
+        self.error = False
+        self.line_no = 0
+        self.address = 0
+        self.symbol_table = {}
+        self.program = {}
+        self.layout = Layout()
+        self.unresolved_instructions = []
 
     # Writes the assembled program out to a file.
     # Input:
@@ -92,15 +337,19 @@ class Assembler(object):
     # Returns:
     #   n/a
     def _handle_directive(self, directive):
+        self.stats.count(stats.directives)
         if grammar.d_align in directive:
+            self.layout.add_align(directive[grammar.d_align])
             self._align_address(directive[grammar.d_align])
         elif grammar.d_address in directive:
+            self.layout.add_origin(directive[grammar.d_address])
             self._set_address(directive[grammar.d_address])
         elif grammar.d_double in directive:
             self._store_double(directive[grammar.d_double])
         elif grammar.d_float in directive:
             self._store_float(directive[grammar.d_float])
         elif grammar.d_space in directive:
+            self.layout.add_space(directive[grammar.d_space])
             self._set_address(self.address + directive[grammar.d_space])
         elif grammar.d_string in directive:
             self._store_string(directive[grammar.d_string])
@@ -126,14 +375,19 @@ class Assembler(object):
             return
 
         i = None
-        if type_id == instruction_table.InstructionType.J:
-            i = JType(self.address, instr)
-        elif type_id == instruction_table.InstructionType.R:
-            i = RType(self.address, instr)
-        elif type_id == instruction_table.InstructionType.I:
-            i = IType(self.address, instr)
+        with self.stats.timer(stats.encode):
+            if type_id == instruction_table.InstructionType.J:
+                i = JType(self.address, instr)
+            elif type_id == instruction_table.InstructionType.R:
+                i = RType(self.address, instr)
+            elif type_id == instruction_table.InstructionType.I:
+                i = IType(self.address, instr)
+        i.line_no = self.line_no
+        self.stats.count(stats.instructions)
+        self.stats.count(self.type_counters[type_id])
 
         self.program[self.address] = i
+        self.layout.add_memory(i)
         self.address += i.size
         if grammar.i_label in instr:
             self.unresolved_instructions.append(i)
@@ -144,8 +398,10 @@ class Assembler(object):
     # Returns:
     #   n/a
     def _add_label(self, label):
+        self.stats.count(stats.labels)
         if not label in self.symbol_table:
             self.symbol_table[label] = self.address
+            self.layout.add_label(label)
             if self.verbose:
                 print "New label {0}: 0x{1:08x}".format(label, self.address)
         else:
@@ -172,6 +428,520 @@ class Assembler(object):
                 print "ERROR: Unresolved label \"{0}\"".format(e.args[0])
                 self.error = True
 
+    # Reassigns the addresses of the program and its labels after the layout
+    # has been edited.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _relayout(self):
+        self.program, self.symbol_table = self.layout.assign()
+        self.unresolved_instructions = [
+            self.program[address] for address in sorted(self.program)
+            if isinstance(self.program[address], Instruction) and
+            grammar.i_label in self.program[address].source
+        ]
+
+    # Returns true if any optimization pass or auto alignment is enabled.
+    # Input:
+    #   n/a
+    # Returns:
+    #   bool
+    def _optimizing(self):
+        return bool(
+            self.strength or self.rewrites_file or self.peephole or
+            self.dead_code or self.profile_file or self.schedule or
+            self.delay_slots or self.nops or self.auto_align
+        )
+
+    # Runs the enabled optimization passes over the program.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _optimize(self):
+        # the profile is keyed by the addresses of the unoptimized program
+        if self.profile_file:
+            self._layout_blocks()
+        if self.strength:
+            self._strength_reduce()
+        if self.rewrites_file:
+            self._apply_rewrites()
+        if self.peephole:
+            self._peephole()
+        if self.dead_code:
+            self._eliminate_dead_code()
+        if self.pack_data:
+            self._pack_data()
+        if self.schedule:
+            self._schedule()
+        if self.delay_slots:
+            self._fill_delay_slots()
+        if self.nops:
+            self._insert_nops()
+
+    # Replaces integer multiplies and divides by constants with shifts and
+    # adds, reporting the number replaced.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _strength_reduce(self):
+        from optimizer import strength
+        counts = strength.reduce(
+            self.program,
+            self.symbol_table,
+            self.layout
+        )
+        self._relayout()
+        print "Strength reduced {0} multiplies and {1} divides".format(
+            counts[strength.multiplies],
+            counts[strength.divides]
+        )
+
+    # Replaces windows of instructions with the cheaper sequences found by the
+    # superoptimizer, reporting the windows replaced.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _apply_rewrites(self):
+        from optimizer import rewrites
+        database = rewrites.RewriteDatabase(self.rewrites_file)
+        try:
+            database.load()
+        except (IOError, ValueError) as e:
+            print "ERROR: invalid rewrite database:", e
+            self.error = True
+            return
+        counts = rewrites.apply(
+            self.program,
+            self.symbol_table,
+            self.layout,
+            database
+        )
+        self._relayout()
+        print "Rewrote {0} windows, saving {1} bytes".format(
+            counts[rewrites.rewritten],
+            counts[rewrites.bytes_saved]
+        )
+
+    # Removes redundant instructions and folds constants and jump chains,
+    # reporting the rewrites.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _peephole(self):
+        from optimizer import peephole
+        before = self._code_size()
+        counts = peephole.optimize(
+            self.program,
+            self.symbol_table,
+            self.layout
+        )
+        self._relayout()
+        print "Peephole: removed {0} bytes, {1} moves, {2} nops, " \
+              "{3} constants folded, {4} jump chains, {5} writes to r0".format(
+                  before - self._code_size(),
+                  counts[peephole.moves],
+                  counts[peephole.nops],
+                  counts[peephole.folds],
+                  counts[peephole.chains],
+                  counts[peephole.zero_writes]
+              )
+
+    # Removes code unreachable from the entry points and register writes that
+    # are never read, reporting the bytes removed after each label.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _eliminate_dead_code(self):
+        from analysis import cfg
+        from optimizer import dead_code
+        if cfg.numeric_targets(self.program):
+            print "WARNING: dead code not removed, the program branches to " \
+                  "numeric addresses"
+            return
+        entries = []
+        for name in self.entries:
+            if name not in self.symbol_table:
+                print "ERROR: unknown entry point \"{0}\"".format(name)
+                self.error = True
+                return
+            entries.append(self.symbol_table[name])
+        code = [a for a in sorted(self.program)
+                if isinstance(self.program[a], Instruction)]
+        if not entries and code:
+            entries.append(code[0])
+        counts, removed = dead_code.eliminate(
+            self.program,
+            self.symbol_table,
+            self.layout,
+            entries
+        )
+        self._relayout()
+        print "Dead code: removed {0} bytes of unreachable code, {1} bytes " \
+              "of dead writes".format(
+                  counts[dead_code.unreachable],
+                  counts[dead_code.dead_stores]
+              )
+        for name in sorted(removed):
+            print "{0:>15} : {1} bytes".format(name, removed[name])
+
+    # Reorders the data objects to reduce the padding between them, reporting
+    # the padding before and after.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _pack_data(self):
+        from optimizer import data_layout
+        before = self.layout.padding()
+        moved = data_layout.pack(self.layout)
+        self._relayout()
+        print "Data layout: moved {0} objects, {1} bytes of padding " \
+              "before, {2} after".format(
+                  moved,
+                  before,
+                  self.layout.padding()
+              )
+
+    # Returns the number of bytes of instructions in the program.
+    # Input:
+    #   n/a
+    # Returns:
+    #   int
+    def _code_size(self):
+        return sum(
+            mem.size for mem in self.program.itervalues()
+            if isinstance(mem, Instruction)
+        )
+
+    # Reorders the basic blocks so that the frequent successor of each
+    # profiled branch falls through, reporting the changes and the profiled
+    # taken branches and their estimated cycles under the pipeline model
+    # before and after.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _layout_blocks(self):
+        from analysis.profile import BranchProfile
+        from optimizer import block_layout
+        model = self._pipeline_model()
+        if model is None:
+            return
+        profile = BranchProfile()
+        try:
+            profile.load(self.profile_file)
+            counts = profile.resolve(self.symbol_table)
+        except (IOError, ValueError) as e:
+            print "ERROR: invalid profile:", e
+            self.error = True
+            return
+        result = block_layout.reorder(
+            self.program,
+            self.symbol_table,
+            self.layout,
+            counts,
+            model.branch_penalty()
+        )
+        self._relayout()
+        print "Block layout: moved {0} blocks, inverted {1} branches, " \
+              "inserted {2} jumps, taken branches and jumps {3} before, " \
+              "{4} after, branch cycles {5} before, {6} after".format(
+                  result[block_layout.moved],
+                  result[block_layout.inverted],
+                  result[block_layout.jumps],
+                  result[block_layout.taken_before],
+                  result[block_layout.taken_after],
+                  result[block_layout.cycles_before],
+                  result[block_layout.cycles_after]
+              )
+
+    # Reorders the instructions of each basic block to reduce pipeline
+    # stalls, reporting the stalls before and after.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _schedule(self):
+        from analysis import cfg, hazards
+        from optimizer.schedule import schedule
+        model = self._pipeline_model()
+        if model is None:
+            return
+        before = hazards.analyze(
+            cfg.build_blocks(self.program, self.symbol_table),
+            model
+        ).stalls()
+        schedule(self.program, self.symbol_table, self.layout, model)
+        self._relayout()
+        after = hazards.analyze(
+            cfg.build_blocks(self.program, self.symbol_table),
+            model
+        ).stalls()
+        print "Scheduled instructions: {0} stalls before, {1} after".format(
+            before,
+            after
+        )
+
+    # Fills the delay slot after every branch and jump, reporting how the
+    # slots were filled.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _fill_delay_slots(self):
+        from analysis import cfg
+        from optimizer import delay_slots
+        if cfg.numeric_targets(self.program):
+            # without their slots the branches would run the wrong code
+            print "ERROR: unable to fill delay slots, the program branches " \
+                  "to numeric addresses"
+            self.error = True
+            return
+        counts = delay_slots.fill_delay_slots(
+            self.program,
+            self.symbol_table,
+            self.layout
+        )
+        self._relayout()
+        print "Filled delay slots: {0} from before, {1} from target, " \
+              "{2} nop".format(
+                  counts[delay_slots.from_before],
+                  counts[delay_slots.from_target],
+                  counts[delay_slots.with_nop]
+              )
+
+    # Inserts the nops needed between dependent instructions on a pipeline
+    # without interlocks, reporting the nops for each kind of hazard.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _insert_nops(self):
+        from analysis import cfg, hazards
+        from optimizer import interlock
+        if cfg.numeric_targets(self.program):
+            print "WARNING: nops not inserted, the program branches to " \
+                  "numeric addresses"
+            return
+        model = self._pipeline_model()
+        if model is None:
+            return
+        counts = interlock.insert_nops(
+            self.program,
+            self.symbol_table,
+            self.layout,
+            model,
+            self.delay_slots
+        )
+        self._relayout()
+        print "Inserted {0} nops: {1} {2}, {3} {4}, {5} {6}, {7} {8}".format(
+            sum(counts.itervalues()),
+            counts[hazards.raw_hazard], hazards.raw_hazard,
+            counts[hazards.load_use_hazard], hazards.load_use_hazard,
+            counts[hazards.waw_hazard], hazards.waw_hazard,
+            counts[hazards.structural_hazard], hazards.structural_hazard
+        )
+
+    # Returns the pipeline model used by the analysis passes.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The pipeline model, or None if the model file couldn't be loaded.
+    def _pipeline_model(self):
+        from analysis.pipeline import PipelineModel
+        model = PipelineModel()
+        if self.pipeline_file:
+            try:
+                model.load(self.pipeline_file)
+            except (IOError, ValueError) as e:
+                print "ERROR: invalid pipeline model:", e
+                self.error = True
+                return None
+        return model
+
+    # Prints the estimated pipeline stalls of the program.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _report_hazards(self):
+        from analysis import cfg, hazards
+        model = self._pipeline_model()
+        if model is None:
+            return
+        blocks = cfg.build_blocks(self.program, self.symbol_table)
+        print hazards.analyze(blocks, model).report()
+
+    # Writes the binary memory images of the program.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _write_images(self):
+        from simulator import image
+        program = image.from_program(self.program, self.symbol_table)
+        try:
+            if self.raw_file:
+                image.write_raw(program, self.raw_file)
+            if self.segments_file:
+                image.write_segments(program, self.segments_file)
+            if self.publish_file:
+                from simulator import shared
+                shared.publish(program, self.publish_file)
+        except IOError as e:
+            print "ERROR: unable to write memory image:", e
+            self.error = True
+
+    # Returns true if the program is run after assembly. Breakpoints, a
+    # restored snapshot, or a step limit alone run the program to report
+    # where it stops.
+    # Input:
+    #   n/a
+    # Returns:
+    #   bool
+    def _simulating(self):
+        return self.simulate_caches or self.simulate_branches or \
+            self.hot_lines or bool(self.annotate_file) or \
+            bool(self.folded_file) or bool(self.exec_trace_file) or \
+            bool(self.record_profile_file) or bool(self.snapshot_file) or \
+            self.simulate_devices or self.host_io or \
+            bool(self.restore_file) or bool(self.breakpoints) or \
+            bool(self.max_steps)
+
+    # Runs the program and prints the reports of the simulations requested.
+    # Execution starts at the first entry label, or the first instruction.
+    # Input:
+    #   source - The source text, for the profiled listing.
+    # Returns:
+    #   n/a
+    def _simulate(self, source):
+        if self.delay_slots:
+            # the machine would run the slot filled code without delay slots
+            print "ERROR: unable to simulate: the simulator doesn't model " \
+                "branch delay slots (--delay_slots)"
+            self.error = True
+            return
+        if self.record_profile_file and self._optimizing():
+            # profiles are keyed by the addresses of the unoptimized program
+            print "ERROR: unable to record a profile of an optimized program"
+            self.error = True
+            return
+        from simulator import image, machine
+        program = image.from_program(self.program, self.symbol_table)
+        entry = None
+        if self.entries:
+            entry = self.symbol_table.get(self.entries[0])
+        simulations = []
+        profiler = None
+        recorder = None
+        branch_profile = None
+        devices = None
+        host = None
+        breakpoints = set()
+        for label in self.breakpoints:
+            if label not in self.symbol_table:
+                print "ERROR: Unknown breakpoint \"{0}\"".format(label)
+                self.error = True
+                return
+            breakpoints.add(self.symbol_table[label])
+        try:
+            if self.simulate_caches:
+                from simulator.caches import CacheConfig, CacheSimulation
+                config = CacheConfig()
+                if self.cache_config_file:
+                    config.load(self.cache_config_file)
+                simulations.append(CacheSimulation(config))
+            if self.simulate_branches:
+                from simulator import predictors
+                simulations.append(predictors.BranchSimulation([
+                    predictors.create(p)
+                    for p in self.predictors or predictors.names
+                ]))
+            if self.hot_lines or self.annotate_file or self.folded_file:
+                from simulator.profiler import Profiler
+                model = self._pipeline_model()
+                if model is None:
+                    return
+                profiler = Profiler(self.program, model)
+                simulations.append(profiler)
+            m = machine.Machine(program, entry=entry)
+            if self.simulate_devices:
+                from simulator.devices import DeviceSimulation
+                # attached before a restore, which restores their state
+                devices = DeviceSimulation(self.disk_file)
+                devices.attach(m)
+            if self.host_io:
+                from simulator.hostio import HostIO
+                host = HostIO()
+                host.attach(m)
+            if self.restore_file:
+                from simulator import snapshot
+                snapshot.restore(m, self.restore_file)
+            if self.exec_trace_file:
+                from simulator import trace
+                recorder = trace.TraceRecorder(
+                    trace.TraceWriter(open(self.exec_trace_file, "wb"))
+                )
+                simulations.append(recorder)
+        except (IOError, ValueError) as e:
+            print "ERROR: unable to simulate:", e
+            self.error = True
+            return
+        for simulation in simulations:
+            simulation.attach(m)
+        if self.record_profile_file:
+            from analysis.profile import BranchProfile
+            branch_profile = BranchProfile()
+            branch_profile.attach(m)
+        m.run(self.max_steps or machine.default_max_steps, breakpoints)
+        if m.state == machine.halted:
+            print "Simulated {0} instructions".format(m.executed)
+        elif m.pc in breakpoints:
+            print "Simulation stopped at {0} after {1} instructions".format(
+                program.label(m.pc),
+                m.executed
+            )
+        elif m.state == machine.faulted:
+            print "WARNING: simulation stopped by a fault ({0}) after {1} " \
+                "instructions".format(m.fault, m.executed)
+        else:
+            print "WARNING: simulation stopped after {0} instructions " \
+                "without halting".format(m.executed)
+        for simulation in simulations:
+            if simulation is profiler and not self.hot_lines or \
+               simulation is recorder:
+                continue
+            print simulation.report(program)
+        if devices is not None:
+            print devices.report(program)
+        if host is not None:
+            print host.report(program)
+        try:
+            if host is not None:
+                host.close_all()
+            if self.snapshot_file:
+                from simulator import snapshot
+                snapshot.save(m, self.snapshot_file)
+            if recorder is not None:
+                recorder.close()
+            if branch_profile is not None:
+                branch_profile.save(self.record_profile_file)
+            if self.annotate_file:
+                with open(self.annotate_file, "w") as f:
+                    f.write(profiler.annotate(program, source))
+            if self.folded_file:
+                with open(self.folded_file, "w") as f:
+                    f.write(profiler.folded())
+        except IOError as e:
+            print "ERROR: unable to write simulation output:", e
+            self.error = True
+
     # Aligns the address so that the lower n bits are 0.
     # Input:
     #   n - Number of lower order bits to be zeroed.
@@ -188,6 +958,18 @@ class Assembler(object):
                 mask + 1
             )
 
+    # Aligns the address for the values of a data directive, so that each
+    # value is at a multiple of its size.
+    # Input:
+    #   directive - The directive (see dlx_parser.grammar).
+    # Returns:
+    #   n/a
+    def _align_data(self, directive):
+        for kind, n in self.data_alignment.iteritems():
+            if kind in directive:
+                self.layout.add_align(n)
+                self._align_address(n)
+
     # Sets the current address of the assembler.
     # Input:
     #   address - The new address.
@@ -207,6 +989,9 @@ class Assembler(object):
         for value in values:
             dbl = Double(self.address, value)
             self.program[self.address] = dbl
+            self.layout.add_memory(dbl)
+            dbl.line_no = self.line_no
+            self.stats.count(stats.data_items)
             self.address += dbl.size
             if self.verbose:
                 print "Storing double {0} at 0x{1:08x}".format(
@@ -214,7 +999,8 @@ class Assembler(object):
                     dbl.address
                 )
             if dbl.address % dbl.size is not 0:
-                print "WARNING line {0}: unaligned double".format(self.line_no)
+                self._warn("WARNING line {0}: unaligned double".format(
+                    self.line_no))
 
     # Stores a sequence of floats in the program.
     # Input:
@@ -225,6 +1011,9 @@ class Assembler(object):
         for value in values:
             flt = Float(self.address, value)
             self.program[self.address] = flt
+            self.layout.add_memory(flt)
+            flt.line_no = self.line_no
+            self.stats.count(stats.data_items)
             self.address += flt.size
             if self.verbose:
                 print "Storing float {0} at 0x{1:08x}".format(
@@ -232,7 +1021,8 @@ class Assembler(object):
                     flt.address
                 )
             if flt.address % flt.size is not 0:
-                print "WARNING line {0}: unaligned float".format(self.line_no)
+                self._warn("WARNING line {0}: unaligned float".format(
+                    self.line_no))
 
     # Stores a sequence of strings in the program.
     # Input:
@@ -243,6 +1033,9 @@ class Assembler(object):
         for value in values:
             string = String(self.address, value)
             self.program[self.address] = string
+            self.layout.add_memory(string)
+            string.line_no = self.line_no
+            self.stats.count(stats.data_items)
             self.address += string.size
             if self.verbose:
                 print "Storing string \"{0}\" at 0x{1:08x}".format(
@@ -259,6 +1052,9 @@ class Assembler(object):
         for value in values:
             word = Word(self.address, value)
             self.program[self.address] = word
+            self.layout.add_memory(word)
+            word.line_no = self.line_no
+            self.stats.count(stats.data_items)
             self.address += word.size
             if self.verbose:
                 print "Storing word {0} (0x{1}) at 0x{2:08x}".format(
@@ -267,4 +1063,5 @@ class Assembler(object):
                     word.address
                 )
             if word.address % word.size is not 0:
-                print "WARNING line {0}: unaligned word".format(self.line_no)
+                self._warn("WARNING line {0}: unaligned word".format(
+                    self.line_no))
@@ -0,0 +1,137 @@
+import sys
+import getopt
+import os
+import subprocess
+import time
+
+# Source run by the child process to time imports. Every import that loads a
+# new module is timed, in the style of python -X importtime.
+import_timer = r"""
+import sys
+import time
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+real_import = builtins.__import__
+results = []
+stack = [0.0]
+
+
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return real_import(name, *args, **kwargs)
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        cumulative = time.time() - start
+        children = stack.pop()
+        stack[-1] += cumulative
+        results.append((len(stack) - 1, name, cumulative - children,
+                        cumulative))
+
+builtins.__import__ = timed_import
+sys.path.insert(0, sys.argv[1])
+import dlxas
+builtins.__import__ = real_import
+sys.stderr.write("import time: self [us] | cumulative | imported package\n")
+for depth, name, own, cumulative in results:
+    sys.stderr.write("import time: {0:9d} | {1:10d} | {2}{3}\n".format(
+        int(own * 1e6), int(cumulative * 1e6), "  " * depth, name
+    ))
+"""
+
+# Default number of runs used for cold start timings
+default_runs = 10
+# Input assembled for cold start timings
+trivial_input = os.path.join("Inputs", "nop.dlx")
+
+
+# Prints help information to console
+# Input:
+#   n/a
+# Returns:
+#   n/a
+def print_help():
+    print "bench_startup.py [options]"
+    print "Times the import of the assembler modules and the cold start of " \
+          "a trivial\nassembly."
+    print "-h\n" \
+          "--help\n" \
+          "\tPrint this help text."
+    print "-r <n>\n" \
+          "--runs=<n>\n" \
+          "\tNumber of runs for each cold start timing (default {0}).".format(
+              default_runs)
+    print "-z <file>\n" \
+          "--zipapp=<file>\n" \
+          "\tAlso time a zipapp built by build_zipapp.py."
+
+
+# Returns the fastest wall clock time of running a command.
+# Input:
+#   cmd - The command line.
+#   runs - The number of runs.
+# Returns:
+#   The time in seconds.
+def time_command(cmd, runs):
+    best = None
+    with open(os.devnull, "w") as null:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(cmd, stdout=null)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+# Main function
+# Input:
+#   argv - Command line args
+# Returns:
+#   n/a
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hr:z:", ["help", "runs=", "zipapp="])
+    except getopt.GetoptError:
+        print_help()
+        return
+    runs = default_runs
+    zipapp = None
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+            return
+        elif opt in ("-r", "--runs"):
+            runs = int(arg)
+        elif opt in ("-z", "--zipapp"):
+            zipapp = arg
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(root)
+    # the first run may compile bytecode and generate parse tables
+    subprocess.check_call([sys.executable, "dlxas.py", "-n", trivial_input])
+    subprocess.check_call([sys.executable, "-c", import_timer, root])
+
+    print "Cold start, best of {0} runs:".format(runs)
+    timings = [
+        ("interpreter", [sys.executable, "-c", "pass"]),
+        ("dlxas.py", [sys.executable, "dlxas.py", "-n", trivial_input])
+    ]
+    if zipapp is not None:
+        timings.append(
+            (zipapp, [sys.executable, zipapp, "-n", trivial_input])
+        )
+    for name, cmd in timings:
+        print "{0:>15} : {1:8.1f} ms".format(
+            name,
+            time_command(cmd, runs) * 1000
+        )
+
+# Python main function call
+if __name__ == "__main__":
+    main(sys.argv[1:])
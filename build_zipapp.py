@@ -0,0 +1,142 @@
+import sys
+import getopt
+import imp
+import marshal
+import os
+import struct
+import time
+import zipfile
+
+# Default output file name
+default_out_file = "dlxas.pyz"
+# Top level modules needed at run time
+modules = ["dlxas", "assembler", "cache", "stats", "trace_events"]
+# Packages needed at run time
+packages = ["dlx_parser", "instructions", "memory", "analysis", "optimizer",
+            "simulator"]
+# Modules in the packages that are never imported by the assembler, including
+# the batch simulator, which needs numpy
+excluded = [
+    os.path.join("dlx_parser", "ply", "cpp.py"),
+    os.path.join("dlx_parser", "ply", "ctokens.py"),
+    os.path.join("simulator", "batch.py")
+]
+# Instruction table files bundled into the zipapp
+table_files = ["Rtypes", "Itypes", "Jtypes"]
+# Main module of the zipapp
+main_source = """import sys
+import dlxas
+dlxas.main(sys.argv[1:])
+"""
+
+
+# Prints help information to console
+# Input:
+#   n/a
+# Returns:
+#   n/a
+def print_help():
+    print "build_zipapp.py [options]"
+    print "Builds a single file zipapp of the assembler, containing " \
+          "bytecode compiled\nfor this python version, the parse tables, " \
+          "and the instruction\ntables. Run it with: python dlxas.pyz " \
+          "[options] [file]"
+    print "-h\n" \
+          "--help\n" \
+          "\tPrint this help text."
+    print "-o <file>\n" \
+          "--output=<file>\n" \
+          "\tOverride the default output file name ({0}).".format(
+              default_out_file)
+
+
+# Compiles python source to the contents of a .pyc file.
+# Input:
+#   source - The python source.
+#   name - The file name recorded in the bytecode.
+# Returns:
+#   The .pyc contents.
+def compile_source(source, name):
+    code = compile(source, name, "exec")
+    return imp.get_magic() + struct.pack("<I", int(time.time())) + \
+        marshal.dumps(code)
+
+
+# Adds python source to the zipapp as bytecode.
+# Input:
+#   zf - The zip file.
+#   source - The python source.
+#   name - The name of the source file in the zipapp.
+# Returns:
+#   n/a
+def add_source(zf, source, name):
+    zf.writestr(name[:-len(".py")] + ".pyc", compile_source(source, name))
+
+
+# Adds a python file to the zipapp as bytecode.
+# Input:
+#   zf - The zip file.
+#   name - The file name, relative to the repository root.
+# Returns:
+#   n/a
+def add_file(zf, name):
+    with open(name, "r") as f:
+        add_source(zf, f.read(), name.replace(os.sep, "/"))
+
+
+# Builds the zipapp.
+# Input:
+#   out_file - The output file name.
+# Returns:
+#   n/a
+def build(out_file):
+    # generate the parse tables if they are missing or out of date
+    import dlx_parser.grammar
+
+    with zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as zf:
+        add_source(zf, main_source, "__main__.py")
+        for module in modules:
+            add_file(zf, module + ".py")
+        for package in packages:
+            for directory, _, files in os.walk(package):
+                for name in sorted(files):
+                    name = os.path.join(directory, name)
+                    if name.endswith(".py") and name not in excluded:
+                        add_file(zf, name)
+        tables = {}
+        for name in table_files:
+            with open(name, "r") as f:
+                tables[name] = f.read()
+        add_source(
+            zf,
+            "tables = {0!r}\n".format(tables),
+            "instructions/bundled_tables.py"
+        )
+
+
+# Main function
+# Input:
+#   argv - Command line args
+# Returns:
+#   n/a
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "ho:", ["help", "output="])
+    except getopt.GetoptError:
+        print_help()
+        return
+    out_file = default_out_file
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+            return
+        elif opt in ("-o", "--output"):
+            out_file = arg
+    out_file = os.path.abspath(out_file)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    build(out_file)
+    print "Built", out_file
+
+# Python main function call
+if __name__ == "__main__":
+    main(sys.argv[1:])
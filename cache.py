@@ -0,0 +1,188 @@
+import errno
+import hashlib
+import os
+import tempfile
+import time
+import instructions.instruction_table as instruction_table
+
+# Default maximum size of the cache in bytes
+default_max_size = 64 * 1024 * 1024
+# Suffix of cache entry files
+entry_ext = ".hex"
+# Suffix of the temporary files entries are written to
+temp_ext = ".tmp"
+# Name of the file holding the estimated total size of the entries
+size_file = "size"
+# Age in seconds after which a temporary file was left by a writer that died
+stale_age = 3600
+
+
+# A content addressed cache of assembled output, stored in a directory.
+# Entries are keyed by a hash of everything the output depends on, so the
+# directory may be shared between runs, parallel workers, and machines.
+# Entries are written atomically by renaming a temporary file into place, and
+# the least recently used entries are evicted when the cache grows too large.
+# The total size is estimated from a running count kept in size_file, and
+# the directory is only scanned when the estimate goes over the maximum size,
+# so writes stay cheap on network file systems. Updates of the count may race
+# between workers, which the next scan corrects. Each entry holds the
+# warnings of the assembly along with the output.
+class OutputCache(object):
+    # Input:
+    #   path - The cache directory.
+    #   max_size - The maximum total size of the cache entries in bytes.
+    #   version - The assembler version.
+    def __init__(self, path, max_size=default_max_size, version=""):
+        self.path = path
+        self.max_size = max_size
+        self.version = version
+
+    # Computes the cache key for a source file.
+    # Input:
+    #   source - The contents of the source file.
+    # Returns:
+    #   The key string.
+    def key(self, source):
+        h = hashlib.sha1()
+        h.update(self.version)
+        h.update("\0")
+        for type_id in instruction_table.InstructionType.all:
+            h.update(instruction_table.read_file(type_id))
+            h.update("\0")
+        h.update(source)
+        return h.hexdigest()
+
+    # Looks up a cache entry, marking it as recently used.
+    # Input:
+    #   key - The cache key.
+    # Returns:
+    #   (the cached output, list of the warnings printed by the assembly), or
+    #   None if not found.
+    def get(self, key):
+        name = self._entry_path(key)
+        try:
+            with open(name, "rb") as f:
+                count = int(f.readline())
+                warnings = [f.readline().rstrip("\n") for _ in range(count)]
+                output = f.read()
+            os.utime(name, None)
+        except (IOError, OSError, ValueError):
+            # missing, evicted by another worker while reading, or invalid
+            return None
+        return output, warnings
+
+    # Adds an entry to the cache, evicting old entries if necessary.
+    # Input:
+    #   key - The cache key.
+    #   output - The assembled output.
+    #   warnings - List of the warnings printed by the assembly.
+    # Returns:
+    #   n/a
+    def put(self, key, output, warnings=()):
+        name = self._entry_path(key)
+        directory = os.path.dirname(name)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=temp_ext)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write("{0}\n".format(len(warnings)))
+                for warning in warnings:
+                    f.write(warning.replace("\n", " ") + "\n")
+                f.write(output)
+                size = f.tell()
+            os.rename(tmp_name, name)
+        except (IOError, OSError):
+            self._remove(tmp_name)
+            raise
+        total = self._read_size()
+        if total is None or total + size > self.max_size:
+            self._evict()
+        else:
+            self._write_size(total + size)
+
+    # Returns the path of the file holding an entry.
+    # Input:
+    #   key - The cache key.
+    # Returns:
+    #   The file path.
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:] + entry_ext)
+
+    # Returns the estimated total size of the entries.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The size in bytes, or None if there is no estimate.
+    def _read_size(self):
+        try:
+            with open(os.path.join(self.path, size_file), "rb") as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return None
+
+    # Replaces the estimated total size of the entries.
+    # Input:
+    #   total - The size in bytes.
+    # Returns:
+    #   n/a
+    def _write_size(self, total):
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix=temp_ext)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(repr(total))
+            os.rename(tmp_name, os.path.join(self.path, size_file))
+        except (IOError, OSError):
+            self._remove(tmp_name)
+            raise
+
+    # Removes the least recently used entries until the cache fits in its
+    # maximum size, and the temporary files of writers that died, then
+    # records the total size.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _evict(self):
+        entries = []
+        total = 0
+        stale = time.time() - stale_age
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                is_temp = name.endswith(temp_ext)
+                if not name.endswith(entry_ext) and not is_temp:
+                    continue
+                name = os.path.join(directory, name)
+                try:
+                    st = os.stat(name)
+                except OSError:
+                    continue
+                if is_temp:
+                    if st.st_mtime < stale:
+                        self._remove(name)
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+                total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            self._remove(name)
+            total -= size
+        self._write_size(total)
+
+    # Removes a file, ignoring files already removed by another worker.
+    # Input:
+    #   name - The file path.
+    # Returns:
+    #   n/a
+    @staticmethod
+    def _remove(name):
+        try:
+            os.remove(name)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
@@ -0,0 +1,48 @@
+import copy
+import grammar
+import lexer
+
+
+# Holds the lexer and parser used for a single assembly. The module level
+# lexer and parser are only used as templates, so separate contexts do not
+# share any parsing state (including line numbers) and may be used
+# concurrently from different threads.
+class ParseContext(object):
+    # Input:
+    #   clock - Optional clock function. When supplied, the time spent in the
+    #           lexer is accumulated in lex_time.
+    def __init__(self, clock=None):
+        self.lexer = lexer.lexer.clone()
+        self.lexer.lineno = 1
+        # the warnings printed while parsing, in order
+        self.warnings = []
+        self.lexer.warnings = self.warnings
+        # the parse tables are shared, the parse stacks are created per parse
+        self.parser = copy.copy(grammar.parser)
+        self.clock = clock
+        self.lex_time = 0.0
+        self.tokenfunc = None
+        if clock is not None:
+            self.tokenfunc = self._timed_token
+
+    # Parses a line of input.
+    # Input:
+    #   line - The line of source text.
+    # Returns:
+    #   The dictionary describing the line (see dlx_parser.grammar).
+    # Throws:
+    #   ParseException - The line could not be parsed.
+    def parse(self, line):
+        return self.parser.parse(line, lexer=self.lexer, tracking=True,
+                                 tokenfunc=self.tokenfunc)
+
+    # Returns the next token from the lexer, timing the lexer.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The token, or None at the end of input.
+    def _timed_token(self):
+        start = self.clock()
+        tok = self.lexer.token()
+        self.lex_time += self.clock() - start
+        return tok
@@ -1,7 +1,8 @@
+import os
 import ply.yacc as yacc
 from exception import ParseException
 # necessary even though not explicitly used
-from lexer import tokens
+from lexer import tokens, warn
 
 # The parser returns a dictionary describing the contents of the line.
 # line_no: int
@@ -506,9 +507,10 @@ def p_unsigned(p):
         )
     # validate that it will fit in 16 bits
     if (p[1] & ~0xffff) is not 0:
-        print "WARNING line {0}: unsigned immediate larger than 16 bits".format(
-            p.lineno(1)
-        )
+        warn(p.lexer,
+             "WARNING line {0}: unsigned immediate larger than 16 bits".format(
+                 p.lineno(1)
+             ))
     p[0] = p[1]
 
 
@@ -523,9 +525,10 @@ def p_int(p):
     imm_max = int(2**16) - 1
     imm_min = -int(2**16)
     if p[1] > imm_max or p[1] < imm_min:
-        print "WARNING line {0}: signed immediate larger than 16 bits".format(
-            p.lineno(1)
-        )
+        warn(p.lexer,
+             "WARNING line {0}: signed immediate larger than 16 bits".format(
+                 p.lineno(1)
+             ))
     p[0] = p[1]
 
 
@@ -578,5 +581,7 @@ def p_error(p):
             )
         )
 
-# build the parser
-parser = yacc.yacc()
+# build the parser, keeping the generated tables in this package so they are
+# reused regardless of the working directory (and bundled by build_zipapp.py)
+parser = yacc.yacc(debug=0, tabmodule="dlx_parser.parsetab",
+                   outputdir=os.path.dirname(os.path.abspath(__file__)))
@@ -145,11 +145,25 @@ def t_newline(t):
     t.lexer.lineno += len(t.value)
 
 
+# Prints a warning, recording it in the warnings list of the lexer if it has
+# one (see dlx_parser.context).
+# Input:
+#   lexer - The lexer in use.
+#   message - The warning.
+# Returns:
+#   n/a
+def warn(lexer, message):
+    print message
+    warnings = getattr(lexer, "warnings", None)
+    if warnings is not None:
+        warnings.append(message)
+
+
 # Handle unknown characters found by the lexer.
 def t_error(t):
-    print "WARNING line {0}: unknown character \"{1}\"".format(
+    warn(t.lexer, "WARNING line {0}: unknown character \"{1}\"".format(
         t.lexer.lineno, t.value[0]
-    )
+    ))
     t.lexer.skip(1)
 
 # build the lexer
@@ -1,5 +1,7 @@
 import sys
 import getopt
+import threading
+import Queue
 from assembler import Assembler
 
 # Expected input file extension
@@ -13,7 +15,46 @@ options = {
     "console": False,
     "no_output": False,
     "in_file": None,
-    "out_file": None
+    "in_files": None,
+    "jobs": 1,
+    "out_file": None,
+    "cache_dir": None,
+    "cache_size": None,
+    "stats": None,
+    "trace": None,
+    "trace_slice": None,
+    "hazards": False,
+    "pipeline": None,
+    "strength": False,
+    "rewrites": None,
+    "peephole": False,
+    "dead_code": False,
+    "entries": None,
+    "auto_align": False,
+    "pack_data": False,
+    "profile": None,
+    "schedule": False,
+    "delay_slots": False,
+    "nops": False,
+    "raw": None,
+    "segments": None,
+    "publish": None,
+    "simulate_caches": False,
+    "cache_config": None,
+    "simulate_branches": False,
+    "predictors": None,
+    "hot_lines": False,
+    "annotate": None,
+    "folded_stacks": None,
+    "exec_trace": None,
+    "record_profile": None,
+    "breakpoints": None,
+    "snapshot": None,
+    "restore": None,
+    "max_steps": None,
+    "devices": False,
+    "disk": None,
+    "host_io": False
 }
 
 
@@ -24,8 +65,55 @@ options = {
 #   n/a
 def main(argv):
     if parse_args(argv):
-        asm = Assembler(options)
-        asm.run()
+        if len(options["in_files"]) == 1:
+            asm = Assembler(options)
+            asm.run()
+        else:
+            assemble_files(options["in_files"], options["jobs"])
+
+
+# Assembles several input files in worker threads, each file to its default
+# output file. The trace, if any, has a span for each file tagged with the
+# worker that assembled it, and is written once all files are done.
+# Input:
+#   in_files - The input file names.
+#   jobs - The number of worker threads.
+# Returns:
+#   n/a
+def assemble_files(in_files, jobs):
+    tracer = None
+    if options["trace"]:
+        from trace_events import Tracer
+        tracer = Tracer()
+    pending = Queue.Queue()
+    for in_file in in_files:
+        pending.put(in_file)
+
+    def work():
+        while True:
+            try:
+                in_file = pending.get_nowait()
+            except Queue.Empty:
+                return
+            file_options = dict(options)
+            file_options["in_file"] = in_file
+            file_options["out_file"] = in_file.replace(in_file_ext,
+                                                       out_file_ext)
+            file_options["trace"] = None
+            file_options["tracer"] = tracer
+            asm = Assembler(file_options)
+            asm.run()
+
+    workers = [
+        threading.Thread(target=work, name="worker {0}".format(n))
+        for n in range(max(1, min(jobs, len(in_files))))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if tracer is not None:
+        tracer.write(options["trace"])
 
 
 # Prints help information to console
@@ -34,7 +122,7 @@ def main(argv):
 # Returns:
 #   n/a
 def print_help():
-    print "dlxas.py [options] [file]"
+    print "dlxas.py [options] [file...]"
     print "Options:"
     print "-h\n" \
           "--help\n" \
@@ -60,7 +148,156 @@ def print_help():
           "supplying it as the last parameter."
     print "-o <file>\n" \
           "--output=<file>\n" \
-          "\tOverride the default output file name."
+          "\tOverride the default output file name. Only for a single " \
+          "input file."
+    print "-j <n>\n" \
+          "--jobs=<n>\n" \
+          "\tAssemble several input files in n threads (default 1)."
+    print "--cache=<dir>\n" \
+          "\tReuse output cached in dir when the source, instruction " \
+          "tables, and\n\tassembler version are unchanged. The directory " \
+          "may be shared between\n\tparallel runs."
+    print "--cache_size=<bytes>\n" \
+          "\tMaximum size of the cache before the least recently used " \
+          "entries are\n\tevicted (default 64MB)."
+    print "--stats\n" \
+          "\tPrint the time spent in each assembler stage and counts of " \
+          "the\n\tprocessed lines, labels, directives, and instructions. " \
+          "Times are wall\n\tclock times."
+    print "--stats_json\n" \
+          "\tPrint the stats as JSON."
+    print "--trace=<file>\n" \
+          "\tWrite a Chrome/Perfetto trace of the assembler stages to " \
+          "file, with a\n\tspan for each input file tagged with the " \
+          "thread that assembled it."
+    print "--trace_slice=<n>\n" \
+          "\tAdd a span to the trace for every n lines parsed."
+    print "--hazards\n" \
+          "\tReport the estimated pipeline stalls of each basic block and " \
+          "source line."
+    print "--pipeline=<file>\n" \
+          "\tLoad the pipeline model from file, with one \"name value\" " \
+          "pair per line:\n" \
+          "\tforwarding, branch_penalty, fp_div_pipelined, and the " \
+          "latencies int,\n\tload, fp_add, fp_mult, fp_div, and " \
+          "fp_convert."
+    print "--strength\n" \
+          "\tReplace integer multiplies and divides by constants with " \
+          "shifts and adds."
+    print "--rewrites=<file>\n" \
+          "\tReplace instruction sequences with the cheaper ones in a " \
+          "rewrite\n\tdatabase built by superopt.py."
+    print "--peephole\n" \
+          "\tRemove nops, redundant moves, and writes to r0, fold constant " \
+          "chains,\n\tand point branches at the end of jump chains."
+    print "--dead_code\n" \
+          "\tRemove code unreachable from the entry points and register " \
+          "writes that\n\tare never read, reporting the bytes removed " \
+          "after each label."
+    print "--entry=<label>[,<label>...]\n" \
+          "\tEntry points for --dead_code, default the first instruction. " \
+          "Labels used\n\tby instructions other than branches and jumps " \
+          "are entry points too."
+    print "--auto_align\n" \
+          "\tAlign .word, .float, and .double values to their size, " \
+          "moving the label\n\ton the line with them."
+    print "--pack_data\n" \
+          "\tReorder the labeled data objects between code and address " \
+          "directives\n\tfrom the most to the least aligned to reduce " \
+          "padding. Implies\n\t--auto_align."
+    print "--profile=<file>\n" \
+          "\tReorder basic blocks so the frequent path of each branch falls " \
+          "through,\n\tusing a profile with one \"<address or label> " \
+          "<taken> [<not taken>]\"\n\tline per branch, or a binary " \
+          "profile. Addresses are those of the\n\tprogram assembled " \
+          "without optimizations. Code keeps its order unless\n\tthe " \
+          "new order saves branch and jump cycles under the pipeline " \
+          "model\n\t(see --pipeline)."
+    print "--schedule\n" \
+          "\tReorder the instructions of each basic block to reduce " \
+          "pipeline stalls."
+    print "--delay_slots\n" \
+          "\tAssemble for a single branch delay slot, filling the slot " \
+          "after each\n\tbranch and jump with an independent instruction, " \
+          "or a nop if there is none.\n\tThe simulator has no delay " \
+          "slots, so it can't be used with simulations."
+    print "--nops\n" \
+          "\tAssemble for a pipeline without interlocks, inserting the " \
+          "nops each\n\tdependent instruction needs under the pipeline " \
+          "model (see --pipeline).\n\tWith --delay_slots the nops for " \
+          "a delay slot go before its branch."
+    print "--raw=<file>\n" \
+          "\tWrite the assembled memory to file as a raw image, with each " \
+          "byte at the\n\toffset of its address. Gaps are skipped, " \
+          "leaving a sparse file."
+    print "--segments=<file>\n" \
+          "\tWrite the assembled memory to file as a list of segments, " \
+          "each with its\n\taddress and length."
+    print "--publish=<file>\n" \
+          "\tWrite the assembled memory and decoded instructions to file " \
+          "as a shared\n\timage, which simulations in other processes " \
+          "map read only. Use a file\n\ton a memory file system, such " \
+          "as /dev/shm, to share it in memory."
+    print "--simulate_caches\n" \
+          "\tRun the program and report the miss rates of the caches, of " \
+          "the data\n\taccesses to each label, and of each source line."
+    print "--cache_config=<file>\n" \
+          "\tLoad the cache configuration from file, with one \"name " \
+          "value\" pair per\n\tline. Names are l1i_size, " \
+          "l1i_associativity, l1i_line_size, the same\n\tfor l1d and l2 " \
+          "(an l2_size of 0 leaves it out), and replacement (lru or\n\t" \
+          "fifo)."
+    print "--simulate_branches\n" \
+          "\tRun the program and report the mispredictions of branch " \
+          "predictors for\n\teach conditional branch, label, and source " \
+          "line."
+    print "--predictors=<list>\n" \
+          "\tComma separated branch predictors to simulate, default all: " \
+          "taken,\n\tnot_taken, btfn (backward taken, forward not taken), " \
+          "1bit, 2bit, gshare,\n\tand tournament. Table predictors take " \
+          "log2 of their entries as\n\t<name>:<bits>, default 10."
+    print "--hot_lines\n" \
+          "\tRun the program and report the executions and estimated " \
+          "cycles of each\n\tlabel and of the source lines with the most " \
+          "cycles, under the pipeline\n\tmodel (see --pipeline)."
+    print "--annotate=<file>\n" \
+          "\tRun the program and write the source to file with the " \
+          "executions and\n\testimated cycles of each line."
+    print "--folded_stacks=<file>\n" \
+          "\tRun the program and write the estimated cycles of each call " \
+          "stack to file\n\tin the folded format of flame graph tools. " \
+          "jal and jalr push the label\n\tof their target, and jr r31 " \
+          "pops it."
+    print "--exec_trace=<file>\n" \
+          "\tRun the program and write the address, instruction, register " \
+          "writes, and\n\tmemory address of each instruction executed to " \
+          "file, in a compressed\n\tbinary format (see simulator.trace)."
+    print "--record_profile=<file>\n" \
+          "\tRun the program and write the taken and not taken counts of " \
+          "each branch to\n\tfile, as a binary profile for --profile. " \
+          "Optimizations can't be used."
+    print "--break=<labels>\n" \
+          "\tRun the program, stopping before executing the instruction at " \
+          "any of the\n\tcomma separated labels."
+    print "--snapshot=<file>\n" \
+          "\tRun the program and save the machine state where it stops to " \
+          "file."
+    print "--restore=<file>\n" \
+          "\tRun the program from the machine state saved in file by " \
+          "--snapshot, which\n\tmust be of the same program."
+    print "--max_steps=<n>\n" \
+          "\tRun the program, stopping after n instructions."
+    print "--devices\n" \
+          "\tRun the program with memory mapped console, timer, and disk " \
+          "devices (see\n\tsimulator.devices), skipping the iterations " \
+          "of loops that poll them."
+    print "--disk=<file>\n" \
+          "\tBack the disk device with file, implies --devices."
+    print "--host_io\n" \
+          "\tRun the program with traps for host files and the console: " \
+          "trap 1 exit,\n\ttrap 2 open, trap 3 read, trap 4 write, and " \
+          "trap 5 close, with the\n\targuments in r1 to r3 and the " \
+          "result in r1 (see simulator.hostio)."
 
 
 # Parses command line args, inserting them into the program options.
@@ -69,9 +306,20 @@ def print_help():
 # Returns:
 #   True if argument parsing was successful.
 def parse_args(argv):
-    short_opts = "hvdpcni:o:"
+    short_opts = "hvdpcni:o:j:"
     long_opts = ["help", "verbose", "dump", "prompt", "console", "no_output",
-                 "input=", "output="]
+                 "input=", "output=", "jobs=", "cache=", "cache_size=",
+                 "stats", "stats_json", "trace=", "trace_slice=",
+                 "hazards", "pipeline=", "strength", "rewrites=", "peephole",
+                 "dead_code", "entry=", "auto_align",
+                 "pack_data", "profile=", "schedule", "delay_slots",
+                 "nops", "raw=", "segments=", "publish=", "simulate_caches",
+                 "cache_config=",
+                 "simulate_branches", "predictors=", "hot_lines",
+                 "annotate=", "folded_stacks=", "exec_trace=",
+                 "record_profile=",
+                 "break=", "snapshot=", "restore=", "max_steps=",
+                 "devices", "disk=", "host_io"]
 
     try:
         opts, args = getopt.getopt(argv, short_opts, long_opts)
@@ -98,18 +346,120 @@ def parse_args(argv):
             options["in_file"] = arg
         elif opt in ("-o", "--output"):
             options["out_file"] = arg
+        elif opt in ("-j", "--jobs"):
+            try:
+                options["jobs"] = int(arg)
+            except ValueError:
+                print "Invalid job count:", arg
+                return False
+        elif opt == "--cache":
+            options["cache_dir"] = arg
+        elif opt == "--cache_size":
+            try:
+                options["cache_size"] = int(arg, 0)
+            except ValueError:
+                print "Invalid cache size:", arg
+                return False
+        elif opt == "--stats":
+            options["stats"] = "human"
+        elif opt == "--stats_json":
+            options["stats"] = "json"
+        elif opt == "--trace":
+            options["trace"] = arg
+        elif opt == "--trace_slice":
+            try:
+                options["trace_slice"] = int(arg)
+            except ValueError:
+                print "Invalid trace slice:", arg
+                return False
+        elif opt == "--hazards":
+            options["hazards"] = True
+        elif opt == "--pipeline":
+            options["pipeline"] = arg
+        elif opt == "--strength":
+            options["strength"] = True
+        elif opt == "--rewrites":
+            options["rewrites"] = arg
+        elif opt == "--peephole":
+            options["peephole"] = True
+        elif opt == "--dead_code":
+            options["dead_code"] = True
+        elif opt == "--entry":
+            options["entries"] = arg.split(",")
+        elif opt == "--auto_align":
+            options["auto_align"] = True
+        elif opt == "--pack_data":
+            options["pack_data"] = True
+        elif opt == "--profile":
+            options["profile"] = arg
+        elif opt == "--schedule":
+            options["schedule"] = True
+        elif opt == "--delay_slots":
+            options["delay_slots"] = True
+        elif opt == "--nops":
+            options["nops"] = True
+        elif opt == "--raw":
+            options["raw"] = arg
+        elif opt == "--segments":
+            options["segments"] = arg
+        elif opt == "--publish":
+            options["publish"] = arg
+        elif opt == "--simulate_caches":
+            options["simulate_caches"] = True
+        elif opt == "--cache_config":
+            options["cache_config"] = arg
+        elif opt == "--simulate_branches":
+            options["simulate_branches"] = True
+        elif opt == "--predictors":
+            options["predictors"] = arg.split(",")
+        elif opt == "--hot_lines":
+            options["hot_lines"] = True
+        elif opt == "--annotate":
+            options["annotate"] = arg
+        elif opt == "--folded_stacks":
+            options["folded_stacks"] = arg
+        elif opt == "--exec_trace":
+            options["exec_trace"] = arg
+        elif opt == "--record_profile":
+            options["record_profile"] = arg
+        elif opt == "--break":
+            options["breakpoints"] = arg.split(",")
+        elif opt == "--snapshot":
+            options["snapshot"] = arg
+        elif opt == "--restore":
+            options["restore"] = arg
+        elif opt == "--max_steps":
+            try:
+                options["max_steps"] = int(arg)
+            except ValueError:
+                print "Invalid step count:", arg
+                return False
+        elif opt == "--devices":
+            options["devices"] = True
+        elif opt == "--disk":
+            options["devices"] = True
+            options["disk"] = arg
+        elif opt == "--host_io":
+            options["host_io"] = True
 
-    # Get the input file from the last arg, if not specified
-    if options["in_file"] is None and len(args) is 1:
-        options["in_file"] = args[0]
+    # Get the input files from the last args, if not specified
+    if options["in_file"] is not None and len(args) is 0:
+        options["in_files"] = [options["in_file"]]
+    elif options["in_file"] is None and len(args) > 0:
+        options["in_files"] = args
     elif options["in_file"] is None and len(args) is 0 and prompt:
-        options["in_file"] = raw_input("Enter file name: ")
+        options["in_files"] = [raw_input("Enter file name: ")]
     else:
         print_help()
         return False
-    # Verify input file type
-    if not options["in_file"].endswith(in_file_ext):
-        print "Unknown input file type:", options["in_file"]
+    options["in_file"] = options["in_files"][0]
+    # Verify input file types
+    for in_file in options["in_files"]:
+        if not in_file.endswith(in_file_ext):
+            print "Unknown input file type:", in_file
+            return False
+    if len(options["in_files"]) > 1 and options["out_file"] is not None:
+        print "An output file can't be given for several input files"
         return False
     # Set output file to default if necessary
     if options["out_file"] is None:
@@ -3,6 +3,7 @@ __all__ = [
     "instruction_table",
     "i_type",
     "j_type",
+    "operands",
     "r_type",
     "types"
 ]
@@ -25,6 +25,16 @@ class IType(Instruction):
         if i_immediate in self.source:
             self._set_immediate(self.source[i_immediate])
 
+    # Moves the instruction to a new address.
+    # Input:
+    #   address - The new address.
+    # Returns:
+    #   n/a
+    def relocate(self, address):
+        super(IType, self).relocate(address)
+        if i_immediate in self.source:
+            self._set_immediate(self.source[i_immediate])
+
     # Resolves the label (if any) used in the instruction.
     # Input:
     #   sym_tab - The symbol table (mapping strings to addresses).
@@ -59,7 +69,7 @@ class IType(Instruction):
     #   n/a
     def _set_immediate(self, value):
         if self.source[i_opcode] in self.offset_instructions:
-            self.immediate = value - (self.address + 4)
+            self.immediate = value + self.target_offset - (self.address + 4)
         else:
             self.immediate = value
         self.immediate &= self.immediate_mask
\ No newline at end of file
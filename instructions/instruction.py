@@ -19,6 +19,9 @@ class Instruction(Memory):
         super(Instruction, self).__init__(address, 4)
         self.source = source
         self.opcode = instruction_table.get_opcode(self.source[i_opcode])
+        # bytes added to the target of a branch or jump, used when the first
+        # instruction at the target is copied into a delay slot
+        self.target_offset = 0
 
     # Returns a description of the instruction
     # Input:
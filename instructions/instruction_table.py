@@ -1,4 +1,5 @@
 import string
+import threading
 
 # File to load r-type instructions
 r_type_file = "Rtypes"
@@ -9,6 +10,8 @@ j_type_file = "Jtypes"
 
 # instruction table
 instruction_table = {}
+# guards loading of the instruction table
+_load_lock = threading.Lock()
 
 
 # Acts as an enum of instruction types.
@@ -39,7 +42,30 @@ def file_name(type_id):
         raise ValueError("Unknown instruction type")
 
 
-# Loads the instruction set from files.
+# Returns the contents of the file for an instruction type. Files in the
+# working directory take precedence over the tables bundled in a zipapp
+# (see build_zipapp.py).
+# Input:
+#   type_id - The instruction type.
+# Returns:
+#   The file contents.
+# Throws:
+#   IOError - The file wasn't found.
+def read_file(type_id):
+    name = file_name(type_id)
+    try:
+        with open(name, "r") as f:
+            return f.read()
+    except IOError:
+        try:
+            from bundled_tables import tables
+        except ImportError:
+            raise IOError("instruction table {} not found".format(name))
+        return tables[name]
+
+
+# Loads the instruction set from files. The table is only loaded once, and is
+# read only afterwards so it may be shared between threads.
 # Input:
 #   n/a
 # Returns:
@@ -47,10 +73,12 @@ def file_name(type_id):
 # Throws:
 #   IOError - The file format isn't recognized.
 def load():
-    for type_id in InstructionType.all:
-        name = file_name(type_id)
-        with open(name, "r") as f:
-            for line in f:
+    with _load_lock:
+        if instruction_table:
+            return
+        table = {}
+        for type_id in InstructionType.all:
+            for line in read_file(type_id).splitlines():
                 words = string.split(string.lower(line))
                 if len(words) in (2, 3):
                     i = {
@@ -60,9 +88,12 @@ def load():
                     }
                     if len(words) is 3:
                         i["fun_code"] = int(words[2])
-                    instruction_table[words[0]] = i
+                    table[words[0]] = i
                 else:
-                    raise IOError("file {} has unknown format".format(name))
+                    raise IOError(
+                        "file {} has unknown format".format(file_name(type_id))
+                    )
+        instruction_table.update(table)
 
 
 # Returns an instruction's information.
@@ -12,7 +12,17 @@ class JType(Instruction):
         super(JType, self).__init__(address, source)
         self.offset = 0
         if i_immediate in self.source:
-            self.offset = self.source[i_immediate] - (self.address + 4)
+            self._set_target(self.source[i_immediate])
+
+    # Moves the instruction to a new address.
+    # Input:
+    #   address - The new address.
+    # Returns:
+    #   n/a
+    def relocate(self, address):
+        super(JType, self).relocate(address)
+        if i_immediate in self.source:
+            self._set_target(self.source[i_immediate])
 
     # Resolves the label (if any) used in the instruction.
     # Input:
@@ -26,8 +36,15 @@ class JType(Instruction):
             label = self.source[i_label]
             if not label in sym_tab:
                 raise LookupError(label)
-            target = sym_tab[label]
-            self.offset = target - (self.address + 4)
+            self._set_target(sym_tab[label])
+
+    # Sets the PC offset of the jump.
+    # Input:
+    #   target - The target address.
+    # Returns:
+    #   n/a
+    def _set_target(self, target):
+        self.offset = target + self.target_offset - (self.address + 4)
 
     # Returns the instruction in binary format for encoding.
     # Input:
@@ -0,0 +1,115 @@
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2
+
+# Classes of instructions used by the analysis and optimization passes.
+loads = ("lb", "lbu", "lh", "lhu", "lw", "lf", "ld")
+stores = ("sb", "sh", "sw", "sf", "sd")
+branches = ("beqz", "bnez")
+jumps = ("j", "jal", "jr", "jalr")
+calls = ("jal", "jalr")
+# Jumps to a target given in the instruction rather than a register.
+direct_jumps = ("j", "jal")
+# Instructions with effects other than their registers and memory operand.
+barriers = ("trap",)
+# Instructions whose destination is a double register pair.
+double_dest = ("ld", "addd", "subd", "multd", "divd", "movd", "cvtf2d",
+               "cvti2d")
+# Instructions whose register sources are double register pairs (for sd, the
+# stored value).
+double_src = ("sd", "addd", "subd", "multd", "divd", "movd", "cvtd2f",
+              "cvtd2i")
+# Instructions that read no registers.
+no_reads = ("nop", "trap", "j", "jal", "lhi")
+# Register written by the call instructions.
+link_register = "r31"
+# The hard wired zero register.
+zero_register = "r0"
+
+
+# Returns the registers named by an operand, which are a register pair for
+# double operands.
+# Input:
+#   name - The register name (e.g. "r1" or "f2").
+#   double - True for a double operand.
+# Returns:
+#   List of register names.
+def _registers(name, double):
+    if double:
+        return [name, name[0] + repr(int(name[1:]) + 1)]
+    return [name]
+
+
+# Returns the registers read by an instruction. Reads of r0 are omitted, since
+# they never depend on another instruction.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   List of register names.
+def reads(instr):
+    source = instr.source
+    op = source[i_opcode]
+    double = op in double_src
+    regs = []
+    if op in no_reads:
+        pass
+    elif op in stores:
+        if i_rs1 in source:
+            regs.append(source[i_rs1])
+        regs += _registers(source[i_rd], double)
+    elif op in loads:
+        if i_rs1 in source:
+            regs.append(source[i_rs1])
+    else:
+        for field in (i_rs1, i_rs2):
+            if field in source:
+                regs += _registers(source[field], double)
+    return [r for r in regs if r != zero_register]
+
+
+# Returns the registers written by an instruction. Writes to r0 are omitted,
+# since they have no effect.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   List of register names.
+def writes(instr):
+    source = instr.source
+    op = source[i_opcode]
+    if op in calls:
+        return [link_register]
+    if op in stores or op in branches or op in jumps or op in barriers or \
+       i_rd not in source:
+        return []
+    regs = _registers(source[i_rd], op in double_dest)
+    return [r for r in regs if r != zero_register]
+
+
+# Returns the registers that hold the stored value of a store instruction.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   List of register names.
+def stored_registers(instr):
+    op = instr.source[i_opcode]
+    if op not in stores:
+        return []
+    regs = _registers(instr.source[i_rd], op in double_src)
+    return [r for r in regs if r != zero_register]
+
+
+# Returns true if an instruction ends a basic block.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def ends_block(instr):
+    op = instr.source[i_opcode]
+    return op in branches or op in jumps or op in barriers
+
+
+# Returns true if an instruction is a nop.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def is_nop(instr):
+    return instr.source[i_opcode] == "nop"
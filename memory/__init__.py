@@ -1,4 +1,5 @@
 __all__ = [
+    "layout",
     "mem_double",
     "mem_float",
     "mem_string",
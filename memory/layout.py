@@ -0,0 +1,225 @@
+# kinds of layout entries
+label_entry = "label"
+origin_entry = "origin"
+align_entry = "align"
+space_entry = "space"
+memory_entry = "memory"
+
+
+# The labels, address directives, and memory chunks of a program in source
+# order. Optimization passes edit the layout to insert, remove, or reorder
+# chunks, then reassign addresses from it, so that labels and alignment follow
+# the code.
+class Layout(object):
+    def __init__(self):
+        # list of (kind, value)
+        self.entries = []
+        # id of a chunk -> chunks replacing it
+        self.edits = {}
+
+    # Adds a label at the current position.
+    # Input:
+    #   name - The label name.
+    # Returns:
+    #   n/a
+    def add_label(self, name):
+        self.entries.append((label_entry, name))
+
+    # Sets the address at the current position.
+    # Input:
+    #   address - The new address.
+    # Returns:
+    #   n/a
+    def add_origin(self, address):
+        self.entries.append((origin_entry, address))
+
+    # Aligns the address at the current position so that the lower n bits are
+    # 0.
+    # Input:
+    #   n - Number of lower order bits to be zeroed.
+    # Returns:
+    #   n/a
+    def add_align(self, n):
+        self.entries.append((align_entry, n))
+
+    # Reserves space at the current position.
+    # Input:
+    #   size - The number of bytes.
+    # Returns:
+    #   n/a
+    def add_space(self, size):
+        self.entries.append((space_entry, size))
+
+    # Adds a chunk of memory at the current position.
+    # Input:
+    #   mem - The memory chunk.
+    # Returns:
+    #   n/a
+    def add_memory(self, mem):
+        self.entries.append((memory_entry, mem))
+
+    # Returns the chunks that will take the place of a chunk.
+    # Input:
+    #   mem - The memory chunk.
+    # Returns:
+    #   List of memory chunks.
+    def replacement(self, mem):
+        return self.edits.get(id(mem), [mem])
+
+    # Replaces a chunk by a sequence of chunks, which may include the chunk
+    # itself. Edits take effect when addresses are assigned.
+    # Input:
+    #   mem - The memory chunk.
+    #   chunks - The replacement chunks.
+    # Returns:
+    #   n/a
+    def replace(self, mem, chunks):
+        self.edits[id(mem)] = list(chunks)
+
+    # Removes a chunk. Labels on the chunk move to the chunk that follows it.
+    # Input:
+    #   mem - The memory chunk.
+    # Returns:
+    #   n/a
+    def remove(self, mem):
+        self.replace(mem, [])
+
+    # Inserts a chunk after another chunk.
+    # Input:
+    #   mem - The existing memory chunk.
+    #   chunk - The new chunk.
+    # Returns:
+    #   n/a
+    def insert_after(self, mem, chunk):
+        self.replace(mem, self.replacement(mem) + [chunk])
+
+    # Inserts a chunk before another chunk, after any labels on it.
+    # Input:
+    #   mem - The existing memory chunk.
+    #   chunk - The new chunk.
+    # Returns:
+    #   n/a
+    def insert_before(self, mem, chunk):
+        self.replace(mem, [chunk] + self.replacement(mem))
+
+    # Rearranges a contiguous run of chunks. Labels move with the chunk they
+    # are on, and the new order may include new chunks and new labels.
+    # Pending edits are applied first.
+    # Input:
+    #   chunks - The chunks of the run in their new order.
+    #   labels - Dictionary mapping ids of chunks to names of new labels on
+    #            them.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - The existing chunks aren't a contiguous run, or a chunk
+    #                of the run is missing from the new order.
+    def reorder(self, chunks, labels=None):
+        self._apply_edits()
+        labels = labels or {}
+        ids = set(id(c) for c in chunks)
+        positions = [
+            n for n, (kind, value) in enumerate(self.entries)
+            if kind == memory_entry and id(value) in ids
+        ]
+        if not positions:
+            raise ValueError("no chunks to reorder")
+        first = positions[0]
+        last = positions[-1]
+        # labels just before the run are on its first chunk
+        while first > 0 and self.entries[first - 1][0] == label_entry:
+            first -= 1
+        attached = {}
+        names = []
+        for kind, value in self.entries[first:last + 1]:
+            if kind == label_entry:
+                names.append(value)
+            elif kind == memory_entry and id(value) in ids:
+                attached[id(value)] = names
+                names = []
+            else:
+                raise ValueError("chunks are not a contiguous run")
+        entries = []
+        for chunk in chunks:
+            for name in attached.get(id(chunk), []) + \
+                    labels.get(id(chunk), []):
+                entries.append((label_entry, name))
+            entries.append((memory_entry, chunk))
+        self.entries[first:last + 1] = entries
+
+    # Replaces edited chunks in the entries.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _apply_edits(self):
+        entries = []
+        for kind, value in self.entries:
+            if kind == memory_entry and id(value) in self.edits:
+                entries += [(memory_entry, m) for m in self.edits[id(value)]]
+            else:
+                entries.append((kind, value))
+        self.entries = entries
+        self.edits = {}
+
+    # Returns the number of bytes skipped to align addresses.
+    # Input:
+    #   n/a
+    # Returns:
+    #   int
+    def padding(self):
+        self._apply_edits()
+        total = 0
+        for kind, value, address in self.addresses():
+            if kind == align_entry:
+                total += align(address, value) - address
+        return total
+
+    # Applies the edits and assigns the address of every chunk and label.
+    # Input:
+    #   n/a
+    # Returns:
+    #   (program mapping addresses to memory, symbol table mapping label
+    #    names to addresses)
+    def assign(self):
+        self._apply_edits()
+
+        program = {}
+        symbol_table = {}
+        for kind, value, address in self.addresses():
+            if kind == label_entry:
+                symbol_table[value] = address
+            elif kind == memory_entry:
+                value.relocate(address)
+                program[address] = value
+        return program, symbol_table
+
+    # Generates the entries with the address at the start of each. Pending
+    # edits aren't included.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Generator of (kind, value, address)
+    def addresses(self):
+        address = 0
+        for kind, value in self.entries:
+            if kind == origin_entry:
+                address = value
+            yield kind, value, address
+            if kind == align_entry:
+                address = align(address, value)
+            elif kind == space_entry:
+                address += value
+            elif kind == memory_entry:
+                address += value.size
+
+
+# Returns an address aligned so that the lower n bits are 0.
+# Input:
+#   address - The address.
+#   n - Number of lower order bits to be zeroed.
+# Returns:
+#   The aligned address.
+def align(address, n):
+    mask = int(2**n) - 1
+    return (address + mask) & ~mask
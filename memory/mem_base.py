@@ -6,6 +6,16 @@ class Memory(object):
     def __init__(self, address, size):
         self.address = address
         self.size = size
+        # source line that produced the chunk, set by the assembler
+        self.line_no = 0
+
+    # Moves the chunk to a new address.
+    # Input:
+    #   address - The new address.
+    # Returns:
+    #   n/a
+    def relocate(self, address):
+        self.address = address
 
     # Returns a string description of the chunk.
     # Input:
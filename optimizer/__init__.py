@@ -0,0 +1,15 @@
+__all__ = [
+    "alu",
+    "block_layout",
+    "constants",
+    "data_layout",
+    "dead_code",
+    "delay_slots",
+    "emit",
+    "interlock",
+    "peephole",
+    "rewrites",
+    "schedule",
+    "strength",
+    "superopt"
+]
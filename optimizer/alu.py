@@ -0,0 +1,135 @@
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2, i_immediate, \
+    i_label
+import instructions.operands as operands
+
+# integer alu instructions with two register sources
+r_ops = ("add", "addu", "sub", "subu", "and", "or", "xor", "sll", "srl", "sra",
+         "seq", "sne", "slt", "sgt", "sle", "sge")
+# integer alu instructions with a signed immediate
+signed_i_ops = ("addi", "subi", "seqi", "snei", "slti", "sgti", "slei", "sgei")
+# integer alu instructions with an unsigned immediate
+unsigned_i_ops = ("addui", "subui", "andi", "ori", "xori", "slli", "srli",
+                  "srai")
+# immediate shifts, which use the low bits of the immediate as the amount
+shift_i_ops = ("slli", "srli", "srai")
+# all integer alu instructions
+ops = r_ops + signed_i_ops + unsigned_i_ops + ("lhi",)
+
+
+# Returns a value as a signed integer of a given width.
+# Input:
+#   value - The value, as an unsigned integer of the width.
+#   width - The number of bits.
+# Returns:
+#   int
+def signed(value, width):
+    if value & (1 << (width - 1)):
+        return value - (1 << width)
+    return value
+
+
+# operation -> function of the unsigned sources and the width
+functions = {
+    "add": lambda a, b, w: a + b,
+    "sub": lambda a, b, w: a - b,
+    "and": lambda a, b, w: a & b,
+    "or": lambda a, b, w: a | b,
+    "xor": lambda a, b, w: a ^ b,
+    "sll": lambda a, b, w: a << (b & (w - 1)),
+    "srl": lambda a, b, w: a >> (b & (w - 1)),
+    "sra": lambda a, b, w: signed(a, w) >> (b & (w - 1)),
+    "seq": lambda a, b, w: int(a == b),
+    "sne": lambda a, b, w: int(a != b),
+    "slt": lambda a, b, w: int(signed(a, w) < signed(b, w)),
+    "sgt": lambda a, b, w: int(signed(a, w) > signed(b, w)),
+    "sle": lambda a, b, w: int(signed(a, w) <= signed(b, w)),
+    "sge": lambda a, b, w: int(signed(a, w) >= signed(b, w)),
+    "lhi": lambda a, b, w: b << 16
+}
+
+# instruction -> operation
+operations = {
+    "add": "add", "addu": "add", "addi": "add", "addui": "add",
+    "sub": "sub", "subu": "sub", "subi": "sub", "subui": "sub",
+    "and": "and", "andi": "and",
+    "or": "or", "ori": "or",
+    "xor": "xor", "xori": "xor",
+    "sll": "sll", "slli": "sll",
+    "srl": "srl", "srli": "srl",
+    "sra": "sra", "srai": "sra",
+    "seq": "seq", "seqi": "seq",
+    "sne": "sne", "snei": "sne",
+    "slt": "slt", "slti": "slt",
+    "sgt": "sgt", "sgti": "sgt",
+    "sle": "sle", "slei": "sle",
+    "sge": "sge", "sgei": "sge",
+    "lhi": "lhi"
+}
+
+
+# Returns true if an instruction is an integer alu instruction with all of its
+# operands known, so that it can be evaluated.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+# Returns:
+#   bool
+def is_alu(source):
+    op = source[i_opcode]
+    if op not in ops or i_label in source:
+        return False
+    return op in r_ops or i_immediate in source
+
+
+# Returns the second source operand of an immediate instruction, as an
+# unsigned integer of a given width. Only the low 16 bits of the immediate
+# are encoded, and they are sign extended for signed instructions, as the
+# machine does (see simulator.decode).
+# Input:
+#   source - The instruction's source as defined in the grammar.
+#   width - The number of bits.
+# Returns:
+#   int
+def immediate(source, width):
+    value = source[i_immediate] & 0xffff
+    if source[i_opcode] in signed_i_ops:
+        value = signed(value, 16)
+    return value & ((1 << width) - 1)
+
+
+# Returns the value an integer alu instruction writes to its destination.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+#   regs - Dictionary mapping registers to unsigned values of the width.
+#          Registers that are missing, and r0, read as 0.
+#   width - The number of bits.
+# Returns:
+#   The value, as an unsigned integer of the width.
+def evaluate(source, regs, width):
+    mask = (1 << width) - 1
+    op = source[i_opcode]
+    a = 0
+    if source.get(i_rs1, operands.zero_register) != operands.zero_register:
+        a = regs.get(source[i_rs1], 0)
+    if op in r_ops:
+        b = 0
+        if source[i_rs2] != operands.zero_register:
+            b = regs.get(source[i_rs2], 0)
+    else:
+        b = immediate(source, width)
+    return functions[operations[op]](a, b, width) & mask
+
+
+# Runs a sequence of integer alu instructions.
+# Input:
+#   sources - The instruction sources.
+#   regs - Dictionary mapping registers to their initial unsigned values.
+#   width - The number of bits.
+# Returns:
+#   Dictionary mapping registers to their final values.
+def run(sources, regs, width):
+    regs = dict(regs)
+    for source in sources:
+        value = evaluate(source, regs, width)
+        if source[i_rd] != operands.zero_register:
+            regs[source[i_rd]] = value
+    return regs
@@ -0,0 +1,352 @@
+from analysis import cfg
+from dlx_parser.grammar import i_opcode, i_label, i_immediate
+from instructions.instruction import Instruction
+import instructions.operands as operands
+from optimizer import emit
+
+# kinds of layout counts
+moved = "moved"
+inverted = "inverted"
+jumps = "jumps"
+taken_before = "taken_before"
+taken_after = "taken_after"
+cycles_before = "cycles_before"
+cycles_after = "cycles_after"
+layout_counts = [moved, inverted, jumps, taken_before, taken_after,
+                 cycles_before, cycles_after]
+
+# conditional branch -> branch on the opposite condition
+inverse_branches = {"beqz": "bnez", "bnez": "beqz"}
+# prefix of labels made for blocks that need one
+label_prefix = "_layout_"
+
+
+# Splits basic blocks into runs of blocks that are contiguous in memory.
+# Input:
+#   blocks - The basic blocks in address order.
+# Returns:
+#   List of lists of blocks.
+def _regions(blocks):
+    regions = []
+    end = None
+    for block in blocks:
+        if block.address() != end:
+            regions.append([])
+        regions[-1].append(block)
+        last = block.last()
+        end = last.address + last.size
+    return regions
+
+
+# Merges blocks into chains, taking the heaviest edges first so that the most
+# frequent successor of each block follows it. Fall through edges that never
+# execute are taken last, which keeps cold code in its original order.
+# Input:
+#   count - The number of blocks.
+#   edges - List of (weight, from index, to index, is fall through).
+#   pinned - Index of a block that must end its chain, or None.
+# Returns:
+#   List of chains (lists of block indices).
+def _chains(count, edges, pinned):
+    chain_of = range(count)
+    chains = dict((i, [i]) for i in range(count))
+    order = sorted(
+        (e for e in edges if e[0] > 0 or e[3]),
+        key=lambda e: (-e[0], not e[3], e[1])
+    )
+    for weight, a, b, _ in order:
+        ca = chain_of[a]
+        cb = chain_of[b]
+        # the first block is the entry, so nothing may precede it
+        if ca == cb or b == 0 or a == pinned or \
+           chains[ca][-1] != a or chains[cb][0] != b:
+            continue
+        chains[ca] += chains.pop(cb)
+        for i in chains[ca]:
+            chain_of[i] = ca
+    return chains.values()
+
+
+# Returns the instructions using each label.
+# Input:
+#   program - The program (mapping addresses to memory).
+# Returns:
+#   Dictionary mapping label names to lists of instructions.
+def _label_uses(program):
+    uses = {}
+    for mem in program.itervalues():
+        if isinstance(mem, Instruction) and i_label in mem.source:
+            uses.setdefault(mem.source[i_label], []).append(mem)
+    return uses
+
+
+# Returns the blocks of a run that code may arrive at from outside it: the
+# first block, and blocks with labels used by instructions outside the run or
+# by instructions in it other than branches and j.
+# Input:
+#   region - The blocks of the run.
+#   uses - The instructions using each label (see _label_uses).
+# Returns:
+#   Set of block indices.
+def _external(region, uses):
+    inside = set(id(i) for b in region for i in b.instructions)
+    external = set([0])
+    for n, block in enumerate(region):
+        for name in block.labels:
+            for instr in uses.get(name, []):
+                op = instr.source[i_opcode]
+                if id(instr) not in inside or \
+                   (op not in operands.branches and op != "j"):
+                    external.add(n)
+    return external
+
+
+# Infers the execution counts of the control flow edges of a run of blocks
+# from the branch counts. The counts flowing into a block add up to the
+# counts flowing out of it, which gives the count of a block that doesn't
+# end in a branch from its neighbours. Blocks that may be entered from
+# outside the run only get counts from the edges leaving them. Edges whose
+# counts can't be inferred get 0.
+# Input:
+#   region - The blocks of the run, in address order.
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   profile - Dictionary mapping branch addresses to (taken, not taken).
+#   external - Indices of the blocks entered from outside the run (see
+#              _external).
+# Returns:
+#   List of [count, from index, to index, kind] edges, where kind is
+#   "fall", "branch" or "jump". Branches out of the run go to None.
+def _edges(region, symbol_table, profile, external):
+    index_of = dict((b.address(), i) for i, b in enumerate(region))
+    count = len(region)
+    edges = []
+    freq = [None] * count
+    for i, block in enumerate(region):
+        last = block.last()
+        op = last.source[i_opcode]
+        target = None
+        if op in operands.branches or op == "j":
+            target = index_of.get(symbol_table.get(last.source[i_label]))
+        if op in operands.branches:
+            taken, not_taken = profile.get(last.address, (0, 0))
+            freq[i] = taken + not_taken
+            edges.append([taken, i, target, "branch"])
+            if i + 1 < count:
+                edges.append([not_taken, i, i + 1, "fall"])
+        elif op == "j":
+            if target is not None:
+                edges.append([None, i, target, "jump"])
+        elif cfg.falls_through(last) and i + 1 < count:
+            edges.append([None, i, i + 1, "fall"])
+    outs = [[] for _ in range(count)]
+    ins = [[] for _ in range(count)]
+    for edge in edges:
+        outs[edge[1]].append(edge)
+        if edge[2] is not None:
+            ins[edge[2]].append(edge)
+
+    changed = True
+    while changed:
+        changed = False
+        for i in range(count):
+            if freq[i] is None:
+                if len(outs[i]) == 1 and outs[i][0][0] is not None:
+                    freq[i] = outs[i][0][0]
+                elif i not in external and ins[i] and \
+                        all(e[0] is not None for e in ins[i]):
+                    freq[i] = sum(e[0] for e in ins[i])
+                else:
+                    continue
+                changed = True
+            for group in (outs[i], ins[i]):
+                if i in external and group is ins[i]:
+                    continue
+                unknown = [e for e in group if e[0] is None]
+                if len(unknown) == 1:
+                    known = sum(e[0] for e in group if e[0] is not None)
+                    unknown[0][0] = max(freq[i] - known, 0)
+                    changed = True
+    for edge in edges:
+        if edge[0] is None:
+            edge[0] = 0
+    return edges
+
+
+# Reorders the blocks of a program so that the more frequent successor of
+# each block falls through. Branches are inverted, and jumps inserted where a
+# block no longer falls through to its successor. A run of code keeps its
+# order unless the new order takes fewer estimated cycles in its branches and
+# jumps, where each taken branch or jump costs the branch penalty and each
+# inserted jump executed costs a cycle more. Runs of code containing branches
+# to numeric addresses are left alone. The layout is edited, and addresses
+# must be reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+#   profile - Dictionary mapping branch addresses to (taken, not taken).
+#   penalty - The cycles lost on each taken branch or jump.
+# Returns:
+#   Dictionary mapping each layout count to its value.
+def reorder(program, symbol_table, layout, profile, penalty=1):
+    counts = dict((kind, 0) for kind in layout_counts)
+    targets = cfg.numeric_targets(program)
+    names = set(symbol_table)
+    uses = _label_uses(program)
+    for region in _regions(cfg.build_blocks(program, symbol_table)):
+        if not any(b.last().address in profile for b in region):
+            continue
+        if any(i.address in targets or (i_immediate in i.source and
+                                        operands.ends_block(i) and
+                                        i.source[i_opcode] != "trap")
+               for b in region for i in b.instructions):
+            continue
+        edges = _edges(region, symbol_table, profile,
+                       _external(region, uses))
+        _reorder_region(region, symbol_table, layout, edges, names, counts,
+                        penalty)
+    return counts
+
+
+# Returns how a block leaves when it is followed by another block.
+# Input:
+#   i - The index of the block.
+#   following - The index of the following block, or None.
+#   successor - The index of the block it falls through to, or None.
+#   target - The index of the block its branch or jump goes to, or None.
+#   weights - Dictionary mapping (from, to, kind) to edge counts.
+# Returns:
+#   (None if it falls through, "invert" if its branch is inverted, or
+#    "jump" if a jump is added, the count of taken branches and jumps, the
+#    count of added jumps executed)
+def _exit(i, following, successor, target, weights):
+    taken = weights.get((i, target, "branch"), 0)
+    if target != following:
+        # an existing jump costs nothing when its target follows it
+        taken += weights.get((i, target, "jump"), 0)
+    if successor is None or successor == following:
+        return None, taken, 0
+    not_taken = weights.get((i, successor, "fall"), 0)
+    if target is not None and target == following:
+        return "invert", not_taken, 0
+    return "jump", taken + not_taken, not_taken
+
+
+# Returns the taken branches and jumps, and their estimated cycles, of an
+# order of the blocks of a run.
+# Input:
+#   order - The block indices in their order.
+#   successor - The index of the block each block falls through to, or None.
+#   target - The index of the block each block's branch or jump goes to, or
+#            None.
+#   weights - Dictionary mapping (from, to, kind) to edge counts.
+#   penalty - The cycles lost on each taken branch or jump.
+# Returns:
+#   (taken branches and jumps, cycles)
+def _cost(order, successor, target, weights, penalty):
+    following = dict(zip(order, order[1:]))
+    taken = 0
+    cycles = 0
+    for i in order:
+        _, n, added = _exit(i, following.get(i), successor[i], target[i],
+                            weights)
+        taken += n
+        cycles += n * penalty + added
+    return taken, cycles
+
+
+# Reorders the blocks of a contiguous run of code.
+# Input:
+#   region - The blocks of the run, in address order.
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout.
+#   edges - The counted control flow edges of the run (see _edges).
+#   names - Set of label names in use, which is updated.
+#   counts - Dictionary of layout counts, which is updated.
+#   penalty - The cycles lost on each taken branch or jump.
+# Returns:
+#   n/a
+def _reorder_region(region, symbol_table, layout, edges, names, counts,
+                    penalty):
+    index_of = dict((b.address(), i) for i, b in enumerate(region))
+    successor = [None] * len(region)
+    target = [None] * len(region)
+    for i, block in enumerate(region):
+        last = block.last()
+        if cfg.falls_through(last) and i + 1 < len(region):
+            successor[i] = i + 1
+        if last.source[i_opcode] in operands.branches or \
+           last.source[i_opcode] == "j":
+            target[i] = index_of.get(symbol_table.get(last.source[i_label]))
+    weights = dict(((a, b, kind), n) for n, a, b, kind in edges)
+    original = range(len(region))
+    before, before_cycles = _cost(original, successor, target, weights,
+                                  penalty)
+    counts[taken_before] += before
+    counts[cycles_before] += before_cycles
+    # a block falling out of the run must stay last
+    pinned = None
+    if cfg.falls_through(region[-1].last()):
+        pinned = len(region) - 1
+
+    chains = _chains(
+        len(region),
+        [(n, a, b, kind == "fall") for n, a, b, kind in edges
+         if kind != "jump" and b is not None],
+        pinned
+    )
+    chains.sort(key=lambda c: (0 not in c, pinned in c, c[0]))
+    order = [i for chain in chains for i in chain]
+    following = dict(zip(order, order[1:]))
+    after, after_cycles = _cost(order, successor, target, weights, penalty)
+    if pinned is not None and order[-1] != pinned or order == original or \
+       after_cycles >= before_cycles:
+        counts[taken_after] += before
+        counts[cycles_after] += before_cycles
+        return
+    counts[taken_after] += after
+    counts[cycles_after] += after_cycles
+
+    labels = {}
+    chunks = []
+    replacements = []
+
+    # returns the name of a label on a block, making one if needed
+    def label_of(i):
+        block = region[i]
+        first = block.instructions[0]
+        if block.labels:
+            return block.labels[0]
+        if id(first) not in labels:
+            n = len(names)
+            while label_prefix + repr(n) in names:
+                n += 1
+            name = label_prefix + repr(n)
+            names.add(name)
+            labels[id(first)] = [name]
+        return labels[id(first)][0]
+
+    for position, i in enumerate(order):
+        block = region[i]
+        chunks += block.instructions
+        if i != position:
+            counts[moved] += 1
+        last = block.last()
+        kind = _exit(i, following.get(i), successor[i], target[i],
+                     weights)[0]
+        if kind == "invert":
+            source = dict(last.source)
+            source[i_opcode] = inverse_branches[source[i_opcode]]
+            source[i_label] = label_of(successor[i])
+            replacements.append((last, emit.instruction(source, last)))
+            counts[inverted] += 1
+        elif kind == "jump":
+            chunks.append(emit.instruction(
+                {i_opcode: "j", i_label: label_of(successor[i])},
+                last
+            ))
+            counts[jumps] += 1
+
+    layout.reorder(chunks, labels)
+    for old, new in replacements:
+        layout.replace(old, [new])
@@ -0,0 +1,80 @@
+from dlx_parser.grammar import i_opcode, i_rs1, i_immediate
+import instructions.operands as operands
+
+# instructions adding an immediate to a register
+add_ops = ("addi", "addui")
+# instructions subtracting an immediate from a register
+sub_ops = ("subi", "subui")
+# instructions whose immediate is sign extended from 16 bits, where the
+# others are zero extended
+signed_ops = ("addi", "subi")
+# range of the signed immediate field
+min_immediate = -0x8000
+max_immediate = 0x7fff
+
+
+# Returns a value as a signed 32 bit integer.
+# Input:
+#   value - The value.
+# Returns:
+#   int
+def signed(value):
+    value &= 0xffffffff
+    if value & 0x80000000:
+        value -= 0x100000000
+    return value
+
+
+# Returns true if a value fits in the signed immediate field.
+# Input:
+#   value - The value.
+# Returns:
+#   bool
+def fits_immediate(value):
+    return min_immediate <= value <= max_immediate
+
+
+# Returns the value of an immediate as the machine sees it: the low 16 bits
+# of the field, sign extended for signed instructions and zero extended for
+# the others.
+# Input:
+#   op - The instruction name.
+#   immediate - The immediate as written.
+# Returns:
+#   int
+def extend(op, immediate):
+    immediate &= 0xffff
+    if op in signed_ops and immediate & 0x8000:
+        immediate -= 0x10000
+    return immediate
+
+
+# Returns the constant written by an instruction that loads a constant into a
+# register, built with lhi, ori, and immediate adds and subtracts from r0 or
+# from registers holding known constants.
+# Input:
+#   instr - The instruction.
+#   known - Dictionary mapping registers to known constants.
+# Returns:
+#   The constant as a signed 32 bit integer, or None if it isn't known.
+def value(instr, known):
+    source = instr.source
+    op = source[i_opcode]
+    if i_immediate not in source:
+        return None
+    immediate = extend(op, source[i_immediate])
+    if op == "lhi":
+        return signed(immediate << 16)
+    if op not in add_ops and op not in sub_ops and op != "ori":
+        return None
+    if source[i_rs1] == operands.zero_register:
+        base = 0
+    elif source[i_rs1] in known:
+        base = known[source[i_rs1]]
+    else:
+        return None
+    if op in add_ops:
+        return signed(base + immediate)
+    if op in sub_ops:
+        return signed(base - immediate)
+    return signed(base | immediate)
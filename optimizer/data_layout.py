@@ -0,0 +1,166 @@
+from instructions.instruction import Instruction
+from memory.layout import label_entry, origin_entry, align_entry, \
+    space_entry, memory_entry, align
+
+
+# Returns true if a layout entry is data that may be moved.
+# Input:
+#   entry - The layout entry (kind, value).
+# Returns:
+#   bool
+def _is_data(entry):
+    kind, value = entry
+    if kind == memory_entry:
+        return not isinstance(value, Instruction)
+    return kind != origin_entry
+
+
+# Returns the alignment of a data object in bytes, which is that of its most
+# aligned align entry.
+# Input:
+#   entries - The layout entries of the object.
+# Returns:
+#   int
+def alignment(entries):
+    return max([1] + [
+        int(2**value) for kind, value in entries if kind == align_entry
+    ])
+
+
+# Splits a run of data entries into objects. Each object starts at a label,
+# taking the align entries just before the label with it. Entries before the
+# first label stay in place.
+# Input:
+#   entries - The layout entries of the run.
+# Returns:
+#   (entries before the first object, list of objects (lists of entries))
+def objects(entries):
+    head = []
+    found = []
+    aligns = []
+    for entry in entries:
+        kind = entry[0]
+        if kind == align_entry:
+            aligns.append(entry)
+            continue
+        # labels with nothing between them name the same object
+        if kind == label_entry and (
+                aligns or not found or
+                any(e[0] != label_entry for e in found[-1])):
+            found.append([])
+        current = found[-1] if found else head
+        current += aligns + [entry]
+        aligns = []
+    (found[-1] if found else head).extend(aligns)
+    return head, found
+
+
+# Returns the runs of data in a layout, which are separated by origins and
+# instructions. Labels and align entries at the end of a run belong to what
+# follows it.
+# Input:
+#   entries - The layout entries.
+# Returns:
+#   List of (index of the first entry, index after the last entry)
+def runs(entries):
+    found = []
+    start = None
+    for n, entry in enumerate(entries + [(origin_entry, None)]):
+        if _is_data(entry):
+            if start is None:
+                start = n
+        elif start is not None:
+            stop = n
+            while stop > start and \
+                    entries[stop - 1][0] in (label_entry, align_entry):
+                stop -= 1
+            found.append((start, stop))
+            start = None
+    return found
+
+
+# Places a data object at an address.
+# Input:
+#   entries - The layout entries of the object.
+#   address - The address at the start of the object.
+# Returns:
+#   (address after the object, bytes of padding)
+def place(entries, address):
+    padding = 0
+    for kind, value in entries:
+        if kind == align_entry:
+            aligned = align(address, value)
+            padding += aligned - address
+            address = aligned
+        elif kind == space_entry:
+            address += value
+        elif kind == memory_entry:
+            address += value.size
+    return address, padding
+
+
+# Returns the padding of a sequence of data objects at an address.
+# Input:
+#   found - The objects (lists of layout entries).
+#   address - The address at the start of the first object.
+# Returns:
+#   Bytes of padding.
+def total_padding(found, address):
+    padding = 0
+    for entries in found:
+        address, n = place(entries, address)
+        padding += n
+    return padding
+
+
+# Orders data objects by taking whichever needs the least padding at each
+# address, preferring the more aligned and then the larger objects, so that
+# small objects fill the gaps before aligned ones.
+# Input:
+#   found - The objects (lists of layout entries).
+#   address - The address at the start of the first object.
+# Returns:
+#   List of the objects in their new order.
+def fill(found, address):
+    remaining = list(found)
+    ordered = []
+
+    def cost(entries):
+        end, padding = place(entries, address)
+        return padding, -alignment(entries), address - end
+
+    while remaining:
+        best = min(remaining, key=cost)
+        remaining.remove(best)
+        ordered.append(best)
+        address = place(best, address)[0]
+    return ordered
+
+
+# Reorders the labeled data objects of each run of data to reduce the padding
+# between them, trying the objects from the most to the least aligned and a
+# gap filling order, and keeping the original order unless one of them is
+# better. This works when each object carries its own alignment (see the
+# assembler's auto align mode). Code must address the objects through their
+# labels. Pending edits must have been applied (see
+# memory.layout.Layout.assign), and addresses must be reassigned afterwards.
+# Input:
+#   layout - The program layout (see memory.layout).
+# Returns:
+#   The number of objects moved.
+def pack(layout):
+    moved = 0
+    entries = layout.entries
+    addresses = [address for _, _, address in layout.addresses()]
+    for start, stop in reversed(runs(entries)):
+        head, found = objects(entries[start:stop])
+        address = place(head, addresses[start])[0]
+        candidates = [
+            found,
+            sorted(found, key=lambda o: -alignment(o)),
+            fill(found, address)
+        ]
+        ordered = min(candidates, key=lambda o: total_padding(o, address))
+        moved += sum(1 for a, b in zip(found, ordered) if a is not b)
+        entries[start:stop] = head + [e for o in ordered for e in o]
+    return moved
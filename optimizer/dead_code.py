@@ -0,0 +1,162 @@
+import bisect
+from analysis import cfg
+from dlx_parser.grammar import i_opcode, i_label
+from instructions.instruction import Instruction
+import instructions.operands as operands
+
+# kinds of removal counts
+unreachable = "unreachable"
+dead_stores = "dead_stores"
+removal_kinds = [unreachable, dead_stores]
+
+# every register, which are all live wherever control leaves the analysed code
+all_registers = frozenset(
+    ["r" + repr(n) for n in range(1, 32)] + ["f" + repr(n) for n in range(32)]
+)
+
+
+# Returns the blocks reachable from the entry points. Labels used by
+# instructions other than branches and jumps may be the targets of jr and jalr,
+# so the blocks they name are entry points too.
+# Input:
+#   blocks - The control flow graph (see analysis.cfg.build_graph).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   entries - The addresses of the declared entry points.
+# Returns:
+#   Set of reachable blocks.
+def reachable(blocks, symbol_table, entries):
+    by_address = dict((b.address(), b) for b in blocks)
+    roots = set(entries)
+    for block in blocks:
+        for instr in block.instructions:
+            if cfg.target_address(instr, symbol_table) is None and \
+               instr.source.get(i_label) in symbol_table:
+                roots.add(symbol_table[instr.source[i_label]])
+    work = [by_address[a] for a in roots if a in by_address]
+    seen = set(work)
+    while work:
+        block = work.pop()
+        for following in block.successors + block.callees:
+            if following not in seen:
+                seen.add(following)
+                work.append(following)
+    return seen
+
+
+# Returns true if an instruction's only effect is writing its registers, so
+# that it may be removed when they are dead. Loads are kept for their memory
+# access.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def _removable(instr):
+    op = instr.source[i_opcode]
+    if op in operands.loads or op in operands.stores or \
+       operands.ends_block(instr):
+        return False
+    return len(operands.writes(instr)) > 0
+
+
+# Scans a block backwards from the registers live at its end.
+# Input:
+#   block - The basic block.
+#   live - The registers live at the end of the block.
+# Returns:
+#   (registers live at the start of the block, list of dead instructions)
+def _scan(block, live):
+    live = set(live)
+    dead = []
+    for instr in reversed(block.instructions):
+        writes = operands.writes(instr)
+        if _removable(instr) and not live.intersection(writes):
+            dead.append(instr)
+            continue
+        live.difference_update(writes)
+        live.update(operands.reads(instr))
+        # the callee, the caller, or the trap handler may read any register
+        if instr.source[i_opcode] in operands.calls or \
+           instr.source[i_opcode] in operands.barriers or \
+           instr.source[i_opcode] == "jr":
+            live.update(all_registers)
+    return live, dead
+
+
+# Returns the instructions of reachable blocks whose register writes are
+# always overwritten before being read. Dead instructions don't make the
+# registers they read live, so chains of dead writes are found together.
+# Input:
+#   blocks - The reachable blocks of the control flow graph.
+# Returns:
+#   List of dead instructions.
+def dead_writes(blocks):
+    live_in = dict((block, set()) for block in blocks)
+
+    def live_out(block):
+        if not block.successors:
+            return all_registers
+        live = set()
+        for following in block.successors:
+            # control leaving the analysed code may go anywhere
+            live.update(live_in.get(following, all_registers))
+        return live
+
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            live, _ = _scan(block, live_out(block))
+            if live != live_in[block]:
+                live_in[block] = live
+                changed = True
+    dead = []
+    for block in blocks:
+        dead += _scan(block, live_out(block))[1]
+    return dead
+
+
+# Removes the blocks unreachable from the entry points, then the register
+# writes that are never read. The program must not branch or jump to numeric
+# addresses, which would move. The layout is edited, and addresses must be
+# reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+#   entries - The addresses of the entry points.
+# Returns:
+#   (dictionary mapping each removal kind to the number of bytes removed,
+#    dictionary mapping label names to the number of bytes removed after
+#    them)
+def eliminate(program, symbol_table, layout, entries):
+    counts = dict((kind, 0) for kind in removal_kinds)
+    removed = {}
+    labels = cfg.labels_by_address(symbol_table)
+    addresses = sorted(labels)
+
+    # the nearest label at or before an instruction
+    def owner(instr):
+        n = bisect.bisect_right(addresses, instr.address)
+        if n == 0:
+            return "0x{0:08x}".format(instr.address)
+        return labels[addresses[n - 1]][0]
+
+    def remove(instr, kind):
+        layout.remove(instr)
+        counts[kind] += instr.size
+        name = owner(instr)
+        removed[name] = removed.get(name, 0) + instr.size
+
+    blocks = cfg.build_graph(program, symbol_table)
+    live = reachable(blocks, symbol_table, entries)
+    for block in blocks:
+        if block not in live:
+            for instr in block.instructions:
+                remove(instr, unreachable)
+    for instr in dead_writes([b for b in blocks if b in live]):
+        # a labeled instruction needs another to take the label
+        if instr.address in labels and not isinstance(
+                program.get(instr.address + instr.size), Instruction):
+            continue
+        remove(instr, dead_stores)
+    return counts, removed
@@ -0,0 +1,117 @@
+from analysis import cfg
+from analysis.dependence import DependenceGraph
+from dlx_parser.grammar import i_opcode, i_label
+from instructions.instruction import Instruction
+import instructions.operands as operands
+from optimizer import emit
+
+# ways a delay slot is filled
+from_before = "before"
+from_target = "target"
+with_nop = "nop"
+fill_kinds = [from_before, from_target, with_nop]
+
+
+# Returns true if an instruction is a branch or jump, which has a delay slot.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def _has_slot(instr):
+    op = instr.source[i_opcode]
+    return op in operands.branches or op in operands.jumps
+
+
+# Returns the instruction from before a branch that can be moved into its
+# delay slot. The instruction must not be read or written by anything after it
+# in the block, including the branch itself.
+# Input:
+#   block - The basic block ending in the branch.
+# Returns:
+#   The instruction, or None if there is none.
+def _before_candidate(block):
+    graph = DependenceGraph(block.instructions)
+    for i in reversed(range(len(block.instructions) - 1)):
+        instr = block.instructions[i]
+        if not graph.succs[i] and not operands.is_nop(instr):
+            return instr
+    return None
+
+
+# Returns the instruction at the target of a jump that can be copied into its
+# delay slot, with the jump redirected past it. Only unconditional jumps to a
+# label qualify, since the slot then always executes on the way to the target.
+# Input:
+#   jump - The jump instruction.
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   moved - Set of ids of instructions moved by the pass.
+# Returns:
+#   The instruction, or None if there is none.
+def _target_candidate(jump, program, symbol_table, moved):
+    if jump.source[i_opcode] not in operands.direct_jumps or \
+       i_label not in jump.source:
+        return None
+    target = program.get(symbol_table.get(jump.source[i_label]))
+    if not isinstance(target, Instruction) or id(target) in moved or \
+       operands.ends_block(target) or operands.is_nop(target):
+        return None
+    return target
+
+
+# Fills the delay slot after every branch and jump. A slot is filled by moving
+# an independent instruction from before the branch, by copying the first
+# instruction at the target of an unconditional jump, or with a nop. A nop
+# already following a branch is taken as an empty slot, which is kept when
+# nothing fills it. The program must not branch or jump to numeric
+# addresses, which would move. The layout is edited, and addresses must be
+# reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+# Returns:
+#   Dictionary mapping each fill kind to the number of slots filled that way.
+def fill_delay_slots(program, symbol_table, layout):
+    labels = cfg.labels_by_address(symbol_table)
+    targets = cfg.numeric_targets(program)
+    counts = dict((kind, 0) for kind in fill_kinds)
+    moved = set()
+    unfilled = []
+    for block in cfg.build_blocks(program, symbol_table):
+        branch = block.last()
+        if not _has_slot(branch):
+            continue
+        slot = program.get(branch.address + branch.size)
+        if not isinstance(slot, Instruction) or not operands.is_nop(slot) or \
+           slot.address in labels or slot.address in targets:
+            slot = None
+        candidate = _before_candidate(block)
+        if candidate is not None:
+            moved.add(id(candidate))
+            layout.remove(candidate)
+            if slot is None:
+                layout.insert_after(branch, candidate)
+            else:
+                layout.replace(slot, [candidate])
+            counts[from_before] += 1
+        else:
+            unfilled.append((branch, slot))
+
+    # instructions are copied from targets once the moves are known, so that
+    # the copied instruction stays at its label
+    for branch, slot in unfilled:
+        target = _target_candidate(branch, program, symbol_table, moved)
+        if target is not None:
+            fill = emit.instruction(target.source, target)
+            branch.target_offset = target.size
+            if slot is None:
+                layout.insert_after(branch, fill)
+            else:
+                layout.replace(slot, [fill])
+            counts[from_target] += 1
+        else:
+            if slot is None:
+                layout.insert_after(branch, emit.nop(branch))
+            counts[with_nop] += 1
+    return counts
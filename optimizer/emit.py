@@ -0,0 +1,39 @@
+from dlx_parser.grammar import i_opcode
+from instructions import instruction_table
+from instructions.instruction_table import InstructionType
+from instructions.i_type import IType
+from instructions.j_type import JType
+from instructions.r_type import RType
+
+# instruction type -> class
+classes = {
+    InstructionType.R: RType,
+    InstructionType.I: IType,
+    InstructionType.J: JType
+}
+
+
+# Creates an instruction generated by an optimization pass. The instruction
+# takes the address and source line of the instruction it replaces or
+# accompanies.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+#   like - The instruction to take the address and line from.
+# Returns:
+#   The instruction.
+# Throws:
+#   ValueError - Unknown instruction name.
+def instruction(source, like):
+    type_id = instruction_table.get_type(source[i_opcode])
+    instr = classes[type_id](like.address, source)
+    instr.line_no = like.line_no
+    return instr
+
+
+# Creates a nop.
+# Input:
+#   like - The instruction to take the address and line from.
+# Returns:
+#   The instruction.
+def nop(like):
+    return instruction({i_opcode: "nop"}, like)
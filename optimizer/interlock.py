@@ -0,0 +1,130 @@
+from analysis import cfg
+from analysis.hazards import PipelineState, raw_hazard, load_use_hazard, \
+    waw_hazard, structural_hazard
+from dlx_parser.grammar import i_opcode, i_label
+import instructions.operands as operands
+from optimizer import emit
+
+# kinds of hazards covered by nops
+nop_kinds = [raw_hazard, load_use_hazard, waw_hazard, structural_hazard]
+
+
+# Returns the blocks control may arrive from at each block. Return sites are
+# also entered from every return, and blocks whose labels are used by other
+# instructions from every jr and jalr.
+# Input:
+#   blocks - The control flow graph (see analysis.cfg.build_graph).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   Dictionary mapping blocks to lists of blocks.
+def predecessors(blocks, symbol_table):
+    preds = dict((block, []) for block in blocks)
+    by_address = dict((b.address(), b) for b in blocks)
+    returns = [b for b in blocks if cfg.returns(b.last())]
+    indirect = [b for b in blocks if b.last().source[i_opcode] in
+                ("jr", "jalr")]
+    for block in blocks:
+        for following in block.successors + block.callees:
+            preds[following].append(block)
+        if block.last().source[i_opcode] in ("jal", "jalr"):
+            for following in block.successors:
+                preds[following] += returns
+        for instr in block.instructions:
+            if cfg.target_address(instr, symbol_table) is None and \
+               instr.source.get(i_label) in symbol_table:
+                target = by_address.get(symbol_table[instr.source[i_label]])
+                if target is not None:
+                    preds[target] += indirect
+    return preds
+
+
+# Returns the delay slot instruction after each block ending in a branch or
+# jump, which is the first instruction of the next block in address order.
+# Input:
+#   blocks - The basic blocks in address order.
+# Returns:
+#   Dictionary mapping blocks to their slot instructions.
+def delay_slots(blocks):
+    slots = {}
+    for n, block in enumerate(blocks[:-1]):
+        last = block.last()
+        op = last.source[i_opcode]
+        if (op in operands.branches or op in operands.jumps) and \
+           blocks[n + 1].address() == last.address + last.size:
+            slots[block] = blocks[n + 1].instructions[0]
+    return slots
+
+
+# Issues the instructions of a block without stalls. With delay slots the
+# slot after the block's branch issues in its shadow, as part of the block,
+# and is skipped at the start of the next block. Nops for a stalled slot go
+# before the branch, so that nothing comes between the branch and its slot.
+# Input:
+#   block - The basic block.
+#   state - The pipeline state at the start of the block, which is updated.
+#   slots - Delay slot instructions of blocks (see delay_slots).
+#   slot_ids - Ids of all the slot instructions.
+# Returns:
+#   List of (instruction the nops go before, hazard delaying it).
+def _issue(block, state, slots, slot_ids):
+    hazards = []
+    for instr in block.instructions:
+        if id(instr) in slot_ids:
+            continue
+        hazard = state.issue(instr)
+        if hazard is not None and hazard.cycles > 0:
+            hazards.append((instr, hazard))
+    if block in slots:
+        hazard = state.issue(slots[block])
+        if hazard is not None and hazard.cycles > 0:
+            hazards.append((block.last(), hazard))
+    return hazards
+
+
+# Inserts the nops a pipeline without interlocks needs between dependent
+# instructions, which are the stalls the pipeline model predicts. The state at
+# the start of each block merges the states at the end of every block control
+# may arrive from, so the nops cover all paths. The nops go after any labels
+# on the delayed instruction. The program must not branch or jump to numeric
+# addresses, which would move. For a program assembled with delay slots the
+# slot after each branch and jump stays directly after it. The layout is
+# edited, and addresses must be reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+#   model - The pipeline model (see analysis.pipeline).
+#   has_slots - True if branches and jumps have a delay slot.
+# Returns:
+#   Dictionary mapping each hazard kind to the number of nops inserted.
+def insert_nops(program, symbol_table, layout, model, has_slots=False):
+    blocks = cfg.build_graph(program, symbol_table)
+    preds = predecessors(blocks, symbol_table)
+    slots = delay_slots(blocks) if has_slots else {}
+    slot_ids = set(id(instr) for instr in slots.itervalues())
+    entry = dict((block, PipelineState(model)) for block in blocks)
+    exits = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            state = entry[block]
+            before = state.key()
+            for pred in preds[block]:
+                if pred in exits:
+                    state.merge(exits[pred])
+            if block in exits and state.key() == before:
+                continue
+            end = state.copy()
+            _issue(block, end, slots, slot_ids)
+            exits[block] = end.entering()
+            changed = True
+
+    counts = dict((kind, 0) for kind in nop_kinds)
+    for block in blocks:
+        for instr, hazard in _issue(block, entry[block].copy(), slots,
+                                    slot_ids):
+            for _ in range(hazard.cycles):
+                layout.insert_before(instr, emit.nop(instr))
+            counts[hazard.kind] += hazard.cycles
+    return counts
@@ -0,0 +1,215 @@
+from analysis import cfg
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2, i_immediate, \
+    i_label
+from instructions.instruction import Instruction
+import instructions.operands as operands
+from optimizer import constants, emit
+
+# kinds of rewrites
+moves = "moves"
+nops = "nops"
+folds = "folds"
+chains = "chains"
+zero_writes = "zero_writes"
+rewrite_kinds = [moves, nops, folds, chains, zero_writes]
+
+# r-type instructions that copy a register when the second source is r0
+copy_r_ops = ("add", "addu", "sub", "subu", "or", "xor", "sll", "srl", "sra")
+# r-type instructions that also copy a register when the first source is r0
+commutative_ops = ("add", "addu", "or", "xor")
+# i-type instructions that copy a register when the immediate is 0
+copy_i_ops = ("addi", "addui", "subi", "subui", "ori", "xori", "slli", "srli",
+              "srai")
+# floating point register moves
+fp_moves = ("movf", "movd")
+
+
+# Returns the register copied by an instruction that only moves a register.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   The source register name, or None if the instruction is not a move.
+def _copy_source(instr):
+    source = instr.source
+    op = source[i_opcode]
+    if op in fp_moves:
+        return source[i_rs1]
+    if op in copy_r_ops:
+        if source[i_rs2] == operands.zero_register:
+            return source[i_rs1]
+        if op in commutative_ops and source[i_rs1] == operands.zero_register:
+            return source[i_rs2]
+    elif op in copy_i_ops and source.get(i_immediate) == 0:
+        return source[i_rs1]
+    return None
+
+
+# Returns true if an instruction only writes r0, so that it has no effect.
+# Loads are kept for their memory access.
+# Input:
+#   instr - The instruction.
+# Returns:
+#   bool
+def _writes_zero(instr):
+    op = instr.source[i_opcode]
+    if op in operands.loads or op in operands.stores or \
+       operands.ends_block(instr):
+        return False
+    return instr.source.get(i_rd) == operands.zero_register
+
+
+# Returns the label that a branch or jump to a label finally reaches, following
+# unconditional jumps and skipping nops. A loop of jumps is left alone.
+# Input:
+#   label - The label.
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   The final label name.
+def _final_label(label, program, symbol_table):
+    seen = set([label])
+    while True:
+        target = program.get(symbol_table.get(label))
+        while isinstance(target, Instruction) and operands.is_nop(target):
+            target = program.get(target.address + target.size)
+        if not isinstance(target, Instruction) or \
+           target.source[i_opcode] != "j" or \
+           target.source.get(i_label) not in symbol_table or \
+           target.source[i_label] in seen:
+            return label
+        label = target.source[i_label]
+        seen.add(label)
+
+
+# Points branches and jumps to a jump directly at the final target.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   The number of branches and jumps changed.
+def collapse_chains(program, symbol_table):
+    count = 0
+    for address in sorted(program):
+        instr = program[address]
+        if not isinstance(instr, Instruction) or i_label not in instr.source:
+            continue
+        op = instr.source[i_opcode]
+        if op not in operands.branches and op not in operands.direct_jumps:
+            continue
+        label = _final_label(instr.source[i_label], program, symbol_table)
+        if label == instr.source[i_label]:
+            continue
+        # branch offsets must stay within the immediate field
+        offset = symbol_table[label] - (instr.address + instr.size)
+        if op in operands.branches and not constants.fits_immediate(offset):
+            continue
+        instr.source = dict(instr.source)
+        instr.source[i_label] = label
+        count += 1
+    return count
+
+
+# Rewrites the instructions of a program. Removes nops, moves of a register to
+# itself or repeated moves, and instructions that only write r0. Folds
+# constants built from other known constants into a single addi from r0,
+# removing the earlier definition when it is overwritten before being read.
+# Collapses chains of branches and jumps. Labels on removed instructions move
+# to the instruction that follows. The layout is edited, and addresses must
+# be reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+# Returns:
+#   Dictionary mapping each rewrite kind to the number of rewrites.
+def optimize(program, symbol_table, layout):
+    counts = dict((kind, 0) for kind in rewrite_kinds)
+    counts[chains] = collapse_chains(program, symbol_table)
+    labels = cfg.labels_by_address(symbol_table)
+    targets = cfg.numeric_targets(program)
+
+    # numeric branch targets stay, and so do labeled instructions that aren't
+    # followed by another instruction to take the label
+    def removable(instr):
+        if instr.address in targets:
+            return False
+        if instr.address in labels:
+            following = program.get(instr.address + instr.size)
+            return isinstance(following, Instruction)
+        return True
+
+    for block in cfg.build_blocks(program, symbol_table):
+        _optimize_block(block, layout, removable, counts)
+    return counts
+
+
+# Rewrites the instructions of a basic block.
+# Input:
+#   block - The basic block.
+#   layout - The program layout.
+#   removable - Function returning true if an instruction may be removed.
+#   counts - Dictionary of rewrite counts, which is updated.
+# Returns:
+#   n/a
+def _optimize_block(block, layout, removable, counts):
+    # register -> constant value
+    known = {}
+    # register -> constant definition not yet read
+    unread = {}
+    # register -> register it holds a copy of
+    copies = {}
+    for instr in block.instructions:
+        current = instr
+        kind = None
+        copied = _copy_source(instr)
+        if operands.is_nop(instr):
+            kind = nops
+        elif _writes_zero(instr):
+            kind = zero_writes
+        elif copied is not None and (copied == instr.source[i_rd] or
+                                     copies.get(instr.source[i_rd]) == copied):
+            kind = moves
+        if kind is not None and removable(instr):
+            layout.remove(instr)
+            counts[kind] += 1
+            continue
+
+        value = constants.value(instr, known)
+        if value is not None:
+            dest = instr.source[i_rd]
+            if known.get(dest) == value and removable(instr):
+                layout.remove(instr)
+                counts[folds] += 1
+                continue
+            if operands.reads(instr) and constants.fits_immediate(value):
+                folded = emit.instruction({
+                    i_opcode: "addi",
+                    i_rd: dest,
+                    i_rs1: operands.zero_register,
+                    i_immediate: value
+                }, instr)
+                layout.replace(instr, [folded])
+                counts[folds] += 1
+                if instr.source[i_rs1] == dest and dest in unread and \
+                   removable(unread[dest]):
+                    layout.remove(unread[dest])
+                    del unread[dest]
+                current = folded
+
+        for reg in operands.reads(current):
+            unread.pop(reg, None)
+        for reg in operands.writes(current):
+            known.pop(reg, None)
+            unread.pop(reg, None)
+            copies.pop(reg, None)
+            for dest, src in copies.items():
+                if src == reg:
+                    del copies[dest]
+        if value is not None:
+            known[current.source[i_rd]] = value
+            # the layout edits are keyed by the original instruction
+            unread[current.source[i_rd]] = instr
+        elif copied is not None and copied != instr.source[i_rd] and \
+                instr.source[i_opcode] != "movd":
+            # double moves are only removed when they copy to themselves
+            copies[instr.source[i_rd]] = copied
@@ -0,0 +1,274 @@
+import os
+import tempfile
+from analysis import cfg
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2, i_immediate
+import instructions.operands as operands
+from optimizer import alu, emit
+
+# longest window of instructions looked up in the database
+max_window = 5
+# version of the database format, bumped when the format or the semantics of
+# the searched instructions change so older results aren't reused
+database_version = 3
+# separates the key of a window with no better sequence from the longest
+# sequence length searched
+length_separator = " / length "
+# kinds of rewrite counts
+rewritten = "rewritten"
+bytes_saved = "bytes_saved"
+
+
+# Returns an instruction source as assembly text.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+# Returns:
+#   String
+def text(source):
+    args = [source[f] for f in (i_rd, i_rs1, i_rs2) if f in source]
+    if i_immediate in source:
+        args.append(repr(source[i_immediate]))
+    return source[i_opcode] + " " + ", ".join(args)
+
+
+# Returns the registers of a window in order of first appearance, excluding
+# r0.
+# Input:
+#   window - The instruction sources.
+# Returns:
+#   List of register names.
+def registers(window):
+    regs = []
+    for source in window:
+        for field in (i_rd, i_rs1, i_rs2):
+            reg = source.get(field)
+            if reg is not None and reg != operands.zero_register and \
+               reg not in regs:
+                regs.append(reg)
+    return regs
+
+
+# Returns an instruction source with its registers renamed.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+#   names - Dictionary mapping old register names to new ones.
+# Returns:
+#   The new source.
+def rename(source, names):
+    renamed = dict(source)
+    for field in (i_rd, i_rs1, i_rs2):
+        if field in renamed:
+            renamed[field] = names.get(renamed[field], renamed[field])
+    return renamed
+
+
+# Returns the registers written by a window that may be read after it. A
+# register is dead only if it is written before being read in the rest of the
+# block.
+# Input:
+#   window - The instruction sources.
+#   following - The instructions after the window in its block.
+# Returns:
+#   Set of register names.
+def live_out(window, following):
+    written = set(
+        s[i_rd] for s in window if s[i_rd] != operands.zero_register
+    )
+    live = set()
+    for instr in following:
+        for reg in operands.reads(instr):
+            if reg in written:
+                live.add(reg)
+                written.discard(reg)
+        for reg in operands.writes(instr):
+            written.discard(reg)
+    return live | written
+
+
+# Returns the database key of a window. Registers are renamed r1, r2, ... in
+# order of appearance, so windows that differ only in their registers share a
+# key.
+# Input:
+#   window - The instruction sources.
+#   live - The registers written by the window that are read after it.
+# Returns:
+#   (key string, dictionary mapping window registers to key registers)
+def canonical(window, live):
+    names = dict(
+        (reg, "r" + repr(n + 1)) for n, reg in enumerate(registers(window))
+    )
+    key = "; ".join(text(rename(s, names)) for s in window)
+    key += " / live " + ", ".join(sorted(names[r] for r in live))
+    return key, names
+
+
+# Returns an instruction source read from JSON, whose strings are unicode.
+# Input:
+#   source - The decoded source.
+# Returns:
+#   The instruction's source as defined in the grammar.
+def _from_json(source):
+    return dict(
+        (str(k), str(v) if isinstance(v, basestring) else v)
+        for k, v in source.iteritems()
+    )
+
+
+# Equivalent replacements for short windows of instructions, found by the
+# superoptimizer and stored in a JSON file. Windows with no better
+# replacement are stored too, with the longest sequence length searched in
+# their key, so they are searched again only at longer lengths.
+class RewriteDatabase(object):
+    # Input:
+    #   path - The database file.
+    def __init__(self, path):
+        self.path = path
+        # key -> list of instruction sources, or key and length_separator and
+        # length -> None
+        self.rewrites = {}
+        # key -> longest sequence length searched without a result
+        self.searched_lengths = {}
+
+    # Loads the database. A missing file is an empty database.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - The file couldn't be read.
+    #   ValueError - The file isn't a rewrite database.
+    def load(self):
+        import json
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or \
+           data.get("version") != database_version:
+            raise ValueError("unsupported rewrite database " + self.path)
+        for key, replacement in data["rewrites"].iteritems():
+            if replacement is not None:
+                self.put(str(key),
+                         [_from_json(source) for source in replacement])
+                continue
+            window, _, length = str(key).rpartition(length_separator)
+            try:
+                self.put(window, None, int(length))
+            except ValueError:
+                raise ValueError("invalid rewrite database key " + key)
+
+    # Writes the database, replacing the file atomically.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError, OSError - The file couldn't be written.
+    def save(self):
+        import json
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {"version": database_version, "rewrites": self.rewrites},
+                    f,
+                    indent=1,
+                    sort_keys=True
+                )
+            os.rename(temp, self.path)
+        except (IOError, OSError):
+            os.remove(temp)
+            raise
+
+    # Returns true if a window has been searched for sequences of a length.
+    # Input:
+    #   key - The window's key (see canonical).
+    #   length - The longest sequence length.
+    # Returns:
+    #   bool
+    def searched(self, key, length):
+        return self.rewrites.get(key) is not None or \
+            self.searched_lengths.get(key, 0) >= length
+
+    # Returns the replacement for a window.
+    # Input:
+    #   key - The window's key (see canonical).
+    # Returns:
+    #   List of instruction sources, or None if there is none.
+    def lookup(self, key):
+        return self.rewrites.get(key)
+
+    # Records the result of searching a window.
+    # Input:
+    #   key - The window's key (see canonical).
+    #   replacement - List of instruction sources in key registers, or None if
+    #                 there is no better sequence.
+    #   length - The longest sequence length searched.
+    # Returns:
+    #   n/a
+    def put(self, key, replacement, length=0):
+        if replacement is not None:
+            self.rewrites[key] = replacement
+            return
+        previous = self.searched_lengths.get(key)
+        if previous is not None:
+            del self.rewrites[key + length_separator + repr(previous)]
+        length = max(length, previous or 0)
+        self.searched_lengths[key] = length
+        self.rewrites[key + length_separator + repr(length)] = None
+
+
+# Returns the windows of integer alu instructions in a basic block.
+# Input:
+#   block - The basic block.
+#   start - Index of the first instruction of the windows.
+#   size - Longest window.
+# Returns:
+#   List of windows (lists of instructions), longest first.
+def windows(block, start, size=max_window):
+    instrs = block.instructions
+    end = start
+    while end < len(instrs) and end - start < size and \
+            alu.is_alu(instrs[end].source):
+        end += 1
+    return [instrs[start:n] for n in range(end, start + 1, -1)]
+
+
+# Replaces windows of instructions that have a better sequence in the
+# database, trying the longest window first at each instruction. The layout
+# is edited, and addresses must be reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+#   database - The rewrite database.
+# Returns:
+#   Dictionary with the number of windows rewritten and bytes saved.
+def apply(program, symbol_table, layout, database):
+    counts = {rewritten: 0, bytes_saved: 0}
+    for block in cfg.build_blocks(program, symbol_table):
+        index = 0
+        while index < len(block.instructions):
+            step = 1
+            for window in windows(block, index):
+                sources = [instr.source for instr in window]
+                following = block.instructions[index + len(window):]
+                key, names = canonical(sources, live_out(sources, following))
+                replacement = database.lookup(key)
+                if replacement is None:
+                    continue
+                originals = dict((v, k) for k, v in names.iteritems())
+                chunks = [
+                    emit.instruction(rename(s, originals), window[0])
+                    for s in replacement
+                ]
+                layout.replace(window[0], chunks)
+                for instr in window[1:]:
+                    layout.remove(instr)
+                counts[rewritten] += 1
+                counts[bytes_saved] += sum(i.size for i in window) - \
+                    sum(i.size for i in chunks)
+                step = len(window)
+                break
+            index += step
+    return counts
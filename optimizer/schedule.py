@@ -0,0 +1,91 @@
+from analysis import cfg, hazards
+from analysis.dependence import DependenceGraph
+import instructions.operands as operands
+
+
+# Returns the length of the longest chain of dependent instructions from each
+# instruction to the end of a block, in cycles. Instructions on long chains
+# are scheduled first.
+# Input:
+#   graph - The dependence graph.
+#   model - The pipeline model.
+# Returns:
+#   List of heights, by instruction index.
+def _heights(graph, model):
+    heights = [0] * len(graph.instrs)
+    for i in reversed(range(len(graph.instrs))):
+        for j in graph.succs[i]:
+            distance = 1
+            if (i, j) in graph.flow:
+                distance = model.distance(graph.instrs[i])
+            heights[i] = max(heights[i], distance + heights[j])
+    return heights
+
+
+# Reorders the instructions of a basic block with list scheduling. Each cycle
+# the ready instruction that can issue earliest is chosen, preferring
+# instructions on the longest dependence chain. An instruction ending the
+# block stays last.
+# Input:
+#   block - The basic block.
+#   state - The pipeline state on entry to the block (see analysis.hazards),
+#           which is advanced through the block.
+#   model - The pipeline model.
+# Returns:
+#   The instructions in their new order.
+def schedule_block(block, state, model):
+    body = block.instructions
+    terminal = None
+    if operands.ends_block(block.last()):
+        body = body[:-1]
+        terminal = block.last()
+    graph = DependenceGraph(body)
+    heights = _heights(graph, model)
+    waiting = [len(p) for p in graph.preds]
+    ready = [i for i in range(len(body)) if waiting[i] == 0]
+    order = []
+    while ready:
+        best = min(ready, key=lambda i: (
+            state.earliest(body[i])[0], -heights[i], i
+        ))
+        ready.remove(best)
+        state.issue(body[best])
+        order.append(body[best])
+        for j in graph.succs[best]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                ready.append(j)
+    if terminal is not None:
+        state.issue(terminal)
+        order.append(terminal)
+    return order
+
+
+# Schedules the instructions of each basic block of a program to hide load
+# and floating point latencies. Blocks keep their addresses, so labels are
+# unaffected.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout, which is edited with the new order.
+#   model - The pipeline model (see analysis.pipeline).
+# Returns:
+#   n/a
+def schedule(program, symbol_table, layout, model):
+    state = hazards.PipelineState(model)
+    prev = None
+    for block in cfg.build_blocks(program, symbol_table):
+        if prev is None or not hazards.falls_through(prev.last(), block):
+            state.reset()
+        original = state.copy()
+        order = schedule_block(block, state, model)
+        # keep the original order unless scheduling saves cycles
+        for instr in block.instructions:
+            original.issue(instr)
+        if original.cycle <= state.cycle:
+            state = original
+        else:
+            layout.replace(block.instructions[0], order)
+            for instr in block.instructions[1:]:
+                layout.remove(instr)
+        prev = block
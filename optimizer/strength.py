@@ -0,0 +1,285 @@
+from analysis import cfg
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2, i_immediate
+import instructions.operands as operands
+from optimizer import alu, constants, emit
+
+# kinds of reductions
+multiplies = "multiplies"
+divides = "divides"
+reduction_kinds = [multiplies, divides]
+
+# integer multiplies and divides, which run on the floating point unit
+mult_ops = ("mult", "multu")
+div_ops = ("div", "divu")
+unsigned_ops = ("multu", "divu")
+# longest shift and add sequence that replaces a multiply or divide
+max_length = 6
+
+
+# Returns the source of an r-type instruction.
+# Input:
+#   op - The instruction name.
+#   rd - The destination register.
+#   rs1 - The first source register.
+#   rs2 - The second source register.
+# Returns:
+#   Instruction source as defined in the grammar.
+def _r(op, rd, rs1, rs2):
+    return {i_opcode: op, i_rd: rd, i_rs1: rs1, i_rs2: rs2}
+
+
+# Returns the source of an i-type instruction.
+# Input:
+#   op - The instruction name.
+#   rd - The destination register.
+#   rs1 - The source register.
+#   immediate - The immediate value.
+# Returns:
+#   Instruction source as defined in the grammar.
+def _i(op, rd, rs1, immediate):
+    return {i_opcode: op, i_rd: rd, i_rs1: rs1, i_immediate: immediate}
+
+
+# Returns the non-adjacent form of a positive number, which has the fewest
+# non-zero digits of any signed binary form.
+# Input:
+#   n - The number.
+# Returns:
+#   List of digits (-1, 0, or 1), least significant first.
+def _naf(n):
+    digits = []
+    while n:
+        if n & 1:
+            digit = 2 - (n & 3)
+            n -= digit
+        else:
+            digit = 0
+        digits.append(digit)
+        n >>= 1
+    return digits
+
+
+# Returns the log base 2 of a power of two.
+# Input:
+#   n - The number.
+# Returns:
+#   The exponent, or None if n isn't a power of two.
+def _log2(n):
+    if n <= 0 or n & (n - 1):
+        return None
+    return n.bit_length() - 1
+
+
+# Returns a sequence of shifts, adds, and subtracts that multiplies a register
+# by a constant. The adds and subtracts are unsigned, which wrap like mult
+# does instead of trapping on overflow. The destination holds the partial
+# product, so it must differ from the source unless the constant is a power
+# of two.
+# Input:
+#   dest - The destination register.
+#   src - The source register.
+#   c - The constant, as a signed 32 bit integer.
+# Returns:
+#   List of instruction sources, or None if there is no sequence.
+def multiply_sequence(dest, src, c):
+    zero = operands.zero_register
+    if c == 0:
+        return [_r("addu", dest, zero, zero)]
+    n = abs(c)
+    if n >= 0x80000000:
+        return None
+    if _log2(n) is None and dest == src:
+        return None
+    seq = []
+    current = src
+    shift = 0
+    # Horner's rule from the leading 1 digit
+    for digit in reversed(_naf(n)[:-1]):
+        shift += 1
+        if digit:
+            seq.append(_i("slli", dest, current, shift))
+            seq.append(_r("addu" if digit > 0 else "subu", dest, dest, src))
+            current = dest
+            shift = 0
+    if shift:
+        seq.append(_i("slli", dest, current, shift))
+    elif not seq:
+        seq.append(_r("addu", dest, src, zero))
+    if c < 0:
+        seq.append(_r("subu", dest, zero, dest))
+    return seq
+
+
+# Returns a sequence of shifts and adds that divides a register by a power of
+# two constant. Signed division rounds toward zero, so negative dividends are
+# biased by the divisor less one before the shift. Adds and subtracts are
+# unsigned, as in multiply_sequence.
+# Input:
+#   dest - The destination register.
+#   src - The source register.
+#   c - The constant, as a signed 32 bit integer.
+#   unsigned - True for an unsigned divide.
+# Returns:
+#   List of instruction sources, or None if there is no sequence.
+def divide_sequence(dest, src, c, unsigned):
+    zero = operands.zero_register
+    if unsigned:
+        k = _log2(c & 0xffffffff)
+        if k is None:
+            return None
+        return [_i("srli", dest, src, k)]
+    k = _log2(abs(c))
+    if k is None or k == 31:
+        return None
+    if k == 0:
+        seq = [_r("addu", dest, src, zero)]
+    elif dest == src:
+        return None
+    elif k == 1:
+        seq = [
+            _i("srli", dest, src, 31),
+            _r("addu", dest, dest, src),
+            _i("srai", dest, dest, 1)
+        ]
+    else:
+        seq = [
+            _i("srai", dest, src, 31),
+            _i("srli", dest, dest, 32 - k),
+            _r("addu", dest, dest, src),
+            _i("srai", dest, dest, k)
+        ]
+    if c < 0:
+        seq.append(_r("subu", dest, zero, dest))
+    return seq
+
+
+# Returns the constant an instruction writes to its destination, checked
+# against the value the machine computes for it, since a wrong constant would
+# be built into the replacement sequences.
+# Input:
+#   instr - The instruction.
+#   known - Dictionary mapping registers to known constants.
+# Returns:
+#   The constant as a signed 32 bit integer, or None if it isn't known.
+def _constant(instr, known):
+    value = constants.value(instr, known)
+    if value is None or not alu.is_alu(instr.source):
+        return None
+    regs = dict((reg, c & 0xffffffff) for reg, c in known.iteritems())
+    if constants.signed(alu.evaluate(instr.source, regs, 32)) != value:
+        return None
+    return value
+
+
+# Returns true if a register may be read after a point in a block, before it
+# is written. Registers are assumed live at the end of the block.
+# Input:
+#   reg - The register name.
+#   instrs - The instructions after the point.
+# Returns:
+#   bool
+def _live_after(reg, instrs):
+    for instr in instrs:
+        if reg in operands.reads(instr):
+            return True
+        if reg in operands.writes(instr):
+            return False
+    return True
+
+
+# Replaces integer multiplies and divides by constants with shift and add
+# sequences. A multiply or divide qualifies when one operand was moved from a
+# general register with movi2fp, the other holds a known constant, and the
+# result is moved back with movfp2i. The sequence takes the place of the
+# movfp2i, and the result is moved to the floating point register again only
+# if it is used afterwards. The layout is edited, and addresses must be
+# reassigned afterwards.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+#   layout - The program layout (see memory.layout).
+# Returns:
+#   Dictionary mapping each reduction kind to the number of instructions
+#   replaced.
+def reduce(program, symbol_table, layout):
+    counts = dict((kind, 0) for kind in reduction_kinds)
+    for block in cfg.build_blocks(program, symbol_table):
+        _reduce_block(block, layout, counts)
+    return counts
+
+
+# Replaces the multiplies and divides by constants in a basic block.
+# Input:
+#   block - The basic block.
+#   layout - The program layout.
+#   counts - Dictionary of reduction counts, which is updated.
+# Returns:
+#   n/a
+def _reduce_block(block, layout, counts):
+    instrs = block.instructions
+    # general register -> constant value
+    known = {}
+    # floating point register -> constant value
+    fp_known = {}
+    # floating point register -> general register it was moved from
+    fp_copies = {}
+    # floating point result -> (multiply or divide, general register operand,
+    #                           constant operand)
+    pending = {}
+    for index, instr in enumerate(instrs):
+        source = instr.source
+        op = source[i_opcode]
+        value = _constant(instr, known)
+        if op == "movfp2i" and source[i_rs1] in pending:
+            product, src, c = pending[source[i_rs1]]
+            product_op = product.source[i_opcode]
+            if product_op in mult_ops:
+                seq = multiply_sequence(source[i_rd], src, c)
+                kind = multiplies
+            else:
+                seq = divide_sequence(source[i_rd], src, c,
+                                      product_op in unsigned_ops)
+                kind = divides
+            if seq is not None and len(seq) <= max_length:
+                chunks = [emit.instruction(s, instr) for s in seq]
+                if _live_after(source[i_rs1], instrs[index + 1:]):
+                    chunks.append(emit.instruction({
+                        i_opcode: "movi2fp",
+                        i_rd: source[i_rs1],
+                        i_rs1: source[i_rd]
+                    }, instr))
+                layout.remove(product)
+                layout.replace(instr, chunks)
+                counts[kind] += 1
+
+        # a result used other than by movfp2i keeps its multiply or divide
+        for reg in operands.reads(instr):
+            pending.pop(reg, None)
+        for reg in operands.writes(instr):
+            known.pop(reg, None)
+            fp_known.pop(reg, None)
+            fp_copies.pop(reg, None)
+            pending.pop(reg, None)
+            for fp_reg, gpr in fp_copies.items():
+                if gpr == reg:
+                    del fp_copies[fp_reg]
+            for fp_reg, (_, gpr, _) in pending.items():
+                if gpr == reg:
+                    del pending[fp_reg]
+
+        if value is not None:
+            known[source[i_rd]] = value
+        elif op == "movi2fp":
+            gpr = source[i_rs1]
+            if gpr == operands.zero_register:
+                fp_known[source[i_rd]] = 0
+            elif gpr in known:
+                fp_known[source[i_rd]] = known[gpr]
+            fp_copies[source[i_rd]] = gpr
+        elif op in mult_ops or op in div_ops:
+            a = source[i_rs1]
+            b = source[i_rs2]
+            if b in fp_known and a in fp_copies:
+                pending[source[i_rd]] = (instr, fp_copies[a], fp_known[b])
+            elif op in mult_ops and a in fp_known and b in fp_copies:
+                pending[source[i_rd]] = (instr, fp_copies[b], fp_known[a])
@@ -0,0 +1,349 @@
+import itertools
+import random
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_rs2, i_immediate
+import instructions.operands as operands
+from optimizer import alu, rewrites
+
+# width of the registers
+word_width = 32
+# number of test vectors candidates are filtered with during the search
+search_vectors = 4
+# number of random test vectors a candidate is verified with
+verify_vectors = 256
+# most input bits checked exhaustively, which sets the reduced width
+exhaustive_bits = 16
+# most candidates a search task returns for verification
+max_results = 8
+# number of tasks each search is split into for a pool of workers
+pool_tasks = 64
+# values likely to expose differences between sequences, including those at
+# the edges of sign extended 16 bit immediates
+edge_values = (0, 1, 0x7fffffff, 0x80000000, 0xffffffff, 0x7fff, 0x8000,
+               0xffff8000)
+
+
+# Returns the registers a window reads before writing them.
+# Input:
+#   window - The instruction sources.
+# Returns:
+#   List of register names.
+def live_in(window):
+    regs = []
+    written = set()
+    for source in window:
+        for field in (i_rs1, i_rs2):
+            reg = source.get(field)
+            if reg is not None and reg != operands.zero_register and \
+               reg not in written and reg not in regs:
+                regs.append(reg)
+        written.add(source[i_rd])
+    return regs
+
+
+# Returns the registers a window writes.
+# Input:
+#   window - The instruction sources.
+# Returns:
+#   List of register names.
+def written(window):
+    regs = []
+    for source in window:
+        reg = source[i_rd]
+        if reg != operands.zero_register and reg not in regs:
+            regs.append(reg)
+    return regs
+
+
+# Returns the cost of a sequence, which is its length and then the length of
+# its longest chain of dependent instructions.
+# Input:
+#   sequence - The instruction sources.
+# Returns:
+#   (length, depth)
+def cost(sequence):
+    ready = {}
+    depth = 0
+    for source in sequence:
+        start = max([0] + [
+            ready.get(source.get(field), 0) for field in (i_rs1, i_rs2)
+        ])
+        ready[source[i_rd]] = start + 1
+        depth = max(depth, start + 1)
+    return len(sequence), depth
+
+
+# Returns the immediates a replacement may use: 0 and 1, those of the
+# window, and for each instruction with an immediate that reads the result of
+# another, the sum and differences of their immediates and, if it is a shift,
+# the other's immediate shifted by it. These let a chain of instructions with
+# immediates become one instruction.
+# Input:
+#   window - The instruction sources.
+# Returns:
+#   Sorted list of immediates.
+def constants(window):
+    values = set([0, 1])
+    for n, source in enumerate(window):
+        if i_immediate not in source:
+            continue
+        b = source[i_immediate]
+        values.add(b)
+        for earlier in window[:n]:
+            if i_immediate not in earlier or \
+               earlier[i_rd] not in (source.get(i_rs1), source.get(i_rs2)):
+                continue
+            a = earlier[i_immediate]
+            values.update((a + b, a - b, b - a))
+            if source[i_opcode] in alu.shift_i_ops and 0 <= b < word_width:
+                values.update((a << b, a >> b))
+    return sorted(values)
+
+
+# Returns the instructions a replacement may be built from. Destinations are
+# the registers the window writes, sources are the registers it uses and r0,
+# and immediates are those of constants.
+# Input:
+#   window - The instruction sources.
+# Returns:
+#   List of instruction sources.
+def candidates(window):
+    dests = written(window)
+    srcs = rewrites.registers(window) + [operands.zero_register]
+    immediates = constants(window)
+    result = []
+    for op in alu.r_ops:
+        for rd, rs1, rs2 in itertools.product(dests, srcs, srcs):
+            result.append({i_opcode: op, i_rd: rd, i_rs1: rs1, i_rs2: rs2})
+    for op in alu.signed_i_ops + alu.unsigned_i_ops:
+        for imm in immediates:
+            if op in alu.shift_i_ops:
+                valid = 0 <= imm < word_width
+            elif op in alu.unsigned_i_ops:
+                valid = 0 <= imm <= 0xffff
+            else:
+                valid = -0x8000 <= imm <= 0x7fff
+            if not valid:
+                continue
+            for rd, rs1 in itertools.product(dests, srcs):
+                result.append(
+                    {i_opcode: op, i_rd: rd, i_rs1: rs1, i_immediate: imm}
+                )
+    for imm in immediates:
+        if 0 <= imm <= 0xffff:
+            for rd in dests:
+                result.append({i_opcode: "lhi", i_rd: rd, i_immediate: imm})
+    return result
+
+
+# Returns random register values for the registers of a window, beginning
+# with the edge values.
+# Input:
+#   regs - The register names.
+#   count - The number of vectors.
+#   rng - The random number generator.
+# Returns:
+#   List of dictionaries mapping registers to values.
+def test_vectors(regs, count, rng):
+    vectors = []
+    for n in range(count):
+        vector = {}
+        for i, reg in enumerate(regs):
+            if n < len(edge_values):
+                vector[reg] = edge_values[(n + i) % len(edge_values)]
+            else:
+                vector[reg] = rng.getrandbits(word_width)
+        vectors.append(vector)
+    return vectors
+
+
+# Returns true if a sequence leaves the same values as a window in the live
+# registers for every test vector.
+# Input:
+#   window - The window's instruction sources.
+#   sequence - The candidate's instruction sources.
+#   live - The registers that must match.
+#   vectors - The test vectors.
+#   width - The register width.
+# Returns:
+#   bool
+def _matches(window, sequence, live, vectors, width):
+    for vector in vectors:
+        expected = alu.run(window, vector, width)
+        actual = alu.run(sequence, vector, width)
+        for reg in live:
+            if expected.get(reg, 0) != actual.get(reg, 0):
+                return False
+    return True
+
+
+# Returns the width at which all inputs of a window can be checked
+# exhaustively, which is a power of two.
+# Input:
+#   inputs - The number of input registers.
+# Returns:
+#   int
+def reduced_width(inputs):
+    width = word_width
+    while width > 2 and width * inputs > exhaustive_bits:
+        width //= 2
+    return width
+
+
+# Returns true if a sequence has shifts or lhi, whose results at a reduced
+# width say nothing about their results at full width.
+# Input:
+#   sequence - The instruction sources.
+# Returns:
+#   bool
+def _width_dependent(sequence):
+    return any(
+        alu.operations[s[i_opcode]] in ("sll", "srl", "sra", "lhi")
+        for s in sequence
+    )
+
+
+# Checks a candidate with random values at full width, then with every
+# combination of input values at a reduced width. Windows and candidates with
+# shifts or lhi are run at full width on the same inputs. Registers the window
+# writes without reading first hold arbitrary values, so they are randomized
+# too.
+# Input:
+#   window - The window's instruction sources.
+#   sequence - The candidate's instruction sources.
+#   live - The registers that must match.
+#   rng - The random number generator.
+# Returns:
+#   bool
+def verify(window, sequence, live, rng):
+    regs = rewrites.registers(window)
+    if not _matches(window, sequence, live,
+                    test_vectors(regs, verify_vectors, rng), word_width):
+        return False
+    inputs = live_in(window)
+    width = reduced_width(len(inputs))
+    run_width = width
+    if _width_dependent(window) or _width_dependent(sequence):
+        run_width = word_width
+    temps = [r for r in regs if r not in inputs]
+    # a window without inputs has the one empty combination
+    domain = range(1 << width) if inputs else []
+    for values in itertools.product(domain, repeat=len(inputs)):
+        vector = dict(zip(inputs, values))
+        for reg in temps:
+            vector[reg] = rng.getrandbits(run_width)
+        if not _matches(window, sequence, live, [vector], run_width):
+            return False
+    return True
+
+
+# Compiles an instruction for evaluation over test vectors.
+# Input:
+#   source - The instruction's source as defined in the grammar.
+#   count - The number of test vectors.
+# Returns:
+#   (destination, function, first source or None, second source or None,
+#    immediate values)
+def _compile(source, count):
+    function = alu.functions[alu.operations[source[i_opcode]]]
+    rs1 = source.get(i_rs1)
+    if rs1 == operands.zero_register:
+        rs1 = None
+    rs2 = source.get(i_rs2)
+    if rs2 == operands.zero_register:
+        rs2 = None
+    values = (0,) * count
+    if i_immediate in source:
+        values = (alu.immediate(source, word_width),) * count
+    return source[i_rd], function, rs1, rs2, values
+
+
+# Searches for sequences of a given length starting with a range of the
+# candidate instructions. Runs in a worker process.
+# Input:
+#   task - (window, live registers, test vectors, length, first candidate,
+#           last candidate + 1)
+# Returns:
+#   List of sequences (lists of candidate indices) matching the test vectors.
+def search_task(task):
+    window, live, vectors, length, start, stop = task
+    count = len(vectors)
+    mask = (1 << word_width) - 1
+    compiled = [_compile(c, count) for c in candidates(window)]
+    zeros = (0,) * count
+    state = {}
+    for reg in rewrites.registers(window):
+        state[reg] = tuple(v[reg] for v in vectors)
+    targets = {}
+    for reg in live:
+        targets[reg] = tuple(
+            alu.run(window, v, word_width).get(reg, 0) for v in vectors
+        )
+    results = []
+
+    def extend(state, sequence, choices):
+        remaining = length - len(sequence)
+        wrong = [r for r in live if state[r] != targets[r]]
+        if len(wrong) > remaining:
+            return
+        if remaining == 0:
+            results.append(list(sequence))
+            return
+        for index in choices:
+            rd, function, rs1, rs2, b = compiled[index]
+            if remaining == 1 and rd not in wrong:
+                continue
+            a = state[rs1] if rs1 is not None else zeros
+            if rs2 is not None:
+                b = state[rs2]
+            values = tuple(
+                function(x, y, word_width) & mask for x, y in zip(a, b)
+            )
+            changed = dict(state)
+            changed[rd] = values
+            sequence.append(index)
+            extend(changed, sequence, range(len(compiled)))
+            sequence.pop()
+            if len(results) >= max_results:
+                return
+
+    extend(state, [], range(start, stop))
+    return results
+
+
+# Searches for the cheapest sequence equivalent to a window, trying every
+# sequence of each length in turn. The first candidates are split among the
+# worker processes of a pool, if there is one.
+# Input:
+#   window - The window's instruction sources.
+#   live - The registers written by the window that are read after it.
+#   max_length - The longest sequence to try.
+#   pool - A multiprocessing pool, or None to search in this process.
+#   seed - The random seed, so that searches are repeatable.
+# Returns:
+#   List of instruction sources, or None if there is no cheaper sequence.
+def search(window, live, max_length, pool=None, seed=0):
+    rng = random.Random(seed)
+    vectors = test_vectors(rewrites.registers(window), search_vectors, rng)
+    choices = candidates(window)
+    window_cost = cost(window)
+    live = sorted(live)
+    chunk = len(choices)
+    if pool is not None:
+        chunk = max(1, len(choices) // pool_tasks)
+    for length in range(0, min(max_length, len(window)) + 1):
+        tasks = [
+            (window, live, vectors, length, start,
+             min(len(choices), start + chunk))
+            for start in range(0, len(choices), chunk)
+        ]
+        if pool is not None and length > 1:
+            found = pool.map(search_task, tasks)
+        else:
+            found = map(search_task, tasks)
+        for sequences in found:
+            for indices in sequences:
+                sequence = [choices[i] for i in indices]
+                if cost(sequence) < window_cost and \
+                   verify(window, sequence, live, rng):
+                    return sequence
+    return None
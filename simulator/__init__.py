@@ -0,0 +1,16 @@
+__all__ = [
+    "batch",
+    "caches",
+    "counters",
+    "decode",
+    "devices",
+    "hostio",
+    "image",
+    "machine",
+    "paging",
+    "predictors",
+    "profiler",
+    "shared",
+    "snapshot",
+    "trace"
+]
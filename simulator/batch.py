@@ -0,0 +1,529 @@
+import numpy as np
+from optimizer import alu
+from simulator.decode import decode
+from simulator.machine import running, halted, faulted, default_headroom, \
+    access_sizes, signed_loads
+from simulator.paging import page_bits, page_size
+
+# integer operation -> function of unsigned 32 bit arrays
+int_functions = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "and": lambda a, b: a & b,
+    "or": lambda a, b: a | b,
+    "xor": lambda a, b: a ^ b,
+    "sll": lambda a, b: a << (b & 31),
+    "srl": lambda a, b: a >> (b & 31),
+    "sra": lambda a, b: (_int(a) >> _int(b & 31)).astype(np.uint32),
+    "seq": lambda a, b: a == b,
+    "sne": lambda a, b: a != b,
+    "slt": lambda a, b: _int(a) < _int(b),
+    "sgt": lambda a, b: _int(a) > _int(b),
+    "sle": lambda a, b: _int(a) <= _int(b),
+    "sge": lambda a, b: _int(a) >= _int(b),
+    "lhi": lambda a, b: b << 16
+}
+# floating point instruction -> (function, source width, result width), where
+# widths are "f" for single, "d" for double, and "i" for an integer in a
+# floating point register
+fp_functions = {
+    "addf": (np.add, "f", "f"),
+    "subf": (np.subtract, "f", "f"),
+    "multf": (np.multiply, "f", "f"),
+    "divf": (np.divide, "f", "f"),
+    "addd": (np.add, "d", "d"),
+    "subd": (np.subtract, "d", "d"),
+    "multd": (np.multiply, "d", "d"),
+    "divd": (np.divide, "d", "d"),
+    "cvtf2d": (None, "f", "d"),
+    "cvtf2i": (None, "f", "i"),
+    "cvtd2f": (None, "d", "f"),
+    "cvtd2i": (None, "d", "i"),
+    "cvti2f": (None, "i", "f"),
+    "cvti2d": (None, "i", "d"),
+    "movf": (None, "f", "f"),
+    "movd": (None, "d", "d")
+}
+# integer multiplies and divides, which use floating point registers
+int_fp_functions = ("mult", "multu", "div", "divu")
+
+
+# Returns unsigned 32 bit values as signed 64 bit integers.
+# Input:
+#   values - Array of unsigned 32 bit integers.
+# Returns:
+#   Array of signed 64 bit integers.
+def _int(values):
+    return values.astype(np.uint32).view(np.int32).astype(np.int64)
+
+
+# Returns floating point values converted to integers the way the scalar
+# machine converts them: truncated toward zero and wrapped to 32 bits, with
+# NaN and infinities giving 0.
+# Input:
+#   values - Array of floats.
+# Returns:
+#   Array of signed 64 bit integers.
+def _truncate(values):
+    values = values.astype(np.float64)
+    finite = np.isfinite(values)
+    # fmod is exact, so the low 32 bits of values too large for int64 are
+    # kept
+    wrapped = np.fmod(np.trunc(np.where(finite, values, 0)), 2.0 ** 32)
+    return wrapped.astype(np.int64)
+
+
+# Simulates many instances of one program in lockstep. Each lane has its own
+# registers, memory, and program counter, held in arrays with the lane as the
+# first axis. Memory is held in pages of paging.page_size bytes in a pool
+# shared by the lanes, with a page table for each lane. The tables only have
+# entries for the pages the image holds or some lane has written, kept in a
+# sorted array of page numbers, and other pages read as the zero page. The
+# pages of the image and the zero page start out shared by every lane, and a
+# lane gets its own copy of a page the first time it writes it, so memory
+# grows with the pages the lanes write rather than with the lanes or the
+# address range. Each step executes the instruction at the lowest program
+# counter of the running lanes as one vector operation over the lanes at that
+# address, so lanes that diverge at a branch run separately and merge again
+# when they reach the same address. trap 0 halts a lane, and other traps are
+# ignored.
+# Invalid instructions, unaligned accesses, and accesses outside a lane's
+# memory stop it with a fault. Stores to instructions don't change the
+# decoded instructions.
+class BatchSimulator(object):
+    # Input:
+    #   image - The program image (see simulator.image).
+    #   lanes - The number of instances.
+    #   memory_size - Bytes of memory of each lane, from address 0. The
+    #                 default covers the image and default_headroom bytes.
+    #   entry - The address execution starts at, default the image's entry.
+    def __init__(self, image, lanes, memory_size=None, entry=None):
+        if memory_size is None:
+            memory_size = image.extent()[1] + default_headroom
+        self.lanes = lanes
+        self.memory_size = memory_size
+        memory = image.memory(memory_size)
+        numbers = sorted(set(memory.pages) | set(memory.shared))
+        # pool of pages, the zero page and the pages of the image first, which
+        # are shared, then the pages copied by the lanes that wrote them
+        self.pool = np.zeros((1 + len(numbers), page_size), np.uint8)
+        self.shared_pages = 1 + len(numbers)
+        self.used_pages = self.shared_pages
+        # sorted page numbers with entries in the page table
+        self.numbers = np.array(numbers, np.int64)
+        # lane, index in numbers -> page of the pool
+        self.table = np.zeros((lanes, len(numbers)), np.int32)
+        for n, number in enumerate(numbers, 1):
+            self.pool[n] = np.frombuffer(bytes(memory.readable(number)),
+                                         np.uint8)
+            self.table[:, n - 1] = n
+        self.gpr = np.zeros((lanes, 32), np.uint32)
+        self.fpr = np.zeros((lanes, 32), np.uint32)
+        if entry is None:
+            entry = image.entry()
+        self.pc = np.full(lanes, entry, np.uint32)
+        self.state = np.full(lanes, running, np.int8)
+        # instructions executed by each lane
+        self.executed = np.zeros(lanes, np.int64)
+        # vector steps taken
+        self.steps = 0
+        # address -> function executing the instruction for an index array
+        # of lanes
+        self._compiled = {}
+
+    # Returns the values of a register in every lane.
+    # Input:
+    #   name - The register name (e.g. "r1" or "f2").
+    # Returns:
+    #   Array of unsigned 32 bit integers.
+    def register(self, name):
+        return self._file(name)[:, int(name[1:])].copy()
+
+    # Sets a register in every lane.
+    # Input:
+    #   name - The register name.
+    #   values - A value or an array of values, one per lane.
+    # Returns:
+    #   n/a
+    def set_register(self, name, values):
+        if name == "r0":
+            return
+        values = np.asarray(values, np.int64).astype(np.uint32)
+        self._file(name)[:, int(name[1:])] = values
+
+    # Returns a word of memory in every lane.
+    # Input:
+    #   address - The address of the word.
+    # Returns:
+    #   Array of unsigned 32 bit integers.
+    def read_word(self, address):
+        return self._read(np.arange(self.lanes),
+                          np.full(self.lanes, address, np.int64), 4)
+
+    # Sets a word of memory in every lane.
+    # Input:
+    #   address - The address of the word.
+    #   values - A value or an array of values, one per lane.
+    # Returns:
+    #   n/a
+    def write_word(self, address, values):
+        values = np.asarray(values, np.int64).astype(np.uint32)
+        self._write(np.arange(self.lanes),
+                    np.full(self.lanes, address, np.int64),
+                    np.broadcast_to(values, (self.lanes,)), 4)
+
+    # Runs the lanes until they all stop or a number of steps is reached.
+    # Input:
+    #   max_steps - The most vector steps to take, or None for no limit.
+    # Returns:
+    #   The number of steps taken.
+    def run(self, max_steps=None):
+        taken = 0
+        with np.errstate(all="ignore"):
+            while max_steps is None or taken < max_steps:
+                active = self.state == running
+                if not active.any():
+                    break
+                pc = self.pc[active].min()
+                lanes = np.nonzero(active & (self.pc == pc))[0]
+                self._instruction(int(pc))(lanes)
+                self.executed[lanes] += 1
+                taken += 1
+        self.steps += taken
+        return taken
+
+    # Returns the register file holding a register.
+    # Input:
+    #   name - The register name.
+    # Returns:
+    #   The array of registers.
+    def _file(self, name):
+        return self.gpr if name[0] == "r" else self.fpr
+
+    # Returns the function executing the instruction at an address, decoding
+    # it on first use.
+    # Input:
+    #   pc - The address.
+    # Returns:
+    #   Function of an index array of lanes.
+    def _instruction(self, pc):
+        if pc not in self._compiled:
+            self._compiled[pc] = self._compile(pc)
+        return self._compiled[pc]
+
+    # Stops lanes with a fault.
+    # Input:
+    #   lanes - Index array of lanes.
+    # Returns:
+    #   n/a
+    def _fault(self, lanes):
+        self.state[lanes] = faulted
+
+    # Returns the lanes whose accesses are aligned and inside memory, faulting
+    # the others.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   addresses - Array of addresses, one per lane.
+    #   size - The access size in bytes.
+    # Returns:
+    #   (valid lanes, their addresses)
+    def _check(self, lanes, addresses, size):
+        valid = (addresses % size == 0) & (addresses >= 0) & \
+            (addresses + size <= self.memory_size)
+        if not valid.all():
+            self._fault(lanes[~valid])
+        return lanes[valid], addresses[valid]
+
+    # Reads big endian values from memory.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   addresses - Array of addresses, one per lane.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   Array of unsigned integers (64 bit for 8 byte accesses).
+    def _read(self, lanes, addresses, size):
+        pages = self._pages(lanes, addresses >> page_bits)
+        offsets = addresses & (page_size - 1)
+        value = np.zeros(len(lanes), np.uint64)
+        for n in range(size):
+            value = (value << np.uint64(8)) | \
+                self.pool[pages, offsets + n].astype(np.uint64)
+        if size < 8:
+            return value.astype(np.uint32)
+        return value
+
+    # Writes big endian values to memory.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   addresses - Array of addresses, one per lane.
+    #   values - Array of unsigned integers, one per lane.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   n/a
+    def _write(self, lanes, addresses, values, size):
+        pages = self._private(lanes, addresses >> page_bits)
+        offsets = addresses & (page_size - 1)
+        values = values.astype(np.uint64)
+        for n in range(size):
+            shift = np.uint64(8 * (size - 1 - n))
+            self.pool[pages, offsets + n] = \
+                ((values >> shift) & np.uint64(0xff)).astype(np.uint8)
+
+    # Returns the pages of lanes for reading.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   numbers - Array of page numbers, one per lane.
+    # Returns:
+    #   Array of pages of the pool, the zero page for pages without entries.
+    def _pages(self, lanes, numbers):
+        columns = np.searchsorted(self.numbers, numbers)
+        found = columns < len(self.numbers)
+        found[found] = self.numbers[columns[found]] == numbers[found]
+        pages = np.zeros(len(lanes), np.int32)
+        pages[found] = self.table[lanes[found], columns[found]]
+        return pages
+
+    # Returns the pages of lanes for writing, adding entries for pages that
+    # have none and copying the pages the lanes still share into new pages of
+    # their own.
+    # Input:
+    #   lanes - Index array of lanes, each at most once.
+    #   numbers - Array of page numbers, one per lane.
+    # Returns:
+    #   Array of pages of the pool.
+    def _private(self, lanes, numbers):
+        missing = np.setdiff1d(numbers, self.numbers)
+        if len(missing):
+            columns = np.searchsorted(self.numbers, missing)
+            self.numbers = np.insert(self.numbers, columns, missing)
+            self.table = np.insert(self.table, columns, 0, axis=1)
+        columns = np.searchsorted(self.numbers, numbers)
+        pages = self.table[lanes, columns]
+        shared = pages < self.shared_pages
+        count = int(shared.sum())
+        if count:
+            if self.used_pages + count > len(self.pool):
+                pool = np.zeros(
+                    (max(2 * len(self.pool), self.used_pages + count),
+                     page_size),
+                    np.uint8
+                )
+                pool[:self.used_pages] = self.pool[:self.used_pages]
+                self.pool = pool
+            new = np.arange(self.used_pages, self.used_pages + count,
+                            dtype=np.int32)
+            self.used_pages += count
+            self.pool[new] = self.pool[pages[shared]]
+            self.table[lanes[shared], columns[shared]] = new
+            pages[shared] = new
+        return pages
+
+    # Returns floating point register values.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   reg - The register number (the first of a pair for doubles).
+    #   width - "f", "d", or "i" (see fp_functions).
+    # Returns:
+    #   Array of float32, float64, or int64.
+    def _fp_read(self, lanes, reg, width):
+        if width == "d":
+            pair = (self.fpr[lanes, reg].astype(np.uint64) << np.uint64(32)) \
+                | self.fpr[lanes, (reg + 1) % 32].astype(np.uint64)
+            return pair.view(np.float64)
+        if width == "f":
+            return self.fpr[lanes, reg].view(np.float32)
+        return _int(self.fpr[lanes, reg])
+
+    # Writes floating point register values.
+    # Input:
+    #   lanes - Index array of lanes.
+    #   reg - The register number (the first of a pair for doubles).
+    #   width - "f", "d", or "i" (see fp_functions).
+    #   values - Array of values.
+    # Returns:
+    #   n/a
+    def _fp_write(self, lanes, reg, width, values):
+        if width == "d":
+            bits = values.astype(np.float64).view(np.uint64)
+            self.fpr[lanes, reg] = (bits >> np.uint64(32)).astype(np.uint32)
+            self.fpr[lanes, (reg + 1) % 32] = \
+                (bits & np.uint64(0xffffffff)).astype(np.uint32)
+        elif width == "f":
+            self.fpr[lanes, reg] = values.astype(np.float32).view(np.uint32)
+        else:
+            self.fpr[lanes, reg] = values.astype(np.int64).astype(np.uint32)
+
+    # Builds the function executing the instruction at an address.
+    # Input:
+    #   pc - The address.
+    # Returns:
+    #   Function of an index array of lanes.
+    def _compile(self, pc):
+        if pc % 4 or pc + 4 > self.memory_size:
+            return self._fault
+        word = int(self._read(np.zeros(1, np.int64),
+                              np.full(1, pc, np.int64), 4)[0])
+        try:
+            d = decode(word)
+        except ValueError:
+            return self._fault
+        name = d.name
+        following = np.uint32(pc + 4)
+        target = np.uint32((pc + 4 + d.immediate) & 0xffffffff)
+        gpr = self.gpr
+        fpr = self.fpr
+
+        def advance(lanes):
+            self.pc[lanes] = following
+
+        if name == "nop":
+            return advance
+        if name == "trap":
+            if d.immediate != 0:
+                return advance
+
+            def halt(lanes):
+                self.pc[lanes] = following
+                self.state[lanes] = halted
+            return halt
+        if name in ("beqz", "bnez"):
+            def branch(lanes):
+                zero = gpr[lanes, d.rs1] == 0
+                if name == "bnez":
+                    zero = ~zero
+                self.pc[lanes] = np.where(zero, target, following)
+            return branch
+        if name in ("j", "jal"):
+            def jump(lanes):
+                if name == "jal":
+                    gpr[lanes, 31] = following
+                self.pc[lanes] = target
+            return jump
+        if name in ("jr", "jalr"):
+            def jump_register(lanes):
+                destination = gpr[lanes, d.rs1]
+                if name == "jalr":
+                    gpr[lanes, 31] = following
+                self.pc[lanes] = destination
+            return jump_register
+        if name in access_sizes:
+            return self._compile_access(d, following)
+        if name in alu.operations:
+            return self._compile_alu(d, following)
+        if name in fp_functions or name in int_fp_functions:
+            return self._compile_fp(d, following)
+        if name == "movfp2i":
+            def move_to_int(lanes):
+                if d.rd:
+                    gpr[lanes, d.rd] = fpr[lanes, d.rs1]
+                advance(lanes)
+            return move_to_int
+        if name == "movi2fp":
+            def move_to_fp(lanes):
+                fpr[lanes, d.rd] = gpr[lanes, d.rs1]
+                advance(lanes)
+            return move_to_fp
+        return self._fault
+
+    # Builds the function executing a load or store.
+    # Input:
+    #   d - The decoded instruction.
+    #   following - The address of the next instruction.
+    # Returns:
+    #   Function of an index array of lanes.
+    def _compile_access(self, d, following):
+        name = d.name
+        size = access_sizes[name]
+        offset = np.int64(d.immediate)
+        floating = name in ("lf", "ld", "sf", "sd")
+        gpr = self.gpr
+        fpr = self.fpr
+
+        def access(lanes):
+            addresses = gpr[lanes, d.rs1].astype(np.int64) + offset
+            lanes, addresses = self._check(lanes, addresses, size)
+            if name[0] == "l":
+                value = self._read(lanes, addresses, size)
+                if size == 8:
+                    fpr[lanes, d.rd] = (value >> np.uint64(32)).astype(
+                        np.uint32)
+                    fpr[lanes, (d.rd + 1) % 32] = \
+                        (value & np.uint64(0xffffffff)).astype(np.uint32)
+                else:
+                    if name in signed_loads:
+                        bits = 8 * (4 - size)
+                        value = ((value << np.uint32(bits)).view(np.int32) >>
+                                 bits).view(np.uint32)
+                    if floating:
+                        fpr[lanes, d.rd] = value
+                    elif d.rd:
+                        gpr[lanes, d.rd] = value
+            else:
+                if size == 8:
+                    value = (fpr[lanes, d.rd].astype(np.uint64) <<
+                             np.uint64(32)) | \
+                        fpr[lanes, (d.rd + 1) % 32].astype(np.uint64)
+                elif floating:
+                    value = fpr[lanes, d.rd]
+                else:
+                    value = gpr[lanes, d.rd]
+                self._write(lanes, addresses, value, size)
+            self.pc[lanes] = following
+        return access
+
+    # Builds the function executing an integer alu instruction.
+    # Input:
+    #   d - The decoded instruction.
+    #   following - The address of the next instruction.
+    # Returns:
+    #   Function of an index array of lanes.
+    def _compile_alu(self, d, following):
+        function = int_functions[alu.operations[d.name]]
+        immediate = None
+        if d.name not in alu.r_ops:
+            immediate = np.uint32(d.immediate & 0xffffffff)
+        gpr = self.gpr
+
+        def execute(lanes):
+            if d.rd:
+                a = gpr[lanes, d.rs1]
+                b = gpr[lanes, d.rs2] if immediate is None else immediate
+                gpr[lanes, d.rd] = function(a, b)
+            self.pc[lanes] = following
+        return execute
+
+    # Builds the function executing a floating point instruction, or an
+    # integer multiply or divide on floating point registers.
+    # Input:
+    #   d - The decoded instruction.
+    #   following - The address of the next instruction.
+    # Returns:
+    #   Function of an index array of lanes.
+    def _compile_fp(self, d, following):
+        name = d.name
+
+        def execute(lanes):
+            if name in int_fp_functions:
+                a = self.fpr[lanes, d.rs1].astype(np.int64)
+                b = self.fpr[lanes, d.rs2].astype(np.int64)
+                if not name.endswith("u"):
+                    a = _int(a)
+                    b = _int(b)
+                if name.startswith("mult"):
+                    result = a * b
+                else:
+                    quotient = np.abs(a) // np.where(b == 0, 1, np.abs(b))
+                    result = np.where((a < 0) != (b < 0), -quotient, quotient)
+                    result = np.where(b == 0, 0, result)
+                self.fpr[lanes, d.rd] = (result & 0xffffffff).astype(
+                    np.uint32)
+            else:
+                function, source, result = fp_functions[name]
+                a = self._fp_read(lanes, d.rs1, source)
+                if function is not None:
+                    a = function(a, self._fp_read(lanes, d.rs2, source))
+                elif result == "i":
+                    a = _truncate(a)
+                self._fp_write(lanes, d.rd, result, a)
+            self.pc[lanes] = following
+        return execute
@@ -0,0 +1,332 @@
+import array
+import string
+from simulator.counters import WordCounters, code_ranges
+
+# replacement policies
+lru = "lru"
+fifo = "fifo"
+policies = (lru, fifo)
+
+# tag of an empty way
+_invalid = -1
+
+
+# Returns log2 of a power of two.
+# Input:
+#   n - The value.
+#   what - Name of the value for the error message.
+# Returns:
+#   int
+# Throws:
+#   ValueError - n isn't a power of two.
+def _log2(n, what):
+    if n <= 0 or n & (n - 1):
+        raise ValueError("{0} must be a power of two".format(what))
+    return n.bit_length() - 1
+
+
+# A set associative cache with write back and write allocate. The tags and
+# dirty bits of all ways are kept in flat arrays indexed by
+# set * associativity + way, so large caches take little memory and no
+# objects are created per access. The ways of each set are kept in
+# replacement order, most recently used (lru) or filled (fifo) first, so a
+# lookup is a scan of a slice, and the victim of a miss is the set's last
+# way. Misses and write backs go to the next level, if there is one.
+class Cache(object):
+    # Input:
+    #   name - The name used in reports.
+    #   size - Bytes of data.
+    #   associativity - Ways per set.
+    #   line_size - Bytes per line.
+    #   policy - lru or fifo.
+    #   next_level - The cache misses go to, or None for memory.
+    # Throws:
+    #   ValueError - The geometry or policy is invalid.
+    def __init__(self, name, size, associativity, line_size, policy=lru,
+                 next_level=None):
+        if policy not in policies:
+            raise ValueError("unknown replacement policy " + policy)
+        self.line_bits = _log2(line_size, name + " line size")
+        sets = size // (associativity * line_size)
+        self.set_bits = _log2(sets, name + " number of sets")
+        self.set_mask = sets - 1
+        self.name = name
+        self.size = size
+        self.associativity = associativity
+        self.line_size = line_size
+        self.policy = policy
+        self.next_level = next_level
+        ways = sets * associativity
+        self.tags = array.array("l", [_invalid]) * ways
+        self.dirty = array.array("b", [0]) * ways
+        self.accesses = 0
+        self.misses = 0
+        self.write_backs = 0
+
+    # Accesses the line holding an address.
+    # Input:
+    #   address - The address.
+    #   is_store - True for a write.
+    # Returns:
+    #   True on a hit.
+    def access(self, address, is_store=False):
+        self.accesses += 1
+        line = address >> self.line_bits
+        tag = line >> self.set_bits
+        ways = self.associativity
+        base = (line & self.set_mask) * ways
+        end = base + ways
+        tags = self.tags
+        dirty = self.dirty
+        in_set = tags[base:end]
+        if tag in in_set:
+            way = base + in_set.index(tag)
+            if self.policy == lru and way != base:
+                # move the way to the front
+                was_dirty = dirty[way]
+                tags[base + 1:way + 1] = in_set[:way - base]
+                dirty[base + 1:way + 1] = dirty[base:way]
+                tags[base] = tag
+                dirty[base] = was_dirty
+                way = base
+            if is_store:
+                dirty[way] = 1
+            return True
+
+        self.misses += 1
+        victim = in_set[-1]
+        if victim != _invalid and dirty[end - 1]:
+            self.write_backs += 1
+            if self.next_level is not None:
+                victim_line = (victim << self.set_bits) | \
+                    (line & self.set_mask)
+                self.next_level.access(victim_line << self.line_bits, True)
+        if self.next_level is not None:
+            self.next_level.access(address)
+        tags[base + 1:end] = in_set[:-1]
+        dirty[base + 1:end] = dirty[base:end - 1]
+        tags[base] = tag
+        dirty[base] = 1 if is_store else 0
+        return False
+
+    # Returns the fraction of accesses that missed.
+    # Input:
+    #   n/a
+    # Returns:
+    #   float
+    def miss_rate(self):
+        return float(self.misses) / self.accesses if self.accesses else 0.0
+
+
+# Geometry of a cache hierarchy, with a split first level and an optional
+# unified second level. A configuration file has one "name value" pair per
+# line, where sizes are in bytes and an l2_size of 0 leaves out the second
+# level.
+class CacheConfig(object):
+    # Default parameters.
+    defaults = {
+        "l1i_size": 8192,
+        "l1i_associativity": 2,
+        "l1i_line_size": 32,
+        "l1d_size": 8192,
+        "l1d_associativity": 2,
+        "l1d_line_size": 32,
+        "l2_size": 0,
+        "l2_associativity": 8,
+        "l2_line_size": 64,
+        "replacement": lru
+    }
+
+    def __init__(self):
+        self.params = dict(self.defaults)
+
+    # Loads parameters from a file. Parameters not in the file keep their
+    # default values.
+    # Input:
+    #   name - The file name.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - The file format isn't recognized.
+    #   ValueError - Unknown parameter name or invalid value.
+    def load(self, name):
+        with open(name, "r") as f:
+            for line in f:
+                words = string.split(string.lower(line))
+                if len(words) is 0:
+                    continue
+                if len(words) is not 2:
+                    raise IOError("file {} has unknown format".format(name))
+                if words[0] not in self.defaults:
+                    raise ValueError("Unknown cache parameter " + words[0])
+                if words[0] == "replacement":
+                    self.params[words[0]] = words[1]
+                else:
+                    self.params[words[0]] = int(words[1], 0)
+
+    # Builds the caches.
+    # Input:
+    #   n/a
+    # Returns:
+    #   (instruction cache, data cache, second level cache or None)
+    # Throws:
+    #   ValueError - The geometry or policy is invalid.
+    def build(self):
+        p = self.params
+        l2 = None
+        if p["l2_size"]:
+            l2 = Cache("L2", p["l2_size"], p["l2_associativity"],
+                       p["l2_line_size"], p["replacement"])
+        l1i = Cache("L1I", p["l1i_size"], p["l1i_associativity"],
+                    p["l1i_line_size"], p["replacement"], l2)
+        l1d = Cache("L1D", p["l1d_size"], p["l1d_associativity"],
+                    p["l1d_line_size"], p["replacement"], l2)
+        return l1i, l1d, l2
+
+
+# Simulates the caches of a machine, counting the first level accesses and
+# misses of each instruction (fetches and data accesses) and of each data
+# word, for reports by label and by source line. The counts are kept in flat
+# arrays indexed by word address (see simulator.counters).
+class CacheSimulation(object):
+    # Input:
+    #   config - The cache configuration.
+    # Throws:
+    #   ValueError - The configuration is invalid.
+    def __init__(self, config):
+        self.l1i, self.l1d, self.l2 = config.build()
+        # instruction word -> fetches, fetch misses, data accesses, data
+        # misses
+        self.instructions = WordCounters([], 4)
+        # data word -> accesses, misses
+        self.data = WordCounters([], 2)
+        # the counters of the last instruction fetched
+        self.fetched = self.instructions.array
+        self.fetched_index = 0
+
+    # Adds the simulation to a machine's hooks, with counters for the
+    # segments of its image.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        self.instructions = WordCounters(code_ranges(machine.image), 4)
+        self.data = WordCounters(machine.image.ranges(), 2)
+        machine.fetch_hooks.append(self.fetch)
+        machine.access_hooks.append(self.access)
+
+    # Simulates an instruction fetch.
+    # Input:
+    #   pc - The instruction address.
+    # Returns:
+    #   n/a
+    def fetch(self, pc):
+        instructions = self.instructions
+        n = instructions.index(pc)
+        counts = self.fetched = instructions.array
+        self.fetched_index = n
+        counts[n] += 1
+        if not self.l1i.access(pc):
+            counts[n + 1] += 1
+
+    # Simulates a load or store by the last instruction fetched.
+    # Input:
+    #   pc - The instruction address.
+    #   address - The data address.
+    #   size - The access size.
+    #   is_store - True for a store.
+    # Returns:
+    #   n/a
+    def access(self, pc, address, size, is_store):
+        data = self.data
+        n = data.index(address)
+        counts = data.array
+        counts[n] += 1
+        fetched = self.fetched
+        i = self.fetched_index
+        fetched[i + 2] += 1
+        if not self.l1d.access(address, is_store):
+            counts[n + 1] += 1
+            fetched[i + 3] += 1
+
+    # Returns the caches that were simulated.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of caches.
+    def caches(self):
+        return [c for c in (self.l1i, self.l1d, self.l2) if c is not None]
+
+    # Returns a report of the miss rates of each cache, of the data accesses
+    # to each labeled object, and of the instructions on each source line.
+    # Input:
+    #   image - The program image, with the labels and source lines.
+    # Returns:
+    #   The report as a string.
+    def report(self, image):
+        out = ["Caches:"]
+        out.append("{0:>15}   {1:>8} {2:>5} {3:>4} {4:>10} {5:>10} {6:>7} "
+                   "{7:>10}".format("cache", "size", "ways", "line",
+                                    "accesses", "misses", "rate", "writeback"))
+        for c in self.caches():
+            out.append("{0:>15} : {1:8} {2:5} {3:4} {4:10} {5:10} {6:6.2f}% "
+                       "{7:10}".format(c.name, c.size, c.associativity,
+                                       c.line_size, c.accesses, c.misses,
+                                       100 * c.miss_rate(), c.write_backs))
+
+        objects = {}
+        for address, counts in self.data.items():
+            _add(objects, image.label(address), counts)
+        if objects:
+            out.append("Data accesses by label:")
+        for name, counts in sorted(objects.items(), key=_by_misses):
+            out.append(_row(name, counts))
+
+        lines = {}
+        for pc, counts in self.instructions.items():
+            line_no = image.lines.get(pc, 0)
+            if line_no:
+                # fetches and data accesses of the line together
+                _add(lines, line_no, [counts[0] + counts[2],
+                                      counts[1] + counts[3]])
+        if lines:
+            out.append("Accesses by line:")
+        for line_no, counts in sorted(lines.items(), key=_by_misses):
+            out.append(_row("line " + repr(line_no), counts))
+        return "\n".join(out)
+
+
+# Adds access counts to a total.
+# Input:
+#   totals - Dictionary mapping keys to [accesses, misses].
+#   key - The key.
+#   counts - [accesses, misses]
+# Returns:
+#   n/a
+def _add(totals, key, counts):
+    total = totals.setdefault(key, [0, 0])
+    total[0] += counts[0]
+    total[1] += counts[1]
+
+
+# Sort key for report rows, with the most misses first.
+# Input:
+#   item - (key, [accesses, misses])
+# Returns:
+#   The key.
+def _by_misses(item):
+    return -item[1][1], item[0]
+
+
+# Returns a report row.
+# Input:
+#   name - The row name.
+#   counts - [accesses, misses]
+# Returns:
+#   str
+def _row(name, counts):
+    accesses, misses = counts
+    return "{0:>15} : {1:10} accesses {2:10} misses {3:6.2f}%".format(
+        name, accesses, misses, 100.0 * misses / accesses if accesses else 0)
+
@@ -0,0 +1,127 @@
+import array
+import bisect
+
+# words in a segment made for a word outside the given ranges
+page_words = 1024
+
+
+# Returns the contiguous runs of the instructions of an image.
+# Input:
+#   image - The program image.
+# Returns:
+#   List of (low address, high address) in address order.
+def code_ranges(image):
+    ranges = []
+    for address in sorted(image.code):
+        if ranges and ranges[-1][1] == address:
+            ranges[-1][1] = address + 4
+        else:
+            ranges.append([address, address + 4])
+    return [tuple(r) for r in ranges]
+
+
+# Counters for word addresses, a fixed number of fields per word, kept in
+# flat arrays with one array per segment of memory. Segments are made up
+# front for the given address ranges, and for a page of words around any
+# other word the first time it is counted, so gaps between segments take no
+# memory. A lookup in the segment of the previous lookup is two comparisons;
+# other lookups bisect the segments. Callers add to the fields through
+# array, the array of the segment of the last lookup:
+#
+#   n = counters.index(address)
+#   counters.array[n + field] += 1
+class WordCounters(object):
+    # Input:
+    #   ranges - List of (low address, high address) in address order.
+    #   fields - The number of counters for each word.
+    def __init__(self, ranges, fields=1):
+        self.fields = fields
+        # first word, the word after the last, and counters of each segment
+        self.lows = []
+        self.highs = []
+        self.arrays = []
+        # ranges sharing a word or next to each other are merged
+        words = []
+        for low, high in ranges:
+            low >>= 2
+            high = (high + 3) >> 2
+            if words and low <= words[-1][1]:
+                words[-1][1] = max(words[-1][1], high)
+            else:
+                words.append([low, high])
+        for low, high in words:
+            self._add(low, high)
+        # the segment of the last lookup
+        self.low = 0
+        self.high = 0
+        self.array = array.array("L")
+
+    # Returns the index of the first field of an address in array, selecting
+    # the address's segment.
+    # Input:
+    #   address - The address.
+    # Returns:
+    #   int
+    def index(self, address):
+        word = address >> 2
+        if not self.low <= word < self.high:
+            self._select(word)
+        return (word - self.low) * self.fields
+
+    # Returns the counters of each word that has been counted.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Generator of (word address, list of fields), in address order.
+    def items(self):
+        fields = self.fields
+        for low, counts in zip(self.lows, self.arrays):
+            for n in xrange(0, len(counts), fields):
+                values = counts[n:n + fields]
+                if any(values):
+                    yield (low + n // fields) << 2, values.tolist()
+
+    # Returns the sum of each field over all words.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of totals.
+    def totals(self):
+        return [
+            sum(sum(counts[field::self.fields]) for counts in self.arrays)
+            for field in range(self.fields)
+        ]
+
+    # Makes the segment holding a word the selected one, adding a segment
+    # for the page around it, clipped to its neighbours, if there is none.
+    # Input:
+    #   word - The word address.
+    # Returns:
+    #   n/a
+    def _select(self, word):
+        n = bisect.bisect_right(self.lows, word) - 1
+        if n < 0 or word >= self.highs[n]:
+            low = word - word % page_words
+            high = low + page_words
+            if n >= 0:
+                low = max(low, self.highs[n])
+            if n + 1 < len(self.lows):
+                high = min(high, self.lows[n + 1])
+            n = self._add(low, high)
+        self.low = self.lows[n]
+        self.high = self.highs[n]
+        self.array = self.arrays[n]
+
+    # Adds a segment.
+    # Input:
+    #   low - The first word.
+    #   high - The word after the last.
+    # Returns:
+    #   The position of the segment.
+    def _add(self, low, high):
+        n = bisect.bisect_right(self.lows, low)
+        self.lows.insert(n, low)
+        self.highs.insert(n, high)
+        self.arrays.insert(n, array.array("L", [0]) * ((high - low) *
+                                                       self.fields))
+        return n
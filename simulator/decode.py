@@ -0,0 +1,96 @@
+from instructions import instruction_table
+from instructions.instruction_table import InstructionType
+from optimizer import alu
+
+# i-type instructions whose immediate is zero extended
+unsigned_immediates = alu.unsigned_i_ops + ("lhi", "trap")
+
+# (type, opcode, function code) -> instruction name, built on first use
+_names = {}
+
+
+# A decoded instruction word. Register fields are numbers, and the immediate
+# is sign or zero extended as the instruction uses it. For branches and jumps
+# it is the offset from the next instruction.
+class Decoded(object):
+    # Input:
+    #   name - The instruction name.
+    #   type_id - The instruction type.
+    #   rd - The destination field (the stored register for stores).
+    #   rs1 - The first source field.
+    #   rs2 - The second source field.
+    #   immediate - The immediate or offset.
+    def __init__(self, name, type_id, rd=0, rs1=0, rs2=0, immediate=0):
+        self.name = name
+        self.type_id = type_id
+        self.rd = rd
+        self.rs1 = rs1
+        self.rs2 = rs2
+        self.immediate = immediate
+
+
+# Returns the table of instruction names by encoding.
+# Input:
+#   n/a
+# Returns:
+#   Dictionary mapping (type, opcode, function code) to names.
+def names():
+    if not _names:
+        instruction_table.load()
+        table = {}
+        for name in instruction_table.instruction_table:
+            type_id, opcode, funcode = instruction_table.get_info(name)
+            if type_id != InstructionType.R:
+                funcode = 0
+                # i-type and j-type share the opcode space
+                type_id = None
+            table[(type_id, opcode, funcode)] = name
+        _names.update(table)
+    return _names
+
+
+# Returns a value as a signed integer of a given width.
+# Input:
+#   value - The unsigned field.
+#   width - The number of bits.
+# Returns:
+#   int
+def _signed(value, width):
+    return alu.signed(value & ((1 << width) - 1), width)
+
+
+# Decodes an instruction word.
+# Input:
+#   word - The instruction as an unsigned 32 bit integer.
+# Returns:
+#   The decoded instruction.
+# Throws:
+#   ValueError - The word isn't a known instruction.
+def decode(word):
+    table = names()
+    opcode = word >> 26
+    rs1 = (word >> 21) & 0x1f
+    if (InstructionType.R, opcode, word & 0x7ff) in table:
+        return Decoded(
+            table[(InstructionType.R, opcode, word & 0x7ff)],
+            InstructionType.R,
+            rd=(word >> 11) & 0x1f,
+            rs1=rs1,
+            rs2=(word >> 16) & 0x1f
+        )
+    name = table.get((None, opcode, 0))
+    if name is None:
+        raise ValueError("invalid instruction 0x{0:08x}".format(word))
+    type_id = instruction_table.get_type(name)
+    if type_id == InstructionType.J:
+        return Decoded(name, type_id, immediate=_signed(word, 26))
+    immediate = word & 0xffff
+    if name not in unsigned_immediates:
+        immediate = _signed(immediate, 16)
+    return Decoded(
+        name,
+        type_id,
+        rd=(word >> 16) & 0x1f,
+        rs1=rs1,
+        immediate=immediate
+    )
@@ -0,0 +1,493 @@
+import heapq
+import itertools
+import struct
+import sys
+
+# base addresses of the devices
+console_base = 0xffff0000
+timer_base = 0xffff0100
+disk_base = 0xffff0200
+# bytes of a disk block
+block_size = 512
+# instructions a disk transfer takes to start, and for each block, by default
+default_disk_latency = 1000
+default_block_latency = 100
+
+# console status bits
+input_ready = 0x1
+output_ready = 0x2
+# timer status bits
+expired = 0x1
+# timer control bits
+periodic = 0x1
+# disk commands
+read_blocks = 1
+write_blocks = 2
+# disk status bits
+busy = 0x1
+failed = 0x2
+done = 0x4
+
+_console_state = struct.Struct("<Q")
+_timer_state = struct.Struct("<QIII")
+_disk_state = struct.Struct("<QIIIII")
+
+
+# Fires the events of devices in time order, where time is the number of
+# instructions the machine has executed.
+class Scheduler(object):
+    def __init__(self):
+        # heap of (time, sequence, function called with the time)
+        self.events = []
+        # the time of the first event, infinite if there is none
+        self.next_time = float("inf")
+        # events fired
+        self.fired = 0
+        self._sequence = itertools.count()
+
+    # Schedules an event.
+    # Input:
+    #   time - The time of the event.
+    #   function - The function called with the time of the event.
+    # Returns:
+    #   n/a
+    def schedule(self, time, function):
+        heapq.heappush(self.events, (time, next(self._sequence), function))
+        self.next_time = self.events[0][0]
+
+    # Fires the events due.
+    # Input:
+    #   now - The current time.
+    # Returns:
+    #   n/a
+    def fire(self, now):
+        events = self.events
+        while events and events[0][0] <= now:
+            time, _, function = heapq.heappop(events)
+            self.fired += 1
+            function(time)
+        self.next_time = events[0][0] if events else float("inf")
+
+    # Removes every event.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def clear(self):
+        del self.events[:]
+        self.next_time = float("inf")
+
+
+# A memory mapped device, with 32 bit registers at offsets from its base
+# address. Registers are read and written with aligned word accesses.
+class Device(object):
+    # Input:
+    #   name - The device name, which identifies it in snapshots.
+    #   base - The address of the first register.
+    #   size - The bytes of registers.
+    def __init__(self, name, base, size):
+        self.name = name
+        self.base = base
+        self.size = size
+        self.machine = None
+        self.scheduler = None
+
+    # Adds the device to a machine.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    #   scheduler - The machine's event scheduler.
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - The device overlaps another device.
+    def attach(self, machine, scheduler):
+        machine.add_device(self)
+        self.machine = machine
+        self.scheduler = scheduler
+
+    # Reads a register.
+    # Input:
+    #   offset - The register offset.
+    # Returns:
+    #   Unsigned 32 bit integer.
+    def read(self, offset):
+        return 0
+
+    # Writes a register.
+    # Input:
+    #   offset - The register offset.
+    #   value - Unsigned 32 bit integer.
+    # Returns:
+    #   n/a
+    def write(self, offset, value):
+        pass
+
+    # Returns true if reading a register has no effect and its value only
+    # changes with writes and events, so a loop polling it can be skipped
+    # until the next event.
+    # Input:
+    #   offset - The register offset.
+    # Returns:
+    #   bool
+    def stable(self, offset):
+        return True
+
+    # Returns the state of the device, for snapshots.
+    # Input:
+    #   n/a
+    # Returns:
+    #   str
+    def save(self):
+        return ""
+
+    # Restores the state of the device from a snapshot, scheduling its
+    # pending events.
+    # Input:
+    #   data - The state returned by save.
+    # Returns:
+    #   n/a
+    def restore(self, data):
+        pass
+
+
+# A console with a data register at offset 0 and a status register at
+# offset 4. Writing data outputs a byte, and reading it takes the next byte
+# of input, or 0 if there is none. Output is always ready.
+class Console(Device):
+    # Input:
+    #   data - The string of input.
+    #   out - The file output is written to.
+    def __init__(self, data="", out=sys.stdout):
+        Device.__init__(self, "console", console_base, 8)
+        self.data = data
+        self.position = 0
+        self.out = out
+
+    # See Device.read.
+    def read(self, offset):
+        if offset == 0:
+            if self.position == len(self.data):
+                return 0
+            self.position += 1
+            return ord(self.data[self.position - 1])
+        if offset == 4:
+            ready = output_ready
+            if self.position < len(self.data):
+                ready |= input_ready
+            return ready
+        return 0
+
+    # See Device.write.
+    def write(self, offset, value):
+        if offset == 0:
+            self.out.write(chr(value & 0xff))
+
+    # See Device.stable.
+    def stable(self, offset):
+        return offset != 0
+
+    # See Device.save.
+    def save(self):
+        return _console_state.pack(self.position)
+
+    # See Device.restore.
+    def restore(self, data):
+        self.position = min(_console_state.unpack(data)[0], len(self.data))
+
+
+# A timer with registers at offsets:
+#   0 - The time, in instructions executed (read only).
+#   4 - The interval. Writing it starts the timer, which expires after that
+#       many instructions, or stops it if 0.
+#   8 - The status. Bit 0 is set when the timer expires, and writing 1 bits
+#       clears them.
+#   12 - The control. If bit 0 is set, the timer restarts when it expires.
+class Timer(Device):
+    def __init__(self):
+        Device.__init__(self, "timer", timer_base, 16)
+        self.interval = 0
+        self.status = 0
+        self.control = 0
+        # the time the timer expires, or None if it is stopped
+        self.deadline = None
+
+    # See Device.read.
+    def read(self, offset):
+        if offset == 0:
+            return self.machine.executed & 0xffffffff
+        return {4: self.interval, 8: self.status, 12: self.control}.get(
+            offset, 0
+        )
+
+    # See Device.write.
+    def write(self, offset, value):
+        if offset == 4:
+            self.interval = value
+            self._start(self.machine.executed + value if value else None)
+        elif offset == 8:
+            self.status &= ~value
+        elif offset == 12:
+            self.control = value
+
+    # See Device.stable.
+    def stable(self, offset):
+        return offset != 0
+
+    # See Device.save.
+    def save(self):
+        return _timer_state.pack(
+            0 if self.deadline is None else self.deadline + 1,
+            self.interval, self.status, self.control
+        )
+
+    # See Device.restore.
+    def restore(self, data):
+        deadline, self.interval, self.status, self.control = \
+            _timer_state.unpack(data)
+        self._start(deadline - 1 if deadline else None)
+
+    # Starts or stops the timer.
+    # Input:
+    #   deadline - The time the timer expires, or None to stop it.
+    # Returns:
+    #   n/a
+    def _start(self, deadline):
+        self.deadline = deadline
+        if deadline is not None:
+            self.scheduler.schedule(deadline, self._expire)
+
+    # Expires the timer, unless it was restarted or stopped since the event
+    # was scheduled.
+    # Input:
+    #   time - The time of the event.
+    # Returns:
+    #   n/a
+    def _expire(self, time):
+        if time != self.deadline:
+            return
+        self.status |= expired
+        if self.control & periodic and self.interval:
+            self._start(time + self.interval)
+        else:
+            self.deadline = None
+
+
+# A block storage device backed by a host file, which transfers blocks
+# directly between the file and memory. Registers are at offsets:
+#   0 - The first block.
+#   4 - The memory address.
+#   8 - The number of blocks.
+#   12 - The command. Writing read_blocks or write_blocks starts a transfer,
+#        which completes after a latency.
+#   16 - The status: busy while a transfer runs, then done, or failed if the
+#        blocks or memory were out of range. Writing 1 bits clears them.
+# The file isn't part of snapshots.
+class Disk(Device):
+    # Input:
+    #   name - The file name.
+    #   latency - Instructions a transfer takes to start.
+    #   block_latency - Instructions a transfer takes for each block.
+    # Throws:
+    #   IOError - The file couldn't be opened.
+    def __init__(self, name, latency=default_disk_latency,
+                 block_latency=default_block_latency):
+        Device.__init__(self, "disk", disk_base, 20)
+        self.f = open(name, "r+b")
+        self.f.seek(0, 2)
+        self.blocks = self.f.tell() // block_size
+        self.latency = latency
+        self.block_latency = block_latency
+        self.block = 0
+        self.address = 0
+        self.count = 0
+        self.command = 0
+        self.status = 0
+        # the time the transfer completes, or None if there is none
+        self.deadline = None
+
+    # See Device.read.
+    def read(self, offset):
+        return {
+            0: self.block,
+            4: self.address,
+            8: self.count,
+            12: self.command,
+            16: self.status
+        }.get(offset, 0)
+
+    # See Device.write.
+    def write(self, offset, value):
+        if offset == 0:
+            self.block = value
+        elif offset == 4:
+            self.address = value
+        elif offset == 8:
+            self.count = value
+        elif offset == 12 and not self.status & busy:
+            self.command = value
+            if value in (read_blocks, write_blocks):
+                self.status = busy
+                self._start(self.machine.executed + self.latency +
+                            self.block_latency * self.count)
+        elif offset == 16:
+            self.status &= ~value
+
+    # See Device.save.
+    def save(self):
+        return _disk_state.pack(
+            0 if self.deadline is None else self.deadline + 1,
+            self.block, self.address, self.count, self.command, self.status
+        )
+
+    # See Device.restore.
+    def restore(self, data):
+        deadline, self.block, self.address, self.count, self.command, \
+            self.status = _disk_state.unpack(data)
+        self._start(deadline - 1 if deadline else None)
+
+    # Schedules the completion of a transfer.
+    # Input:
+    #   deadline - The time it completes, or None if there is no transfer.
+    # Returns:
+    #   n/a
+    def _start(self, deadline):
+        self.deadline = deadline
+        if deadline is not None:
+            self.scheduler.schedule(deadline, self._complete)
+
+    # Completes a transfer, copying the blocks.
+    # Input:
+    #   time - The time of the event.
+    # Returns:
+    #   n/a
+    def _complete(self, time):
+        if time != self.deadline:
+            return
+        self.deadline = None
+        length = self.count * block_size
+        memory = self.machine.memory
+        if self.block + self.count > self.blocks or \
+                self.address + length > memory.size:
+            self.status = failed
+            return
+        self.f.seek(self.block * block_size)
+        if self.command == read_blocks:
+            memory.write_bytes(self.address, self.f.read(length))
+        else:
+            self.f.write(memory.read_bytes(self.address, length))
+            self.f.flush()
+        self.status = done
+
+
+# Skips the iterations of loops that poll devices. A loop is detected at a
+# taken backward branch that reaches the branch again with the same
+# registers, no events fired, no stores, no trap handlers run, and only
+# stable device reads in between. The loop then repeats unchanged until the
+# next event, so the iterations before it are skipped (see Machine.skip).
+class IdleDetector(object):
+    def __init__(self):
+        self.machine = None
+        # (branch address, registers, events fired) and the time of the
+        # last backward branch
+        self.loop = None
+        self.time = 0
+        # true if nothing since the last backward branch changed the state
+        self.quiet = False
+
+    # Adds the detector to a machine's hooks.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        self.machine = machine
+        machine.access_hooks.append(self.access)
+        machine.branch_hooks.append(self.branch)
+        machine.trap_hooks.append(self.trap)
+
+    # Notes whether an access changes the state.
+    # Input:
+    #   pc - The instruction address.
+    #   address - The data address.
+    #   size - The access size.
+    #   is_store - True for a store.
+    # Returns:
+    #   n/a
+    def access(self, pc, address, size, is_store):
+        if not self.quiet:
+            return
+        device = self.machine.device(address)
+        if is_store or device is not None and \
+                not device.stable(address - device.base):
+            self.quiet = False
+
+    # Notes a trap handler, which may change memory or state outside the
+    # machine.
+    # Input:
+    #   pc - The trap address.
+    #   code - The trap code.
+    # Returns:
+    #   n/a
+    def trap(self, pc, code):
+        self.quiet = False
+
+    # Skips the loop ending at a branch if it repeats unchanged.
+    # Input:
+    #   pc - The branch address.
+    #   taken - True if the branch was taken.
+    #   target - The address the branch goes to when taken.
+    # Returns:
+    #   n/a
+    def branch(self, pc, taken, target):
+        if not taken or target > pc:
+            return
+        m = self.machine
+        fired = m.scheduler.fired if m.scheduler is not None else 0
+        loop = (pc, tuple(m.gpr), tuple(m.fpr), fired)
+        if self.quiet and loop == self.loop:
+            m.skip(m.executed - self.time)
+        self.loop = loop
+        self.time = m.executed
+        self.quiet = True
+
+
+# Simulates the console, timer, and disk devices of a machine, skipping the
+# loops that poll them.
+class DeviceSimulation(object):
+    # Input:
+    #   disk - The disk file name, or None for no disk.
+    #   data - The string of console input.
+    #   out - The file console output is written to.
+    #   idle_skip - True to skip polling loops.
+    # Throws:
+    #   IOError - The disk file couldn't be opened.
+    def __init__(self, disk=None, data="", out=sys.stdout, idle_skip=True):
+        self.scheduler = Scheduler()
+        self.devices = [Console(data, out), Timer()]
+        if disk is not None:
+            self.devices.append(Disk(disk))
+        self.idle_skip = idle_skip
+
+    # Adds the devices to a machine.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - A device overlaps another device.
+    def attach(self, machine):
+        machine.scheduler = self.scheduler
+        for device in self.devices:
+            device.attach(machine, self.scheduler)
+        if self.idle_skip:
+            IdleDetector().attach(machine)
+        self.machine = machine
+
+    # Returns a report of the device events and the instructions skipped.
+    # Input:
+    #   image - The program image.
+    # Returns:
+    #   The report as a string.
+    def report(self, image):
+        return "Devices: {0} events, {1} instructions skipped in idle " \
+            "loops".format(self.scheduler.fired, self.machine.skipped)
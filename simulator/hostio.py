@@ -0,0 +1,211 @@
+import sys
+from simulator.machine import halted
+
+# trap codes
+exit_trap = 1
+open_trap = 2
+read_trap = 3
+write_trap = 4
+close_trap = 5
+# open modes
+read_mode = 0
+write_mode = 1
+append_mode = 2
+# bytes of host side buffering of each open file
+buffer_size = 1 << 20
+# longest file name read from memory
+max_path = 4096
+# the value returned in r1 by failed traps
+error = 0xffffffff
+
+_modes = {read_mode: "rb", write_mode: "wb", append_mode: "ab"}
+
+
+# Gives a machine access to host files and the console through traps, with
+# the arguments in r1, r2, and r3 and the result in r1:
+#   trap 1 - exit(status): halts the machine with an exit status.
+#   trap 2 - open(path, mode): opens the file whose NUL terminated name is at
+#            address path, for reading, writing, or appending (read_mode,
+#            write_mode, or append_mode). Returns a file descriptor.
+#   trap 3 - read(fd, address, length): reads up to length bytes to
+#            memory. Returns the bytes read, 0 at the end of the file.
+#   trap 4 - write(fd, address, length): writes length bytes from memory.
+#            Returns the bytes written.
+#   trap 5 - close(fd): closes a file. Returns 0.
+# Failed traps return error (-1). File descriptors 0, 1, and 2 are the
+# console input, output, and error. Files are read and written through large
+# host buffers, with each transfer copied between the buffer and memory in
+# one piece. Open files aren't part of snapshots.
+class HostIO(object):
+    # Input:
+    #   stdin - The file console input is read from.
+    #   stdout - The file console output is written to.
+    #   stderr - The file console errors are written to.
+    def __init__(self, stdin=sys.stdin, stdout=sys.stdout,
+                 stderr=sys.stderr):
+        # file descriptor -> open file
+        self.files = {0: stdin, 1: stdout, 2: stderr}
+        self.machine = None
+        # the exit status, or None if the program didn't exit
+        self.status = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    # Adds the trap handlers to a machine.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        self.machine = machine
+        machine.traps.update({
+            exit_trap: self.exit,
+            open_trap: self.open,
+            read_trap: self.read,
+            write_trap: self.write,
+            close_trap: self.close
+        })
+
+    # Halts the machine with the exit status in r1.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def exit(self):
+        self.status = self.machine.gpr[1]
+        self.machine.state = halted
+
+    # Opens the file named at the address in r1 with the mode in r2.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def open(self):
+        gpr = self.machine.gpr
+        path = self._path(gpr[1])
+        mode = _modes.get(gpr[2])
+        if path is None or mode is None:
+            gpr[1] = error
+            return
+        try:
+            f = open(path, mode, buffer_size)
+        except IOError:
+            gpr[1] = error
+            return
+        fd = 3
+        while fd in self.files:
+            fd += 1
+        self.files[fd] = f
+        gpr[1] = fd
+
+    # Reads up to r3 bytes from the file r1 to the address in r2.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def read(self):
+        gpr = self.machine.gpr
+        f = self.files.get(gpr[1])
+        if f is None or not self._valid(gpr[2], gpr[3]):
+            gpr[1] = error
+            return
+        try:
+            data = f.read(gpr[3])
+        except IOError:
+            gpr[1] = error
+            return
+        self.machine.memory.write_bytes(gpr[2], data)
+        self.bytes_read += len(data)
+        gpr[1] = len(data)
+
+    # Writes r3 bytes from the address in r2 to the file r1.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def write(self):
+        gpr = self.machine.gpr
+        f = self.files.get(gpr[1])
+        if f is None or not self._valid(gpr[2], gpr[3]):
+            gpr[1] = error
+            return
+        try:
+            f.write(self.machine.memory.read_bytes(gpr[2], gpr[3]))
+        except IOError:
+            gpr[1] = error
+            return
+        self.bytes_written += gpr[3]
+        gpr[1] = gpr[3]
+
+    # Closes the file r1. The console files are flushed but stay open.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def close(self):
+        gpr = self.machine.gpr
+        f = self.files.get(gpr[1])
+        if f is None:
+            gpr[1] = error
+            return
+        try:
+            if gpr[1] > 2:
+                del self.files[gpr[1]]
+                f.close()
+            else:
+                f.flush()
+        except IOError:
+            gpr[1] = error
+            return
+        gpr[1] = 0
+
+    # Closes the files the program left open and flushes the console.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    # Throws:
+    #   IOError - A file couldn't be written.
+    def close_all(self):
+        for fd in sorted(self.files):
+            if fd > 2:
+                self.files.pop(fd).close()
+            else:
+                self.files[fd].flush()
+
+    # Returns a report of the host I/O of the run.
+    # Input:
+    #   image - The program image.
+    # Returns:
+    #   The report as a string.
+    def report(self, image):
+        out = "Host I/O: {0} bytes read, {1} bytes written".format(
+            self.bytes_read, self.bytes_written
+        )
+        if self.status is not None:
+            out += ", exit status {0}".format(self.status)
+        return out
+
+    # Returns true if a range of bytes is inside memory.
+    # Input:
+    #   address - The first address.
+    #   length - The number of bytes.
+    # Returns:
+    #   bool
+    def _valid(self, address, length):
+        return address + length <= self.machine.memory.size
+
+    # Reads a NUL terminated file name from memory.
+    # Input:
+    #   address - The address of the name.
+    # Returns:
+    #   The name, or None if it isn't terminated within max_path bytes or
+    #   memory.
+    def _path(self, address):
+        size = self.machine.memory.size
+        length = min(max_path, size - address) if address < size else 0
+        data = bytes(self.machine.memory.read_bytes(address, length))
+        end = data.find("\0")
+        if end < 0:
+            return None
+        return data[:end]
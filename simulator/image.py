@@ -0,0 +1,279 @@
+import binascii
+import bisect
+import hashlib
+import struct
+from instructions.instruction import Instruction
+from simulator.paging import PagedMemory
+
+# descriptions of data chunks in an assembled listing
+data_descriptions = ("word", "float", "double", "string")
+# first bytes of a segment file
+segments_magic = "DLXSEG01"
+# segment file header after the magic: number of segments
+segments_header = struct.Struct("<I")
+# segment header: address, bytes of data
+segment_header = struct.Struct("<II")
+
+
+# An assembled program as the contents of memory, with the source line of
+# each chunk and the addresses of instructions for reports.
+class ProgramImage(object):
+    def __init__(self):
+        # address -> string of the chunk's bytes
+        self.chunks = {}
+        # address -> source line number, 0 if unknown
+        self.lines = {}
+        # addresses of the instructions
+        self.code = set()
+        # label name -> address
+        self.symbol_table = {}
+        # sorted (address, label) and sorted instruction addresses, built on
+        # first use
+        self._labels = None
+        self._code = None
+
+    # Adds a chunk of memory.
+    # Input:
+    #   address - The address of the chunk.
+    #   data - String of the chunk's bytes.
+    #   line_no - The source line, 0 if unknown.
+    #   is_code - True if the chunk is an instruction.
+    # Returns:
+    #   n/a
+    def add(self, address, data, line_no=0, is_code=False):
+        self.chunks[address] = data
+        self.lines[address] = line_no
+        if is_code:
+            self.code.add(address)
+
+    # Returns the address execution starts at, which is the first
+    # instruction.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The address.
+    def entry(self):
+        if self.code:
+            return min(self.code)
+        return min(self.chunks) if self.chunks else 0
+
+    # Returns the lowest address and the address after the highest chunk.
+    # Input:
+    #   n/a
+    # Returns:
+    #   (low address, high address)
+    def extent(self):
+        if not self.chunks:
+            return 0, 0
+        high = max(a + len(d) for a, d in self.chunks.iteritems())
+        return min(self.chunks), high
+
+    # Returns the label of the code or data holding an address, which is the
+    # nearest label at or below it. An instruction belongs to the label only
+    # if the label is on the run of instructions holding it, and other
+    # addresses only if no instruction lies between them and the label, so
+    # space reserved after a data label counts as its data.
+    # Input:
+    #   address - The address.
+    # Returns:
+    #   The label, or the address in hex if no label holds the address.
+    def label(self, address):
+        if self._labels is None:
+            self._labels = sorted(
+                (a, name) for name, a in self.symbol_table.iteritems()
+            )
+            self._code = sorted(self.code)
+        n = bisect.bisect_right(self._labels, (address, chr(255))) - 1
+        if n >= 0:
+            low, name = self._labels[n]
+            code = self._code
+            first = bisect.bisect_left(code, low)
+            if address in self.code:
+                last = bisect.bisect_left(code, address)
+                if code[first] == low and \
+                   address - low == (last - first) * 4:
+                    return name
+            elif first == len(code) or code[first] > address:
+                return name
+        return "0x{0:08x}".format(address)
+
+    # Returns a hash of the contents of memory, which identifies the image.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The hash as a hex string.
+    def digest(self):
+        h = hashlib.sha1()
+        for address, data in self.segments():
+            h.update(struct.pack("<II", address, len(data)))
+            h.update(bytes(data))
+        return h.hexdigest()
+
+    # Returns a sparse memory holding the image.
+    # Input:
+    #   size - Bytes of memory.
+    # Returns:
+    #   The memory (see simulator.paging).
+    # Throws:
+    #   ValueError - The image doesn't fit in memory.
+    def memory(self, size):
+        memory = PagedMemory(size)
+        for address, data in self.segments():
+            if address + len(data) > size:
+                raise ValueError("image doesn't fit in memory")
+            memory.write_bytes(address, data)
+        return memory
+
+    # Returns the decoded instruction at an address, for images that keep
+    # their instructions decoded.
+    # Input:
+    #   address - The address.
+    # Returns:
+    #   The decoded instruction (see simulator.decode), or None to decode it
+    #   from memory.
+    def decoded(self, address):
+        return None
+
+    # Returns the address ranges of the contiguous runs of memory in the
+    # image.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of (low address, high address) in address order.
+    def ranges(self):
+        return [(a, a + len(data)) for a, data in self.segments()]
+
+    # Returns the contiguous runs of memory in the image.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of (address, bytearray) in address order.
+    def segments(self):
+        runs = []
+        for address in sorted(self.chunks):
+            data = self.chunks[address]
+            if runs and runs[-1][0] + len(runs[-1][1]) == address:
+                runs[-1][1].extend(data)
+            else:
+                runs.append((address, bytearray(data)))
+        return runs
+
+
+# Creates the image of an assembled program.
+# Input:
+#   program - The program (mapping addresses to memory).
+#   symbol_table - The symbol table (mapping strings to addresses).
+# Returns:
+#   The image.
+def from_program(program, symbol_table):
+    image = ProgramImage()
+    for address in sorted(program):
+        mem = program[address]
+        image.add(
+            address,
+            binascii.unhexlify(mem.output_string()),
+            mem.line_no,
+            isinstance(mem, Instruction)
+        )
+    image.symbol_table = dict(symbol_table)
+    return image
+
+
+# Loads the image of a program from an assembled listing, with one
+# "<address>: <hex bytes> # <description>" line per chunk. Listings have no
+# source lines or labels.
+# Input:
+#   name - The file name.
+# Returns:
+#   The image.
+# Throws:
+#   IOError - The file couldn't be read.
+#   ValueError - A line is invalid.
+def load(name):
+    image = ProgramImage()
+    with open(name, "r") as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                address, rest = line.split(":", 1)
+                data, _, description = rest.partition("#")
+                words = description.split()
+                image.add(
+                    int(address, 16),
+                    binascii.unhexlify(data.strip()),
+                    0,
+                    bool(words) and words[0] not in data_descriptions
+                )
+            except (ValueError, TypeError):
+                raise ValueError("{0} line {1}: invalid listing line".format(
+                    name,
+                    line_no + 1
+                ))
+    return image
+
+
+# Writes the memory of an image as a raw file, with each byte at the offset
+# of its address. The holes between segments are skipped with seeks, so they
+# take no space on file systems with sparse files.
+# Input:
+#   image - The image.
+#   name - The file name.
+# Returns:
+#   n/a
+# Throws:
+#   IOError - The file couldn't be written.
+def write_raw(image, name):
+    with open(name, "wb") as f:
+        for address, data in image.segments():
+            f.seek(address)
+            f.write(data)
+
+
+# Writes the memory of an image as a list of segments: segments_magic, the
+# number of segments, and the address, length, and bytes of each segment.
+# Input:
+#   image - The image.
+#   name - The file name.
+# Returns:
+#   n/a
+# Throws:
+#   IOError - The file couldn't be written.
+def write_segments(image, name):
+    segments = image.segments()
+    with open(name, "wb") as f:
+        f.write(segments_magic)
+        f.write(segments_header.pack(len(segments)))
+        for address, data in segments:
+            f.write(segment_header.pack(address, len(data)))
+            f.write(data)
+
+
+# Loads the image of a program from a segment file (see write_segments).
+# Segment files have no source lines, labels, or instruction addresses.
+# Input:
+#   name - The file name.
+# Returns:
+#   The image.
+# Throws:
+#   IOError - The file couldn't be read.
+#   ValueError - The file isn't a valid segment file.
+def load_segments(name):
+    image = ProgramImage()
+    with open(name, "rb") as f:
+        if f.read(len(segments_magic)) != segments_magic:
+            raise ValueError("{0} isn't a segment file".format(name))
+        try:
+            count = segments_header.unpack(f.read(segments_header.size))[0]
+            for _ in xrange(count):
+                address, length = segment_header.unpack(
+                    f.read(segment_header.size)
+                )
+                data = f.read(length)
+                if len(data) != length:
+                    raise ValueError("segment at 0x{0:08x} is cut "
+                                     "short".format(address))
+                image.add(address, data)
+        except struct.error:
+            raise ValueError("{0} is cut short".format(name))
+    return image
@@ -0,0 +1,628 @@
+import math
+import struct
+from optimizer import alu
+from simulator.decode import decode
+from simulator.paging import page_bits
+
+# machine states
+running = 0
+halted = 1
+faulted = 2
+
+# bytes of memory given to a program beyond its image by default
+default_headroom = 0x10000
+# instructions run before a simulation is stopped by default
+default_max_steps = 10000000
+# size of the memory access of each load and store
+access_sizes = {
+    "lb": 1, "lbu": 1, "sb": 1,
+    "lh": 2, "lhu": 2, "sh": 2,
+    "lw": 4, "lf": 4, "sw": 4, "sf": 4,
+    "ld": 8, "sd": 8
+}
+# signed loads
+signed_loads = ("lb", "lh")
+# loads and stores of floating point registers
+fp_accesses = ("lf", "ld", "sf", "sd")
+# floating point instruction -> (operation, source width, result width),
+# where widths are "f" for single, "d" for double, and "i" for an integer in a
+# floating point register
+fp_operations = {
+    "addf": ("add", "f", "f"),
+    "subf": ("sub", "f", "f"),
+    "multf": ("mult", "f", "f"),
+    "divf": ("div", "f", "f"),
+    "addd": ("add", "d", "d"),
+    "subd": ("sub", "d", "d"),
+    "multd": ("mult", "d", "d"),
+    "divd": ("div", "d", "d"),
+    "cvtf2d": (None, "f", "d"),
+    "cvtf2i": (None, "f", "i"),
+    "cvtd2f": (None, "d", "f"),
+    "cvtd2i": (None, "d", "i"),
+    "cvti2f": (None, "i", "f"),
+    "cvti2d": (None, "i", "d"),
+    "movf": (None, "f", "f"),
+    "movd": (None, "d", "d")
+}
+# integer multiplies and divides, which use floating point registers
+int_fp_operations = ("mult", "multu", "div", "divu")
+
+_word = struct.Struct(">I")
+_single = struct.Struct(">f")
+_double = struct.Struct(">d")
+_pair = struct.Struct(">II")
+
+
+# Returns the quotient of two floats with IEEE results for division by zero.
+# Input:
+#   a - The dividend.
+#   b - The divisor.
+# Returns:
+#   float
+def _divide(a, b):
+    if b != 0:
+        return a / b
+    if a == 0 or math.isnan(a):
+        return float("nan")
+    return math.copysign(float("inf"), a) * math.copysign(1.0, b)
+
+
+# floating point operation -> function of two floats
+_fp_functions = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mult": lambda a, b: a * b,
+    "div": _divide
+}
+
+
+# Returns the bits of a single precision value, rounding doubles to single
+# precision.
+# Input:
+#   value - The value.
+# Returns:
+#   Unsigned 32 bit integer.
+def _single_bits(value):
+    try:
+        return _word.unpack(_single.pack(value))[0]
+    except OverflowError:
+        return 0x7f800000 if value > 0 else 0xff800000
+
+
+# Returns the registers an instruction writes, numbered 0 to 31 for the
+# general registers and 32 to 63 for the floating point registers. Writes to
+# r0 are left out. Traps other than trap 0 may return a value in r1.
+# Input:
+#   d - The decoded instruction (see simulator.decode).
+# Returns:
+#   List of register numbers.
+def written_registers(d):
+    name = d.name
+    if name in ("jal", "jalr"):
+        return [31]
+    if name == "trap":
+        return [1] if d.immediate else []
+    if name in access_sizes and name[0] == "s":
+        return []
+    if name == "ld" or \
+            name in fp_operations and fp_operations[name][2] == "d":
+        return [32 + d.rd, 32 + (d.rd + 1) % 32]
+    if name in ("lf", "movi2fp") or name in fp_operations or \
+            name in int_fp_operations:
+        return [32 + d.rd]
+    if d.rd and (name in access_sizes or name in alu.operations or
+                 name == "movfp2i"):
+        return [d.rd]
+    return []
+
+
+# Simulates one instance of a program, one instruction at a time. Each
+# instruction is decoded the first time it executes, or taken from the
+# image's decoded instructions (see simulator.shared) while its page hasn't
+# been written. trap 0 halts the machine, other traps call their handler
+# (see simulator.hostio), and traps without one are ignored.
+# Invalid instructions, unaligned accesses, and accesses outside memory and
+# devices stop the machine with a fault. Stores to instructions don't change
+# the decoded instructions. Time is counted in instructions executed, which
+# drives the events of memory mapped devices (see simulator.devices).
+class Machine(object):
+    # Input:
+    #   image - The program image (see simulator.image).
+    #   memory_size - Bytes of memory, from address 0, up to 4 GB. The
+    #                 default covers the image and default_headroom bytes.
+    #                 Memory is allocated in pages as it is written, so
+    #                 large sparse memories are cheap.
+    #   entry - The address execution starts at, default the image's entry.
+    # Throws:
+    #   ValueError - The image doesn't fit in memory.
+    def __init__(self, image, memory_size=None, entry=None):
+        if memory_size is None:
+            memory_size = min(image.extent()[1] + default_headroom, 1 << 32)
+        self.image = image
+        self.memory = image.memory(memory_size)
+        # unsigned 32 bit values, with doubles in even/odd pairs of floating
+        # point registers, high word first
+        self.gpr = [0] * 32
+        self.fpr = [0] * 32
+        self.pc = image.entry() if entry is None else entry
+        self.state = running
+        # description of the fault that stopped the machine
+        self.fault = None
+        # instructions executed
+        self.executed = 0
+        # functions called with the address of each instruction executed
+        self.fetch_hooks = []
+        # functions called with (instruction address, address, size, is
+        # store) for each load and store
+        self.access_hooks = []
+        # functions called with (branch address, taken, target) for each
+        # conditional branch
+        self.branch_hooks = []
+        # functions called with (instruction address, target) for each jal
+        # and jalr
+        self.call_hooks = []
+        # functions called with (instruction address, target) for each
+        # jr r31
+        self.return_hooks = []
+        # functions called with (instruction address, trap code) for each
+        # trap with a handler, before the handler runs
+        self.trap_hooks = []
+        # memory mapped devices (see simulator.devices), and the range of
+        # addresses they cover
+        self.devices = []
+        self._io_low = 0
+        self._io_high = 0
+        # event scheduler of the devices, or None
+        self.scheduler = None
+        # instructions skipped in idle loops (see skip)
+        self.skipped = 0
+        # trap code -> function of no arguments called when the trap
+        # executes, after the program counter moves past it
+        self.traps = {}
+        # the instruction count a run stops at, or None
+        self._limit = None
+        # address -> function executing the instruction
+        self._compiled = {}
+
+    # Returns the value of a register.
+    # Input:
+    #   name - The register name (e.g. "r1" or "f2").
+    # Returns:
+    #   Unsigned 32 bit integer.
+    def register(self, name):
+        return self._file(name)[int(name[1:])]
+
+    # Sets a register.
+    # Input:
+    #   name - The register name.
+    #   value - The value.
+    # Returns:
+    #   n/a
+    def set_register(self, name, value):
+        if name != "r0":
+            self._file(name)[int(name[1:])] = value & 0xffffffff
+
+    # Reads a big endian value from memory.
+    # Input:
+    #   address - The address.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   Unsigned integer.
+    # Throws:
+    #   ValueError - The access is unaligned or outside memory.
+    def read(self, address, size):
+        if not self._valid(address, size):
+            raise ValueError("invalid access at 0x{0:x}".format(address))
+        return self.memory.read(address, size)
+
+    # Writes a big endian value to memory.
+    # Input:
+    #   address - The address.
+    #   value - Unsigned integer.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - The access is unaligned or outside memory.
+    def write(self, address, value, size):
+        if not self._valid(address, size):
+            raise ValueError("invalid access at 0x{0:x}".format(address))
+        self.memory.write(address, value, size)
+
+    # Runs the machine until it stops, a number of instructions is reached,
+    # or it reaches a breakpoint. The instruction at a breakpoint isn't
+    # executed, except as the first instruction of the run, so a run can
+    # continue from a breakpoint.
+    # Input:
+    #   max_steps - The most instructions to execute, or None for no limit.
+    #   breakpoints - Set of addresses.
+    # Returns:
+    #   The number of instructions executed, including those skipped.
+    def run(self, max_steps=None, breakpoints=()):
+        if self.scheduler is not None:
+            return self._run_timed(max_steps, breakpoints)
+        taken = 0
+        compiled = self._compiled
+        fetch_hooks = self.fetch_hooks
+        while self.state == running and \
+                (max_steps is None or taken < max_steps):
+            pc = self.pc
+            if taken and pc in breakpoints:
+                break
+            for hook in fetch_hooks:
+                hook(pc)
+            execute = compiled.get(pc)
+            if execute is None:
+                execute = compiled[pc] = self._compile(pc)
+            execute()
+            taken += 1
+        self.executed += taken
+        return taken
+
+    # Runs the machine like run, keeping the instruction count current for
+    # the devices, and firing device events before the instruction at their
+    # time.
+    # Input:
+    #   max_steps - The most instructions to execute, or None for no limit.
+    #   breakpoints - Set of addresses.
+    # Returns:
+    #   The number of instructions executed, including those skipped.
+    def _run_timed(self, max_steps, breakpoints):
+        start = self.executed
+        self._limit = None if max_steps is None else start + max_steps
+        compiled = self._compiled
+        fetch_hooks = self.fetch_hooks
+        scheduler = self.scheduler
+        while self.state == running and \
+                (self._limit is None or self.executed < self._limit):
+            if self.executed >= scheduler.next_time:
+                scheduler.fire(self.executed)
+            pc = self.pc
+            if self.executed != start and pc in breakpoints:
+                break
+            for hook in fetch_hooks:
+                hook(pc)
+            execute = compiled.get(pc)
+            if execute is None:
+                execute = compiled[pc] = self._compile(pc)
+            execute()
+            self.executed += 1
+        self._limit = None
+        return self.executed - start
+
+    # Adds a memory mapped device, whose registers take the place of memory
+    # at its addresses.
+    # Input:
+    #   device - The device (see simulator.devices).
+    # Returns:
+    #   n/a
+    # Throws:
+    #   ValueError - The device overlaps another device.
+    def add_device(self, device):
+        for other in self.devices:
+            if device.base < other.base + other.size and \
+                    other.base < device.base + device.size:
+                raise ValueError("device {0} overlaps device {1}".format(
+                    device.name, other.name
+                ))
+        self.devices.append(device)
+        self._io_low = min(d.base for d in self.devices)
+        self._io_high = max(d.base + d.size for d in self.devices)
+
+    # Returns the device at an address.
+    # Input:
+    #   address - The address.
+    # Returns:
+    #   The device, or None if the address is memory.
+    def device(self, address):
+        if self._io_low <= address < self._io_high:
+            for device in self.devices:
+                if device.base <= address < device.base + device.size:
+                    return device
+        return None
+
+    # Skips the iterations of a loop that the caller knows repeat without
+    # effect until the next device event, such as a loop polling a device
+    # register. The iterations are counted as executed, but fetch and access
+    # hooks don't see them. Called during a run of a machine with a
+    # scheduler, at the end of an iteration, before its last instruction is
+    # counted.
+    # Input:
+    #   length - The instructions in an iteration.
+    # Returns:
+    #   The number of instructions skipped.
+    def skip(self, length):
+        until = self._limit
+        if self.scheduler.events and \
+                (until is None or self.scheduler.next_time < until):
+            until = self.scheduler.next_time
+        if until is None:
+            return 0
+        # the loop runs unchanged while its last instruction is before the
+        # event
+        count = max((until - self.executed - 1) // length, 0) * length
+        self.executed += count
+        self.skipped += count
+        return count
+
+    # Returns the register file holding a register.
+    # Input:
+    #   name - The register name.
+    # Returns:
+    #   The list of registers.
+    def _file(self, name):
+        return self.gpr if name[0] == "r" else self.fpr
+
+    # Returns true if an access is aligned and inside memory.
+    # Input:
+    #   address - The address.
+    #   size - The access size.
+    # Returns:
+    #   bool
+    def _valid(self, address, size):
+        return address % size == 0 and 0 <= address and \
+            address + size <= self.memory.size
+
+    # Stops the machine with a fault.
+    # Input:
+    #   description - What went wrong.
+    # Returns:
+    #   n/a
+    def _fault(self, description):
+        self.state = faulted
+        self.fault = "{0} at 0x{1:08x}".format(description, self.pc)
+
+    # Returns a floating point register value.
+    # Input:
+    #   reg - The register number (the first of a pair for doubles).
+    #   width - "f", "d", or "i" (see fp_operations).
+    # Returns:
+    #   float, or int for "i"
+    def _fp_read(self, reg, width):
+        fpr = self.fpr
+        if width == "d":
+            return _double.unpack(_pair.pack(fpr[reg], fpr[(reg + 1) % 32]))[0]
+        if width == "f":
+            return _single.unpack(_word.pack(fpr[reg]))[0]
+        return alu.signed(fpr[reg], 32)
+
+    # Writes a floating point register value.
+    # Input:
+    #   reg - The register number (the first of a pair for doubles).
+    #   width - "f", "d", or "i" (see fp_operations).
+    #   value - The value.
+    # Returns:
+    #   n/a
+    def _fp_write(self, reg, width, value):
+        fpr = self.fpr
+        if width == "d":
+            fpr[reg], fpr[(reg + 1) % 32] = _pair.unpack(_double.pack(value))
+        elif width == "f":
+            fpr[reg] = _single_bits(value)
+        else:
+            fpr[reg] = int(value) & 0xffffffff
+
+    # Builds the function executing the instruction at an address.
+    # Input:
+    #   pc - The address.
+    # Returns:
+    #   Function of no arguments.
+    def _compile(self, pc):
+        if not self._valid(pc, 4):
+            return lambda: self._fault("invalid instruction address")
+        d = None
+        if pc >> page_bits not in self.memory.pages:
+            # the page of the instruction hasn't been written
+            d = self.image.decoded(pc)
+        if d is None:
+            try:
+                d = decode(self.read(pc, 4))
+            except ValueError:
+                return lambda: self._fault("invalid instruction")
+        name = d.name
+        following = pc + 4
+        target = (pc + 4 + d.immediate) & 0xffffffff
+        gpr = self.gpr
+        fpr = self.fpr
+
+        def advance():
+            self.pc = following
+
+        if name == "nop":
+            return advance
+        if name == "trap":
+            if d.immediate != 0:
+                traps = self.traps
+                trap_hooks = self.trap_hooks
+
+                def trap():
+                    self.pc = following
+                    handler = traps.get(d.immediate)
+                    if handler is not None:
+                        for hook in trap_hooks:
+                            hook(pc, d.immediate)
+                        handler()
+                return trap
+
+            def halt():
+                self.pc = following
+                self.state = halted
+            return halt
+        if name in ("beqz", "bnez"):
+            taken_on = 0 if name == "beqz" else 1
+
+            hooks = self.branch_hooks
+
+            def branch():
+                taken = (gpr[d.rs1] != 0) == taken_on
+                for hook in hooks:
+                    hook(pc, taken, target)
+                self.pc = target if taken else following
+            return branch
+        if name in ("j", "jal"):
+            call_hooks = self.call_hooks if name == "jal" else []
+
+            def jump():
+                if name == "jal":
+                    gpr[31] = following
+                for hook in call_hooks:
+                    hook(pc, target)
+                self.pc = target
+            return jump
+        if name in ("jr", "jalr"):
+            if name == "jalr":
+                hooks = self.call_hooks
+            elif d.rs1 == 31:
+                hooks = self.return_hooks
+            else:
+                hooks = []
+
+            def jump_register():
+                destination = gpr[d.rs1]
+                if name == "jalr":
+                    gpr[31] = following
+                for hook in hooks:
+                    hook(pc, destination)
+                self.pc = destination
+            return jump_register
+        if name in access_sizes:
+            return self._compile_access(d, pc)
+        if name in alu.operations:
+            return self._compile_alu(d, following)
+        if name in fp_operations or name in int_fp_operations:
+            return self._compile_fp(d, following)
+        if name == "movfp2i":
+            def move_to_int():
+                if d.rd:
+                    gpr[d.rd] = fpr[d.rs1]
+                advance()
+            return move_to_int
+        if name == "movi2fp":
+            def move_to_fp():
+                fpr[d.rd] = gpr[d.rs1]
+                advance()
+            return move_to_fp
+        return lambda: self._fault("unsupported instruction " + name)
+
+    # Builds the function executing a load or store.
+    # Input:
+    #   d - The decoded instruction.
+    #   pc - The address of the instruction.
+    # Returns:
+    #   Function of no arguments.
+    def _compile_access(self, d, pc):
+        name = d.name
+        size = access_sizes[name]
+        is_store = name[0] == "s"
+        floating = name in fp_accesses
+        following = pc + 4
+        gpr = self.gpr
+        fpr = self.fpr
+        hooks = self.access_hooks
+
+        def access():
+            address = (gpr[d.rs1] + d.immediate) & 0xffffffff
+            device = None
+            if self._io_low <= address < self._io_high:
+                device = self.device(address)
+            if device is not None:
+                if size != 4 or address % 4:
+                    self._fault("invalid device access at 0x{0:x}".format(
+                        address
+                    ))
+                    return
+            elif not self._valid(address, size):
+                self._fault("invalid access at 0x{0:x}".format(address))
+                return
+            for hook in hooks:
+                hook(pc, address, size, is_store)
+            if is_store:
+                if size == 8:
+                    value = (fpr[d.rd] << 32) | fpr[(d.rd + 1) % 32]
+                else:
+                    value = fpr[d.rd] if floating else gpr[d.rd]
+                if device is None:
+                    self.memory.write(address, value, size)
+                else:
+                    device.write(address - device.base, value)
+            else:
+                if device is None:
+                    value = self.memory.read(address, size)
+                else:
+                    value = device.read(address - device.base)
+                if size == 8:
+                    fpr[d.rd] = value >> 32
+                    fpr[(d.rd + 1) % 32] = value & 0xffffffff
+                elif floating:
+                    fpr[d.rd] = value
+                elif d.rd:
+                    if name in signed_loads:
+                        value = alu.signed(value, 8 * size) & 0xffffffff
+                    gpr[d.rd] = value
+            self.pc = following
+        return access
+
+    # Builds the function executing an integer alu instruction.
+    # Input:
+    #   d - The decoded instruction.
+    #   following - The address of the next instruction.
+    # Returns:
+    #   Function of no arguments.
+    def _compile_alu(self, d, following):
+        function = alu.functions[alu.operations[d.name]]
+        immediate = None
+        if d.name not in alu.r_ops:
+            immediate = d.immediate & 0xffffffff
+        gpr = self.gpr
+
+        def execute():
+            if d.rd:
+                b = gpr[d.rs2] if immediate is None else immediate
+                gpr[d.rd] = function(gpr[d.rs1], b, 32) & 0xffffffff
+            self.pc = following
+        return execute
+
+    # Builds the function executing a floating point instruction, or an
+    # integer multiply or divide on floating point registers.
+    # Input:
+    #   d - The decoded instruction.
+    #   following - The address of the next instruction.
+    # Returns:
+    #   Function of no arguments.
+    def _compile_fp(self, d, following):
+        name = d.name
+        fpr = self.fpr
+
+        def execute_int():
+            a = fpr[d.rs1]
+            b = fpr[d.rs2]
+            if not name.endswith("u"):
+                a = alu.signed(a, 32)
+                b = alu.signed(b, 32)
+            if name.startswith("mult"):
+                result = a * b
+            elif b == 0:
+                result = 0
+            else:
+                # division truncates toward zero
+                result = abs(a) // abs(b)
+                if (a < 0) != (b < 0):
+                    result = -result
+            fpr[d.rd] = result & 0xffffffff
+            self.pc = following
+
+        if name in int_fp_operations:
+            return execute_int
+        operation, source, result = fp_operations[name]
+        function = _fp_functions.get(operation)
+
+        def execute():
+            a = self._fp_read(d.rs1, source)
+            if function is not None:
+                a = function(a, self._fp_read(d.rs2, source))
+            elif result == "i":
+                a = int(a) if not (math.isnan(a) or math.isinf(a)) else 0
+            self._fp_write(d.rd, result, a)
+            self.pc = following
+        return execute
@@ -0,0 +1,121 @@
+import struct
+
+# log2 of the page size
+page_bits = 12
+# bytes in a page
+page_size = 1 << page_bits
+# the contents of a page that hasn't been written
+zero_page = "\0" * page_size
+
+# access size -> big endian format
+_formats = {
+    1: struct.Struct(">B"),
+    2: struct.Struct(">H"),
+    4: struct.Struct(">I"),
+    8: struct.Struct(">Q")
+}
+
+
+# A sparse memory of up to 4 GB, held in fixed size pages that are allocated
+# the first time they are written. Pages may start out shared, as read only
+# buffers (such as slices of a shared memory map), which are copied the first
+# time they are written. Pages that are neither written nor shared read as
+# zeros. Callers check that accesses are inside the memory, and values are
+# read and written with aligned accesses, which never cross a page.
+class PagedMemory(object):
+    # Input:
+    #   size - Bytes of memory, from address 0.
+    #   shared - Dictionary mapping page numbers to read only buffers of
+    #            page_size bytes, or None.
+    def __init__(self, size, shared=None):
+        self.size = size
+        # page number -> bytearray of page_size bytes
+        self.pages = {}
+        self.shared = shared or {}
+
+    def __len__(self):
+        return self.size
+
+    # Returns a page for writing, allocating it or copying the shared page if
+    # it hasn't been written.
+    # Input:
+    #   number - The page number.
+    # Returns:
+    #   bytearray
+    def page(self, number):
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = bytearray(
+                self.shared.get(number, zero_page)
+            )
+        return page
+
+    # Returns a page for reading.
+    # Input:
+    #   number - The page number.
+    # Returns:
+    #   The page, or None if it is all zeros.
+    def readable(self, number):
+        page = self.pages.get(number)
+        if page is None:
+            return self.shared.get(number)
+        return page
+
+    # Reads a big endian value.
+    # Input:
+    #   address - The aligned address.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   Unsigned integer.
+    def read(self, address, size):
+        page = self.readable(address >> page_bits)
+        if page is None:
+            return 0
+        return _formats[size].unpack_from(page, address & (page_size - 1))[0]
+
+    # Writes a big endian value.
+    # Input:
+    #   address - The aligned address.
+    #   value - Unsigned integer of the access size.
+    #   size - The access size (1, 2, 4, or 8 bytes).
+    # Returns:
+    #   n/a
+    def write(self, address, value, size):
+        _formats[size].pack_into(self.page(address >> page_bits),
+                                 address & (page_size - 1), value)
+
+    # Reads a range of bytes, which may cross pages.
+    # Input:
+    #   address - The address.
+    #   length - The number of bytes.
+    # Returns:
+    #   bytearray
+    def read_bytes(self, address, length):
+        out = bytearray()
+        end = address + length
+        while address < end:
+            offset = address & (page_size - 1)
+            n = min(page_size - offset, end - address)
+            page = self.readable(address >> page_bits)
+            if page is None:
+                out += zero_page[:n]
+            else:
+                out += page[offset:offset + n]
+            address += n
+        return out
+
+    # Writes a range of bytes, which may cross pages.
+    # Input:
+    #   address - The address.
+    #   data - The bytes.
+    # Returns:
+    #   n/a
+    def write_bytes(self, address, data):
+        start = 0
+        while start < len(data):
+            offset = address & (page_size - 1)
+            n = min(page_size - offset, len(data) - start)
+            self.page(address >> page_bits)[offset:offset + n] = \
+                data[start:start + n]
+            address += n
+            start += n
@@ -0,0 +1,299 @@
+import array
+
+# log2 of the entries in a predictor table by default
+default_bits = 10
+
+
+# Predicts every branch the same way, or backward branches taken and forward
+# branches not taken (btfn).
+class StaticPredictor(object):
+    # kinds of static prediction
+    kinds = ("taken", "not_taken", "btfn")
+
+    # Input:
+    #   kind - One of kinds.
+    def __init__(self, kind):
+        self.name = kind
+        self.kind = kind
+
+    # Predicts a branch.
+    # Input:
+    #   pc - The branch address.
+    #   target - The address the branch goes to when taken.
+    # Returns:
+    #   True if the branch is predicted taken.
+    def predict(self, pc, target):
+        if self.kind == "btfn":
+            return target <= pc
+        return self.kind == "taken"
+
+    # Updates the predictor with the outcome of a branch.
+    # Input:
+    #   pc - The branch address.
+    #   target - The address the branch goes to when taken.
+    #   taken - True if the branch was taken.
+    # Returns:
+    #   n/a
+    def update(self, pc, target, taken):
+        pass
+
+
+# Predicts that each branch goes the way it went last time, with one bit per
+# table entry. Branches share entries by the low bits of their word address.
+class OneBitPredictor(object):
+    # Input:
+    #   bits - log2 of the number of entries.
+    def __init__(self, bits=default_bits):
+        self.name = "1bit"
+        self.mask = (1 << bits) - 1
+        self.table = array.array("b", [0]) * (1 << bits)
+
+    # See StaticPredictor.predict.
+    def predict(self, pc, target):
+        return self.table[(pc >> 2) & self.mask] != 0
+
+    # See StaticPredictor.update.
+    def update(self, pc, target, taken):
+        self.table[(pc >> 2) & self.mask] = 1 if taken else 0
+
+
+# Predicts with a table of 2 bit saturating counters, where values 2 and 3
+# predict taken. Counters start weakly not taken.
+class TwoBitPredictor(object):
+    # Input:
+    #   bits - log2 of the number of entries.
+    def __init__(self, bits=default_bits):
+        self.name = "2bit"
+        self.mask = (1 << bits) - 1
+        self.table = array.array("b", [1]) * (1 << bits)
+
+    # Returns the table entry of a branch.
+    # Input:
+    #   pc - The branch address.
+    # Returns:
+    #   The index.
+    def index(self, pc):
+        return (pc >> 2) & self.mask
+
+    # See StaticPredictor.predict.
+    def predict(self, pc, target):
+        return self.table[self.index(pc)] >= 2
+
+    # See StaticPredictor.update.
+    def update(self, pc, target, taken):
+        _train(self.table, self.index(pc), taken)
+
+
+# A 2 bit counter table indexed by the branch address xor the outcomes of the
+# most recent branches.
+class GsharePredictor(TwoBitPredictor):
+    # Input:
+    #   bits - log2 of the number of entries, which is also the number of
+    #          outcomes in the history.
+    def __init__(self, bits=default_bits):
+        TwoBitPredictor.__init__(self, bits)
+        self.name = "gshare"
+        self.history = 0
+
+    # See TwoBitPredictor.index.
+    def index(self, pc):
+        return ((pc >> 2) ^ self.history) & self.mask
+
+    # See StaticPredictor.update.
+    def update(self, pc, target, taken):
+        TwoBitPredictor.update(self, pc, target, taken)
+        self.history = ((self.history << 1) | int(taken)) & self.mask
+
+
+# Chooses between a 2 bit counter predictor and a gshare predictor with a
+# table of 2 bit counters indexed by the branch address, where values 2 and 3
+# choose gshare. The chooser moves toward whichever component was right when
+# they disagree.
+class TournamentPredictor(object):
+    # Input:
+    #   bits - log2 of the number of entries of each table.
+    def __init__(self, bits=default_bits):
+        self.name = "tournament"
+        self.local = TwoBitPredictor(bits)
+        self.shared = GsharePredictor(bits)
+        self.mask = (1 << bits) - 1
+        self.chooser = array.array("b", [1]) * (1 << bits)
+
+    # See StaticPredictor.predict.
+    def predict(self, pc, target):
+        if self.chooser[(pc >> 2) & self.mask] >= 2:
+            return self.shared.predict(pc, target)
+        return self.local.predict(pc, target)
+
+    # See StaticPredictor.update.
+    def update(self, pc, target, taken):
+        local = self.local.predict(pc, target)
+        shared = self.shared.predict(pc, target)
+        if local != shared:
+            _train(self.chooser, (pc >> 2) & self.mask, shared == taken)
+        self.local.update(pc, target, taken)
+        self.shared.update(pc, target, taken)
+
+
+# predictor name -> class of table predictors
+table_predictors = {
+    "1bit": OneBitPredictor,
+    "2bit": TwoBitPredictor,
+    "gshare": GsharePredictor,
+    "tournament": TournamentPredictor
+}
+# all predictor names
+names = list(StaticPredictor.kinds) + sorted(table_predictors)
+
+
+# Moves a 2 bit saturating counter toward an outcome.
+# Input:
+#   table - The counter table.
+#   index - The counter.
+#   taken - True to count up.
+# Returns:
+#   n/a
+def _train(table, index, taken):
+    value = table[index]
+    if taken:
+        if value < 3:
+            table[index] = value + 1
+    elif value > 0:
+        table[index] = value - 1
+
+
+# Creates a predictor from a "<name>[:<bits>]" description, where bits is
+# log2 of the number of table entries.
+# Input:
+#   description - The description.
+# Returns:
+#   The predictor.
+# Throws:
+#   ValueError - Unknown predictor or invalid size.
+def create(description):
+    name, _, bits = description.partition(":")
+    if name in StaticPredictor.kinds and not bits:
+        return StaticPredictor(name)
+    if name not in table_predictors:
+        raise ValueError("unknown branch predictor " + description)
+    bits = int(bits) if bits else default_bits
+    if not 0 < bits <= 24:
+        raise ValueError("invalid predictor size " + description)
+    predictor = table_predictors[name](bits)
+    if bits != default_bits:
+        predictor.name += ":" + repr(bits)
+    return predictor
+
+
+# Simulates branch predictors on the conditional branches of a machine,
+# counting the executions, taken branches, and mispredictions of each
+# predictor for each branch.
+class BranchSimulation(object):
+    # Input:
+    #   predictors - The predictors.
+    def __init__(self, predictors):
+        self.predictors = predictors
+        # branch address -> [executed, taken, mispredictions of each
+        # predictor]
+        self.branches = {}
+
+    # Adds the simulation to a machine's hooks.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        machine.branch_hooks.append(self.branch)
+
+    # Simulates the predictors on a branch.
+    # Input:
+    #   pc - The branch address.
+    #   taken - True if the branch was taken.
+    #   target - The address the branch goes to when taken.
+    # Returns:
+    #   n/a
+    def branch(self, pc, taken, target):
+        counts = self.branches.get(pc)
+        if counts is None:
+            counts = self.branches[pc] = [0] * (2 + len(self.predictors))
+        counts[0] += 1
+        if taken:
+            counts[1] += 1
+        n = 2
+        for predictor in self.predictors:
+            if predictor.predict(pc, target) != taken:
+                counts[n] += 1
+            predictor.update(pc, target, taken)
+            n += 1
+
+    # Returns a report of the misprediction rates of each predictor, for
+    # each branch and totaled by label and by source line.
+    # Input:
+    #   image - The program image, with the labels and source lines.
+    # Returns:
+    #   The report as a string.
+    def report(self, image):
+        header = "".join(" {0:>10}".format(p.name[:10])
+                         for p in self.predictors)
+        out = ["Branch predictors (mispredictions):"]
+        out.append("{0:>15}   {1:>10} {2:>10} {3:>7}{4}".format(
+            "branch", "address", "executed", "%taken", header
+        ))
+        total = [0] * (2 + len(self.predictors))
+        labels = {}
+        lines = {}
+        for pc in sorted(self.branches):
+            counts = self.branches[pc]
+            label = image.label(pc)
+            offset = pc - image.symbol_table.get(label, pc)
+            out.append("{0:>15} : 0x{1:08x}{2}".format(
+                label + "+" + repr(offset) if offset else label,
+                pc,
+                _columns(counts)
+            ))
+            _add(total, counts)
+            _add(labels.setdefault(label, [0] * len(counts)), counts)
+            line_no = image.lines.get(pc, 0)
+            if line_no:
+                _add(lines.setdefault(line_no, [0] * len(counts)), counts)
+        out.append("{0:>15} : {1:>10}{2}".format("total", "", _columns(total)))
+        if labels:
+            out.append("Branches by label:")
+        for label in sorted(labels):
+            out.append("{0:>15} : {1:>10}{2}".format(
+                label, "", _columns(labels[label])
+            ))
+        if lines:
+            out.append("Branches by line:")
+        for line_no in sorted(lines):
+            out.append("{0:>15} : {1:>10}{2}".format(
+                "line " + repr(line_no), "", _columns(lines[line_no])
+            ))
+        return "\n".join(out)
+
+
+# Adds branch counts to a total.
+# Input:
+#   total - [executed, taken, mispredictions of each predictor]
+#   counts - The counts to add.
+# Returns:
+#   n/a
+def _add(total, counts):
+    for n, value in enumerate(counts):
+        total[n] += value
+
+
+# Returns the report columns of branch counts, with the taken and
+# misprediction rates as percentages.
+# Input:
+#   counts - [executed, taken, mispredictions of each predictor]
+# Returns:
+#   str
+def _columns(counts):
+    executed = counts[0]
+    rates = [100.0 * n / executed if executed else 0.0 for n in counts[1:]]
+    return " {0:10} {1:6.2f}%{2}".format(
+        executed,
+        rates[0],
+        "".join(" {0:9.2f}%".format(rate) for rate in rates[1:])
+    )
@@ -0,0 +1,233 @@
+from analysis.hazards import PipelineState, never_stall
+from instructions.instruction import Instruction
+from simulator.counters import WordCounters, code_ranges
+
+# source lines in the hot line report by default
+default_hot_lines = 20
+
+
+# Profiles the execution of a machine, counting the executions and estimated
+# cycles of each instruction in flat arrays indexed by word address, one for
+# each run of code in the image (see simulator.counters). Cycles are
+# estimated with the pipeline model, with the stalls of each instruction as
+# executed and the branch penalty on each taken branch or jump. Instructions
+# that never stall (see analysis.hazards.never_stall) skip the hazard checks.
+# Cycles are also totaled by call stack, where jal and jalr push the label of
+# their target and jr r31 pops it. Each call stack has an integer id, and
+# the labels of a stack are only looked up for the folded output.
+class Profiler(object):
+    # Input:
+    #   program - The program (mapping addresses to memory) for the cycle
+    #             estimates, or None to count one cycle per instruction.
+    #   model - The pipeline model (see analysis.pipeline), or None to count
+    #           one cycle per instruction.
+    def __init__(self, program=None, model=None):
+        self.instructions = {}
+        if program is not None:
+            self.instructions = dict(
+                (a, m) for a, m in program.iteritems()
+                if isinstance(m, Instruction)
+            )
+        self.model = model
+        self.state = None
+        # address -> instruction, of the instructions that never stall
+        self.unstalled = {}
+        if model is not None and program is not None:
+            self.state = PipelineState(model)
+            self.unstalled = dict(
+                (instr.address, instr)
+                for instr in never_stall(self.instructions.values(), model)
+            )
+        self.penalty = model.branch_penalty() if model is not None else 0
+        # word address -> executions and estimated cycles
+        self.counters = WordCounters([], 2)
+        # stack id -> labels, the stack it was called from, and estimated
+        # cycles
+        self.stacks = []
+        self.parents = []
+        self.stack_cycles = []
+        # (stack id, called label) -> stack id
+        self.calls = {}
+        # the current call stack
+        self.stack = 0
+        # the last instruction executed, its counters, and its call stack
+        self.previous = None
+        self.previous_counts = None
+        self.previous_index = 0
+        self.previous_stack = 0
+        self.label = None
+
+    # Adds the profiler to a machine's hooks, with the call stack starting at
+    # the label of the machine's program counter.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        self.counters = WordCounters(code_ranges(machine.image), 2)
+        self.label = machine.image.label
+        self.stacks = [(self.label(machine.pc),)]
+        self.parents = [None]
+        self.stack_cycles = [0]
+        self.stack = 0
+        machine.fetch_hooks.append(self.fetch)
+        machine.call_hooks.append(self.call)
+        machine.return_hooks.append(self.ret)
+
+    # Counts an instruction.
+    # Input:
+    #   pc - The instruction address.
+    # Returns:
+    #   n/a
+    def fetch(self, pc):
+        previous = self.previous
+        if previous is not None and pc != previous + 4 and self.penalty:
+            self.previous_counts[self.previous_index + 1] += self.penalty
+            self.stack_cycles[self.previous_stack] += self.penalty
+        counters = self.counters
+        n = counters.index(pc)
+        counts = counters.array
+        cost = 1
+        state = self.state
+        if state is not None:
+            unstalled = self.unstalled.get(pc)
+            if unstalled is not None:
+                state.advance(unstalled)
+            else:
+                instr = self.instructions.get(pc)
+                if instr is not None:
+                    hazard = state.issue(instr)
+                    if hazard is not None:
+                        cost += hazard.cycles
+        counts[n] += 1
+        counts[n + 1] += cost
+        stack = self.stack
+        self.stack_cycles[stack] += cost
+        self.previous = pc
+        self.previous_counts = counts
+        self.previous_index = n
+        self.previous_stack = stack
+
+    # Pushes a call.
+    # Input:
+    #   pc - The address of the jal or jalr.
+    #   target - The called address.
+    # Returns:
+    #   n/a
+    def call(self, pc, target):
+        key = (self.stack, self.label(target))
+        stack = self.calls.get(key)
+        if stack is None:
+            stack = self.calls[key] = len(self.stacks)
+            self.stacks.append(self.stacks[self.stack] + (key[1],))
+            self.parents.append(self.stack)
+            self.stack_cycles.append(0)
+        self.stack = stack
+
+    # Pops a call.
+    # Input:
+    #   pc - The address of the jr.
+    #   target - The return address.
+    # Returns:
+    #   n/a
+    def ret(self, pc, target):
+        if self.parents[self.stack] is not None:
+            self.stack = self.parents[self.stack]
+
+    # Returns the executions and estimated cycles by label and by source line.
+    # Input:
+    #   image - The program image, with the labels and source lines.
+    # Returns:
+    #   (dictionary mapping labels to [executions, cycles],
+    #    dictionary mapping line numbers to [executions, cycles])
+    def totals(self, image):
+        labels = {}
+        lines = {}
+        for address, (count, cycles) in self.counters.items():
+            total = labels.setdefault(image.label(address), [0, 0])
+            total[0] += count
+            total[1] += cycles
+            line_no = image.lines.get(address, 0)
+            if line_no:
+                total = lines.setdefault(line_no, [0, 0])
+                total[0] += count
+                total[1] += cycles
+        return labels, lines
+
+    # Returns a report of the estimated cycles of each label and of the
+    # source lines with the most cycles.
+    # Input:
+    #   image - The program image, with the labels and source lines.
+    #   hot_lines - The number of source lines reported.
+    # Returns:
+    #   The report as a string.
+    def report(self, image, hot_lines=default_hot_lines):
+        labels, lines = self.totals(image)
+        executed, total = self.counters.totals()
+        out = ["Profile: {0} instructions, {1} estimated cycles".format(
+            executed, total
+        )]
+        if labels:
+            out.append("Cycles by label:")
+        for label, counts in sorted(labels.items(), key=_by_cycles):
+            out.append(_row(label, counts, total))
+        if lines:
+            out.append("Hot lines:")
+        for line_no, counts in sorted(lines.items(),
+                                      key=_by_cycles)[:hot_lines]:
+            out.append(_row("line " + repr(line_no), counts, total))
+        return "\n".join(out)
+
+    # Returns the source annotated with the executions and estimated cycles
+    # of each line.
+    # Input:
+    #   image - The program image, with the source lines.
+    #   source - The source text.
+    # Returns:
+    #   The annotated source as a string.
+    def annotate(self, image, source):
+        lines = self.totals(image)[1]
+        out = ["{0:>10} {1:>10}".format("count", "cycles")]
+        for line_no, line in enumerate(source.splitlines(), 1):
+            if line_no in lines:
+                out.append("{0:10} {1:10}  {2}".format(
+                    lines[line_no][0], lines[line_no][1], line
+                ))
+            else:
+                out.append("{0:21}  {1}".format("", line))
+        return "\n".join(out) + "\n"
+
+    # Returns the estimated cycles of each call stack in the folded format
+    # of flame graph tools, one "<label>;<label>... <cycles>" line per
+    # stack.
+    # Input:
+    #   n/a
+    # Returns:
+    #   The folded stacks as a string.
+    def folded(self):
+        return "".join(
+            "{0} {1}\n".format(";".join(frames), cycles)
+            for frames, cycles in sorted(zip(self.stacks, self.stack_cycles))
+            if cycles
+        )
+
+
+# Sort key for report rows, with the most cycles first.
+# Input:
+#   item - (key, [executions, cycles])
+# Returns:
+#   The key.
+def _by_cycles(item):
+    return -item[1][1], item[0]
+
+
+# Returns a report row.
+# Input:
+#   name - The row name.
+#   counts - [executions, cycles]
+#   total - The total cycles.
+# Returns:
+#   str
+def _row(name, counts, total):
+    return "{0:>15} : {1:10} instrs {2:10} cycles {3:6.2f}%".format(
+        name, counts[0], counts[1], 100.0 * counts[1] / total if total else 0)
@@ -0,0 +1,189 @@
+import bisect
+import json
+import mmap
+import struct
+from simulator.decode import Decoded, decode, names
+from simulator.image import ProgramImage
+from simulator.paging import PagedMemory, page_bits, page_size
+
+# first bytes of a shared image file
+magic = "DLXSHM01"
+# file header after the magic: number of pages, number of instructions,
+# bytes of the instruction name table, bytes of the metadata, file offset of
+# the first page
+header = struct.Struct("<IIIII")
+page_entry = struct.Struct("<I")
+# decoded instruction: address, name id, type, rd, rs1, rs2, immediate
+instruction = struct.Struct("<IHBBBBi")
+
+
+# Writes an image as a shared image file: the pages of memory, page aligned
+# so they can be mapped in place, and the instructions decoded, sorted by
+# address. Files written to a memory file system (such as /dev/shm) are
+# shared by every process that attaches them.
+# Input:
+#   image - The image (see simulator.image).
+#   name - The file name.
+# Returns:
+#   n/a
+# Throws:
+#   IOError - The file couldn't be written.
+def publish(image, name):
+    segments = image.segments()
+    memory = PagedMemory(1 << 32)
+    for address, data in segments:
+        memory.write_bytes(address, data)
+    pages = sorted(memory.pages)
+    table = sorted(names().values())
+    ids = dict((n, i) for i, n in enumerate(table))
+    records = []
+    for address in sorted(image.code):
+        try:
+            d = decode(memory.read(address, 4))
+        except ValueError:
+            continue
+        records.append(instruction.pack(address, ids[d.name], d.type_id,
+                                        d.rd, d.rs1, d.rs2, d.immediate))
+    metadata = json.dumps({
+        "symbol_table": image.symbol_table,
+        "lines": [[a, n] for a, n in sorted(image.lines.iteritems()) if n],
+        "code": sorted(image.code),
+        "segments": [[a, len(d)] for a, d in segments],
+        "entry": image.entry(),
+        "digest": image.digest()
+    })
+    table = "\n".join(table)
+    offset = len(magic) + header.size + len(pages) * page_entry.size + \
+        len(table) + len(metadata) + len(records) * instruction.size
+    offset = (offset + page_size - 1) & ~(page_size - 1)
+    with open(name, "wb") as f:
+        f.write(magic)
+        f.write(header.pack(len(pages), len(records), len(table),
+                            len(metadata), offset))
+        for page in pages:
+            f.write(page_entry.pack(page))
+        f.write(table)
+        f.write(metadata)
+        f.write("".join(records))
+        for page in pages:
+            f.seek(offset)
+            f.write(memory.pages[page])
+            offset += page_size
+
+
+# A program image attached to a shared image file. The file is mapped read
+# only: the memories of the image share its pages until they are written,
+# and the decoded instructions are read from it as they are needed, so
+# attaching is cheap and every process attached shares one copy.
+class SharedImage(ProgramImage):
+    # Input:
+    #   name - The file name.
+    # Throws:
+    #   IOError - The file couldn't be read.
+    #   ValueError - The file isn't a shared image.
+    def __init__(self, name):
+        ProgramImage.__init__(self)
+        with open(name, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(magic)] != magic:
+            raise ValueError("{0} isn't a shared image".format(name))
+        try:
+            page_count, self.instructions, table_size, metadata_size, \
+                offset = header.unpack_from(self.map, len(magic))
+        except struct.error:
+            raise ValueError("{0} is cut short".format(name))
+        n = len(magic) + header.size
+        numbers = struct.unpack_from("<{0}I".format(page_count), self.map, n)
+        n += page_count * page_entry.size
+        self.names = self.map[n:n + table_size].split("\n")
+        n += table_size
+        metadata = json.loads(self.map[n:n + metadata_size])
+        self.records = n + metadata_size
+        if len(self.map) < offset + page_count * page_size:
+            raise ValueError("{0} is cut short".format(name))
+        # page number -> read only buffer of the page in the map
+        self.pages = dict(
+            (page, buffer(self.map, offset + i * page_size, page_size))
+            for i, page in enumerate(numbers)
+        )
+        self.symbol_table = dict(
+            (str(k), v) for k, v in metadata["symbol_table"].iteritems()
+        )
+        self.lines = dict(metadata["lines"])
+        self.code = set(metadata["code"])
+        self._segments = metadata["segments"]
+        self._entry = metadata["entry"]
+        self._digest = str(metadata["digest"])
+        # instruction addresses, read from the map on first use
+        self._addresses = None
+
+    # See ProgramImage.entry.
+    def entry(self):
+        return self._entry
+
+    # See ProgramImage.extent.
+    def extent(self):
+        if not self._segments:
+            return 0, 0
+        return self._segments[0][0], sum(self._segments[-1])
+
+    # See ProgramImage.digest.
+    def digest(self):
+        return self._digest
+
+    # Returns a sparse memory holding the image, sharing its pages.
+    # Input:
+    #   size - Bytes of memory.
+    # Returns:
+    #   The memory (see simulator.paging).
+    # Throws:
+    #   ValueError - The image doesn't fit in memory.
+    def memory(self, size):
+        if self.extent()[1] > size:
+            raise ValueError("image doesn't fit in memory")
+        return PagedMemory(size, self.pages)
+
+    # See ProgramImage.ranges.
+    def ranges(self):
+        return [(address, address + length)
+                for address, length in self._segments]
+
+    # See ProgramImage.segments.
+    def segments(self):
+        memory = PagedMemory(1 << 32, self.pages)
+        return [(address, memory.read_bytes(address, length))
+                for address, length in self._segments]
+
+    # Returns the decoded instruction at an address.
+    # Input:
+    #   address - The address.
+    # Returns:
+    #   The decoded instruction (see simulator.decode), or None if the image
+    #   has no instruction there.
+    def decoded(self, address):
+        if self._addresses is None:
+            self._addresses = [
+                instruction.unpack_from(
+                    self.map, self.records + n * instruction.size
+                )[0]
+                for n in xrange(self.instructions)
+            ]
+        n = bisect.bisect_left(self._addresses, address)
+        if n == len(self._addresses) or self._addresses[n] != address:
+            return None
+        _, name_id, type_id, rd, rs1, rs2, immediate = \
+            instruction.unpack_from(self.map,
+                                    self.records + n * instruction.size)
+        return Decoded(self.names[name_id], type_id, rd, rs1, rs2, immediate)
+
+
+# Attaches a shared image file.
+# Input:
+#   name - The file name.
+# Returns:
+#   The image.
+# Throws:
+#   IOError - The file couldn't be read.
+#   ValueError - The file isn't a shared image.
+def attach(name):
+    return SharedImage(name)
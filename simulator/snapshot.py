@@ -0,0 +1,113 @@
+import struct
+import zlib
+from simulator.paging import page_size, zero_page
+
+# first bytes of a snapshot file
+magic = "DLXSNAP3"
+# machine state: image hash, program counter, state, instructions executed,
+# memory size, length of the fault description, number of pages, number of
+# devices
+state = struct.Struct("<40sIiQQIII")
+registers = struct.Struct("<64I")
+page_header = struct.Struct("<I")
+# device header: length of the name, length of the state
+device_header = struct.Struct("<II")
+
+
+# Saves the state of a machine to a file: its registers, program counter,
+# run state, the pages of memory that differ from its image, and the state of
+# its devices, compressed. The snapshot is keyed by the hash of the image.
+# Input:
+#   m - The machine (see simulator.machine).
+#   name - The file name.
+# Returns:
+#   The number of pages saved.
+# Throws:
+#   IOError - The file couldn't be written.
+def save(m, name):
+    initial = m.image.memory(m.memory.size)
+    written = m.memory.pages
+    pages = [n for n in sorted(written)
+             if written[n] != (initial.readable(n) or zero_page)]
+    fault = m.fault or ""
+    out = [
+        state.pack(m.image.digest(), m.pc, m.state, m.executed,
+                   m.memory.size, len(fault), len(pages), len(m.devices)),
+        registers.pack(*(m.gpr + m.fpr)),
+        fault
+    ]
+    for page in pages:
+        out.append(page_header.pack(page))
+        out.append(bytes(written[page]))
+    for device in m.devices:
+        data = device.save()
+        out.append(device_header.pack(len(device.name), len(data)))
+        out.append(device.name)
+        out.append(data)
+    with open(name, "wb") as f:
+        f.write(magic)
+        f.write(zlib.compress("".join(out)))
+    return len(pages)
+
+
+# Restores the state of a machine from a snapshot of a machine running the
+# same image with the same devices.
+# Input:
+#   m - The machine (see simulator.machine).
+#   name - The file name.
+# Returns:
+#   n/a
+# Throws:
+#   IOError - The file couldn't be read.
+#   ValueError - The file isn't a snapshot, or is of another image, memory
+#                size, or devices.
+def restore(m, name):
+    with open(name, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError("{0} isn't a snapshot".format(name))
+        try:
+            data = zlib.decompress(f.read())
+        except zlib.error as e:
+            raise ValueError("corrupt snapshot {0}: {1}".format(name, e))
+    digest, pc, run_state, executed, size, fault_size, count, device_count = \
+        state.unpack_from(data)
+    if digest != m.image.digest():
+        raise ValueError("snapshot {0} is of another program".format(name))
+    if size != m.memory.size:
+        raise ValueError("snapshot {0} has {1} bytes of memory, not "
+                         "{2}".format(name, size, m.memory.size))
+    n = state.size
+    values = registers.unpack_from(data, n)
+    n += registers.size
+    pages = m.image.memory(size).pages
+    fault = data[n:n + fault_size]
+    n += fault_size
+    for _ in xrange(count):
+        page = page_header.unpack_from(data, n)[0]
+        n += page_header.size
+        pages[page] = bytearray(data[n:n + page_size])
+        n += page_size
+    devices = []
+    for _ in xrange(device_count):
+        name_size, data_size = device_header.unpack_from(data, n)
+        n += device_header.size
+        devices.append((data[n:n + name_size],
+                        data[n + name_size:n + name_size + data_size]))
+        n += name_size + data_size
+    if [device_name for device_name, _ in devices] != \
+            [d.name for d in m.devices]:
+        raise ValueError("snapshot {0} has other devices".format(name))
+    # the registers are changed in place, since compiled instructions hold
+    # references to them
+    m.memory.pages.clear()
+    m.memory.pages.update(pages)
+    m.gpr[:] = values[:32]
+    m.fpr[:] = values[32:]
+    m.pc = pc
+    m.state = run_state
+    m.executed = executed
+    m.fault = fault or None
+    if m.scheduler is not None:
+        m.scheduler.clear()
+    for device, (_, device_state) in zip(m.devices, devices):
+        device.restore(device_state)
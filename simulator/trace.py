@@ -0,0 +1,409 @@
+import struct
+import zlib
+from simulator.decode import decode, names
+from simulator.machine import written_registers, faulted
+
+# first bytes of a trace file
+magic = "DLXTRC01"
+# first bytes of the index at the end of a complete trace
+index_magic = "DLXTIDX1"
+# records in each compressed chunk by default
+default_chunk_records = 65536
+# file header after the magic: length of the instruction name table
+header = struct.Struct("<I")
+# chunk header: first cycle, number of records, bytes of compressed data
+chunk_header = struct.Struct("<QII")
+# index entry: first cycle of a chunk, file offset of its header
+index_entry = struct.Struct("<QQ")
+# last bytes of a complete trace: index offset, number of entries, magic
+footer = struct.Struct("<QI8s")
+
+# record flags
+_jumped = 0x01
+_accessed = 0x02
+_stored = 0x04
+_write_shift = 4
+# instruction id of words that aren't instructions
+_invalid_id = 0
+
+
+# One executed instruction of a trace.
+class TraceRecord(object):
+    __slots__ = ("cycle", "pc", "name", "writes", "address", "is_store")
+
+    # Input:
+    #   cycle - The number of instructions executed before this one.
+    #   pc - The instruction address.
+    #   name - The instruction name, or None for an invalid instruction.
+    #   writes - List of (register number, value) written, where registers
+    #            32 to 63 are the floating point registers.
+    #   address - The address of the memory access, or None.
+    #   is_store - True if the access is a store.
+    def __init__(self, cycle, pc, name, writes, address, is_store):
+        self.cycle = cycle
+        self.pc = pc
+        self.name = name
+        self.writes = writes
+        self.address = address
+        self.is_store = is_store
+
+
+# Appends an unsigned LEB128 varint.
+# Input:
+#   out - The bytearray.
+#   value - The non negative value.
+# Returns:
+#   n/a
+def _put(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+# Reads an unsigned LEB128 varint.
+# Input:
+#   data - The bytearray.
+#   n - The offset of the varint.
+# Returns:
+#   (value, offset after the varint)
+def _get(data, n):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[n]
+        n += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, n
+        shift += 7
+
+
+# Returns a signed value mapped to a non negative one, small for values
+# near zero (zigzag encoding).
+# Input:
+#   value - The value.
+# Returns:
+#   int
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+# Reverses _zigzag.
+# Input:
+#   value - The encoded value.
+# Returns:
+#   int
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+# Writes an execution trace. Records are delta encoded, the program counter
+# against the instruction after the last one and the access address against
+# the last access, and compressed in chunks that each start from a fresh
+# state, so any chunk can be decoded on its own. An index of the first cycle
+# of each chunk is written at the end, so that a reader can start at any
+# cycle without decoding the chunks before it.
+class TraceWriter(object):
+    # Input:
+    #   f - The binary file written, which is closed by close.
+    #   chunk_records - The number of records in each chunk.
+    #   level - The zlib compression level.
+    def __init__(self, f, chunk_records=default_chunk_records, level=6):
+        self.f = f
+        self.chunk_records = chunk_records
+        self.level = level
+        self.names = sorted(names().values())
+        # name -> instruction id, with 0 for invalid instructions
+        self.ids = dict((name, n + 1) for n, name in enumerate(self.names))
+        table = "\n".join(self.names)
+        f.write(magic)
+        f.write(header.pack(len(table)))
+        f.write(table)
+        self.offset = len(magic) + header.size + len(table)
+        self.index = []
+        self.cycle = 0
+        self._start_chunk()
+
+    # Adds a record.
+    # Input:
+    #   pc - The instruction address.
+    #   name - The instruction name, or None for an invalid instruction.
+    #   writes - List of (register number, value) written.
+    #   address - The address of the memory access, or None.
+    #   is_store - True if the access is a store.
+    # Returns:
+    #   n/a
+    def add(self, pc, name, writes=(), address=None, is_store=False):
+        out = self.data
+        flags = len(writes) << _write_shift
+        if pc != self.next_pc:
+            flags |= _jumped
+        if address is not None:
+            flags |= _accessed
+            if is_store:
+                flags |= _stored
+        out.append(flags)
+        _put(out, self.ids.get(name, _invalid_id))
+        if flags & _jumped:
+            _put(out, _zigzag(pc - self.next_pc))
+        if address is not None:
+            _put(out, _zigzag(address - self.address))
+            self.address = address
+        for reg, value in writes:
+            out.append(reg)
+            _put(out, value)
+        self.next_pc = pc + 4
+        self.records += 1
+        self.cycle += 1
+        if self.records == self.chunk_records:
+            self._flush()
+
+    # Writes the last chunk and the index, and closes the file.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def close(self):
+        self._flush()
+        index_offset = self.offset
+        self.f.write(index_magic)
+        for entry in self.index:
+            self.f.write(index_entry.pack(*entry))
+        self.f.write(footer.pack(index_offset, len(self.index), index_magic))
+        self.f.close()
+
+    # Starts a chunk with a fresh delta state.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _start_chunk(self):
+        self.data = bytearray()
+        self.records = 0
+        self.first_cycle = self.cycle
+        self.next_pc = 0
+        self.address = 0
+
+    # Compresses and writes the current chunk, if it has records.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _flush(self):
+        if not self.records:
+            return
+        payload = zlib.compress(bytes(self.data), self.level)
+        self.index.append((self.first_cycle, self.offset))
+        self.f.write(chunk_header.pack(self.first_cycle, self.records,
+                                       len(payload)))
+        self.f.write(payload)
+        self.offset += chunk_header.size + len(payload)
+        self._start_chunk()
+
+
+# Reads an execution trace written by TraceWriter. Records are decoded one
+# chunk at a time as they are iterated. Traces cut short, without the index,
+# can still be read from the start, and are indexed by scanning the chunk
+# headers when read from another cycle.
+class TraceReader(object):
+    # Input:
+    #   f - The binary file read.
+    # Throws:
+    #   ValueError - The file isn't a trace.
+    def __init__(self, f):
+        self.f = f
+        if f.read(len(magic)) != magic:
+            raise ValueError("not an execution trace")
+        size = header.unpack(f.read(header.size))[0]
+        self.names = [None] + f.read(size).split("\n")
+        self.start = len(magic) + header.size + size
+        self._index = None
+
+    # Returns the first cycle and file offset of each chunk.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of (first cycle, offset), in cycle order.
+    def index(self):
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    # Returns the records of the trace lazily, from a cycle on.
+    # Input:
+    #   cycle - The cycle of the first record.
+    # Returns:
+    #   Generator of trace records.
+    # Throws:
+    #   ValueError - The trace is corrupt.
+    def records(self, cycle=0):
+        offset = self.start
+        if cycle:
+            for first, chunk_offset in self.index():
+                if first > cycle:
+                    break
+                offset = chunk_offset
+        self.f.seek(offset)
+        while True:
+            head = self.f.read(chunk_header.size)
+            if len(head) < chunk_header.size or head.startswith(index_magic):
+                return
+            first, count, length = chunk_header.unpack(head)
+            payload = self.f.read(length)
+            if len(payload) < length:
+                return
+            try:
+                data = bytearray(zlib.decompress(payload))
+            except zlib.error as e:
+                raise ValueError("corrupt trace chunk: {0}".format(e))
+            # the file position moves while records are consumed
+            position = self.f.tell()
+            for record in self._decode(data, first, count):
+                if record.cycle >= cycle:
+                    yield record
+            self.f.seek(position)
+
+    # Decodes the records of a chunk.
+    # Input:
+    #   data - The decompressed chunk.
+    #   cycle - The cycle of the first record.
+    #   count - The number of records.
+    # Returns:
+    #   Generator of trace records.
+    def _decode(self, data, cycle, count):
+        names = self.names
+        n = 0
+        next_pc = 0
+        address = 0
+        for cycle in xrange(cycle, cycle + count):
+            flags = data[n]
+            instruction_id, n = _get(data, n + 1)
+            pc = next_pc
+            if flags & _jumped:
+                delta, n = _get(data, n)
+                pc += _unzigzag(delta)
+            access = None
+            if flags & _accessed:
+                delta, n = _get(data, n)
+                address += _unzigzag(delta)
+                access = address
+            writes = []
+            for _ in xrange(flags >> _write_shift):
+                reg = data[n]
+                value, n = _get(data, n + 1)
+                writes.append((reg, value))
+            next_pc = pc + 4
+            yield TraceRecord(cycle, pc, names[instruction_id], writes,
+                              access, bool(flags & _stored))
+
+    # Reads the index at the end of the file, or builds it from the chunk
+    # headers if the trace was cut short.
+    # Input:
+    #   n/a
+    # Returns:
+    #   List of (first cycle, offset).
+    def _read_index(self):
+        self.f.seek(0, 2)
+        end = self.f.tell()
+        if end >= self.start + footer.size:
+            self.f.seek(end - footer.size)
+            offset, count, tail = footer.unpack(self.f.read(footer.size))
+            if tail == index_magic:
+                self.f.seek(offset + len(index_magic))
+                return [index_entry.unpack(self.f.read(index_entry.size))
+                        for _ in xrange(count)]
+        index = []
+        offset = self.start
+        while True:
+            self.f.seek(offset)
+            head = self.f.read(chunk_header.size)
+            if len(head) < chunk_header.size or head.startswith(index_magic):
+                return index
+            first, count, length = chunk_header.unpack(head)
+            index.append((first, offset))
+            offset += chunk_header.size + length
+
+
+# Records the execution of a machine in a trace.
+class TraceRecorder(object):
+    # Input:
+    #   writer - The trace writer.
+    def __init__(self, writer):
+        self.writer = writer
+        self.machine = None
+        # address -> (instruction name, registers written)
+        self.decoded = {}
+        # the instruction executing and its memory access
+        self.pc = None
+        self.address = None
+        self.is_store = False
+
+    # Adds the recorder to a machine's hooks.
+    # Input:
+    #   machine - The machine (see simulator.machine).
+    # Returns:
+    #   n/a
+    def attach(self, machine):
+        self.machine = machine
+        machine.fetch_hooks.append(self.fetch)
+        machine.access_hooks.append(self.access)
+
+    # Records the last instruction, whose results are now known, and starts
+    # the next one.
+    # Input:
+    #   pc - The address of the next instruction.
+    # Returns:
+    #   n/a
+    def fetch(self, pc):
+        self._record()
+        self.pc = pc
+        self.address = None
+        self.is_store = False
+
+    # Notes the memory access of the executing instruction.
+    # Input:
+    #   pc - The instruction address.
+    #   address - The data address.
+    #   size - The access size.
+    #   is_store - True for a store.
+    # Returns:
+    #   n/a
+    def access(self, pc, address, size, is_store):
+        self.address = address
+        self.is_store = is_store
+
+    # Records the last instruction and closes the trace.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def close(self):
+        self._record()
+        self.pc = None
+        self.writer.close()
+
+    # Records the executing instruction, if any.
+    # Input:
+    #   n/a
+    # Returns:
+    #   n/a
+    def _record(self):
+        pc = self.pc
+        if pc is None:
+            return
+        if pc not in self.decoded:
+            try:
+                d = decode(self.machine.read(pc, 4))
+                self.decoded[pc] = (d.name, written_registers(d))
+            except ValueError:
+                self.decoded[pc] = (None, [])
+        name, regs = self.decoded[pc]
+        if self.machine.state == faulted:
+            # the instruction stopped the machine without writing
+            regs = []
+        gpr = self.machine.gpr
+        fpr = self.machine.fpr
+        writes = [(reg, gpr[reg] if reg < 32 else fpr[reg - 32])
+                  for reg in regs]
+        self.writer.add(pc, name, writes, self.address, self.is_store)
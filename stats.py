@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+# Clock of the stage timers. Python 2 has no monotonic clock, so this is the
+# wall clock.
+clock = time.time
+
+# stage names
+read = "read"
+cache = "cache"
+lex = "lex"
+parse = "parse"
+encode = "encode"
+resolve = "resolve"
+write = "write"
+total = "total"
+stages = [read, cache, lex, parse, encode, resolve, write, total]
+# stages timed for each line, which are too fine grained for trace spans
+line_stages = set([lex, parse, encode])
+
+# counter names
+lines = "lines"
+labels = "labels"
+directives = "directives"
+data_items = "data_items"
+instructions = "instructions"
+r_type = "r_type"
+i_type = "i_type"
+j_type = "j_type"
+cache_hits = "cache_hits"
+cache_misses = "cache_misses"
+counters = [lines, labels, directives, data_items, instructions, r_type,
+            i_type, j_type, cache_hits, cache_misses]
+
+
+# Times a stage of the assembler when used in a with statement.
+class Timer(object):
+    # Input:
+    #   stats - The stats receiving the time.
+    #   stage - The stage name.
+    #   span - The name of the trace span for the stage.
+    def __init__(self, stats, stage, span):
+        self.stats = stats
+        self.stage = stage
+        self.span = span
+        self.start = 0
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = clock()
+        self.stats.add_time(self.stage, end - self.start)
+        if self.stats.tracer is not None and \
+           self.stage not in line_stages:
+            if self.stage == total:
+                # the span of a whole input file, tagged with the worker
+                # that assembled it
+                args = {
+                    "file": self.span,
+                    "worker": threading.current_thread().name,
+                    "process": os.getpid()
+                }
+                self.stats.tracer.complete(self.span, self.start, end,
+                                           "file", args)
+            else:
+                self.stats.tracer.complete(self.span, self.start, end)
+        return False
+
+
+# Collects the time spent in each stage of the assembler and counts of the
+# items processed.
+class Stats(object):
+    # Input:
+    #   tracer - Optional trace_events.Tracer receiving a span for each timed
+    #            stage.
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self.times = dict((stage, 0.0) for stage in stages)
+        self.counters = dict((name, 0) for name in counters)
+
+    # Returns a timer for a stage.
+    # Input:
+    #   stage - The stage name.
+    #   span - Optional trace span name, defaults to the stage name.
+    # Returns:
+    #   The timer.
+    def timer(self, stage, span=None):
+        return Timer(self, stage, span or stage)
+
+    # Adds time to a stage.
+    # Input:
+    #   stage - The stage name.
+    #   seconds - The time spent.
+    # Returns:
+    #   n/a
+    def add_time(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    # Increments a counter.
+    # Input:
+    #   name - The counter name.
+    #   n - The amount to add.
+    # Returns:
+    #   n/a
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Returns the stats as a dictionary.
+    # Input:
+    #   n/a
+    # Returns:
+    #   {"times": {stage: seconds}, "counters": {name: count}}
+    def to_dict(self):
+        return {"times": dict(self.times), "counters": dict(self.counters)}
+
+    # Returns the stats encoded as JSON.
+    # Input:
+    #   n/a
+    # Returns:
+    #   JSON string.
+    def to_json(self):
+        import json
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    # Returns a human readable report of the stats.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Report string.
+    def report(self):
+        lines_out = ["Stage times:"]
+        for stage in stages:
+            lines_out.append("{0:>15} : {1:10.3f} ms".format(
+                stage,
+                self.times.get(stage, 0.0) * 1000
+            ))
+        lines_out.append("Counters:")
+        for name in counters:
+            lines_out.append("{0:>15} : {1}".format(
+                name,
+                self.counters.get(name, 0)
+            ))
+        return "\n".join(lines_out)
+
+
+# A timer that does nothing, used when stats are disabled.
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+null_timer = NullTimer()
+
+
+# Stats that record nothing, used when stats are disabled.
+class NullStats(Stats):
+    def timer(self, stage, span=None):
+        return null_timer
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
@@ -0,0 +1,166 @@
+import sys
+import getopt
+import multiprocessing
+from assembler import Assembler
+from analysis import cfg
+from optimizer import rewrites, superopt
+
+# Program options
+options = {
+    "database": "rewrites.json",
+    "workers": multiprocessing.cpu_count(),
+    "window": rewrites.max_window,
+    "length": 2,
+    "in_file": None
+}
+
+
+# Main function
+# Input:
+#   argv - Command line args
+# Returns:
+#   n/a
+def main(argv):
+    if not parse_args(argv):
+        return
+    asm = Assembler({
+        "verbose": False,
+        "dump": False,
+        "console": False,
+        "no_output": True,
+        "in_file": options["in_file"],
+        "out_file": None
+    })
+    asm.run()
+    if asm.error:
+        return
+    database = rewrites.RewriteDatabase(options["database"])
+    try:
+        database.load()
+    except (IOError, ValueError) as e:
+        print "ERROR: invalid rewrite database:", e
+        return
+
+    pool = None
+    if options["workers"] > 1:
+        pool = multiprocessing.Pool(options["workers"])
+    found = 0
+    searched = 0
+    for block in cfg.build_blocks(asm.program, asm.symbol_table):
+        for start in range(len(block.instructions)):
+            for window in rewrites.windows(block, start, options["window"]):
+                sources = [instr.source for instr in window]
+                following = block.instructions[start + len(window):]
+                live = rewrites.live_out(sources, following)
+                key, names = rewrites.canonical(sources, live)
+                # sequences are never longer than their window
+                length = min(options["length"], len(sources))
+                if database.searched(key, length):
+                    continue
+                print "Searching:", key
+                sequence = superopt.search(sources, live, length, pool)
+                searched += 1
+                if sequence is not None:
+                    sequence = [rewrites.rename(s, names) for s in sequence]
+                    print "\tFound:", "; ".join(
+                        rewrites.text(s) for s in sequence
+                    )
+                    found += 1
+                database.put(key, sequence, length)
+                # save as we go, since searches are slow
+                database.save()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print "Searched {0} windows, found {1} rewrites".format(searched, found)
+
+
+# Prints help information to console
+# Input:
+#   n/a
+# Returns:
+#   n/a
+def print_help():
+    print "superopt.py [options] file"
+    print "Searches each short window of integer alu instructions in the " \
+          "assembled file\nfor a cheaper equivalent sequence, and records " \
+          "the results in a rewrite\ndatabase that dlxas.py --rewrites " \
+          "applies."
+    print "Options:"
+    print "-h\n" \
+          "--help\n" \
+          "\tPrint this help text."
+    print "-d <file>\n" \
+          "--database=<file>\n" \
+          "\tThe rewrite database, default " + options["database"] + "."
+    print "-j <n>\n" \
+          "--workers=<n>\n" \
+          "\tNumber of worker processes, default the number of CPUs."
+    print "-w <n>\n" \
+          "--window=<n>\n" \
+          "\tLongest window of instructions, default " + \
+          repr(options["window"]) + "."
+    print "-l <n>\n" \
+          "--length=<n>\n" \
+          "\tLongest replacement sequence searched, default " + \
+          repr(options["length"]) + ".\n\tEach extra instruction " \
+          "multiplies the search time by a few thousand."
+
+
+# Parses a positive count option.
+# Input:
+#   arg - The option value.
+#   name - The option name.
+# Returns:
+#   The count, or None if it is invalid.
+def _count(arg, name):
+    try:
+        n = int(arg)
+    except ValueError:
+        n = 0
+    if n < 1:
+        print "Invalid {0}: {1}".format(name, arg)
+        return None
+    return n
+
+
+# Parses command line args, inserting them into the program options.
+# Input:
+#   argv - Command line args
+# Returns:
+#   True if argument parsing was successful.
+def parse_args(argv):
+    short_opts = "hd:j:w:l:"
+    long_opts = ["help", "database=", "workers=", "window=", "length="]
+
+    try:
+        opts, args = getopt.getopt(argv, short_opts, long_opts)
+    except getopt.GetoptError as e:
+        print e
+        print_help()
+        return False
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+            return False
+        elif opt in ("-d", "--database"):
+            options["database"] = arg
+        elif opt in ("-j", "--workers"):
+            options["workers"] = _count(arg, "workers")
+        elif opt in ("-w", "--window"):
+            options["window"] = _count(arg, "window")
+        elif opt in ("-l", "--length"):
+            options["length"] = _count(arg, "length")
+        if None in (options["workers"], options["window"], options["length"]):
+            return False
+
+    if len(args) is not 1:
+        print_help()
+        return False
+    options["in_file"] = args[0]
+    return True
+
+# Python main function call
+if __name__ == "__main__":
+    main(sys.argv[1:])
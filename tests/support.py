@@ -0,0 +1,67 @@
+import os
+import StringIO
+import sys
+import tempfile
+from assembler import Assembler
+from simulator import image
+
+# options of a quiet assembly that writes no output
+base_options = {
+    "verbose": False,
+    "dump": False,
+    "console": False,
+    "no_output": True,
+    "in_file": None,
+    "out_file": None
+}
+
+
+# Runs an assembler, capturing what it prints.
+# Input:
+#   options - Assembler options added to base_options.
+# Returns:
+#   (the assembler after the run, the printed text)
+def run(options):
+    run_options = dict(base_options)
+    run_options.update(options)
+    printed = StringIO.StringIO()
+    stdout = sys.stdout
+    sys.stdout = printed
+    try:
+        asm = Assembler(run_options)
+        asm.run()
+    finally:
+        sys.stdout = stdout
+    return asm, printed.getvalue()
+
+
+# Assembles source text.
+# Input:
+#   source - The source text.
+#   options - Optional assembler options added to base_options.
+# Returns:
+#   (the assembler after the run, the printed text)
+def assemble(source, options=None):
+    handle, name = tempfile.mkstemp(".dlx")
+    with os.fdopen(handle, "w") as f:
+        f.write(source)
+    run_options = dict(options or {})
+    run_options["in_file"] = name
+    try:
+        return run(run_options)
+    finally:
+        os.remove(name)
+
+
+# Returns the image of a program, which must assemble without errors.
+# Input:
+#   source - The source text.
+#   options - Optional assembler options added to base_options.
+# Returns:
+#   The image (see simulator.image).
+# Throws:
+#   AssertionError - The program had errors.
+def program_image(source, options=None):
+    asm, printed = assemble(source, options)
+    assert not asm.error, printed
+    return image.from_program(asm.program, asm.symbol_table)
@@ -0,0 +1,122 @@
+import unittest
+from simulator import machine
+from tests.support import program_image
+
+try:
+    import numpy
+    from simulator.batch import BatchSimulator
+except ImportError:
+    numpy = None
+
+# Sums the odd and subtracts the even numbers from r1 down to 1, storing the
+# running total in buf, then converts the total through the floating point
+# units, including conversions of NaN, infinities, and values too large for
+# 32 bits.
+source = """
+main:   addi r3,r0,0
+loop:   beqz r1,done
+        andi r4,r1,1
+        beqz r4,even
+        add r3,r3,r1
+        j next
+even:   sub r3,r3,r1
+next:   slli r5,r1,2
+        andi r5,r5,60
+        addi r6,r5,buf
+        sw 0(r6),r3
+        subi r1,r1,1
+        j loop
+done:   movi2fp f1,r3
+        cvti2d f2,f1
+        divd f4,f2,f0
+        cvtd2i f6,f4
+        ld f8,big
+        cvtd2i f10,f8
+        multd f14,f2,f8
+        cvtd2i f16,f14
+        lf f12,small
+        cvtf2i f13,f12
+        divf f20,f12,f0
+        cvtf2i f21,f20
+        subf f22,f20,f20
+        cvtf2i f23,f22
+        movi2fp f24,r3
+        mult f25,f24,f24
+        div f26,f24,f0
+        movfp2i r7,f25
+        lb r8,small
+        lhu r9,small
+        trap 0
+        .align 3
+big:    .double 100000000000000000000.0
+small:  .float -3.75
+buf:    .space 64
+"""
+# the values of r1 each lane starts with
+inputs = [0, 1, 2, 5, 6, 17, 100, 4096]
+
+
+@unittest.skipIf(numpy is None, "the batch simulator needs numpy")
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.image = program_image(source)
+
+    # Each lane ends in the same state as the scalar machine run on its
+    # input.
+    def test_matches_machine(self):
+        batch = BatchSimulator(self.image, len(inputs))
+        batch.set_register("r1", inputs)
+        batch.run()
+        registers = ["r{0}".format(n) for n in range(32)] + \
+            ["f{0}".format(n) for n in range(32)]
+        buf = self.image.symbol_table["buf"]
+        for lane, value in enumerate(inputs):
+            m = machine.Machine(self.image)
+            m.set_register("r1", value)
+            m.run()
+            self.assertEqual(m.state, machine.halted)
+            self.assertEqual(batch.state[lane], m.state)
+            self.assertEqual(batch.pc[lane], m.pc)
+            self.assertEqual(batch.executed[lane], m.executed)
+            for name in registers:
+                self.assertEqual(batch.register(name)[lane],
+                                 m.register(name),
+                                 "lane {0} {1}".format(lane, name))
+            for address in range(buf, buf + 64, 4):
+                self.assertEqual(batch.read_word(address)[lane],
+                                 m.read(address, 4))
+
+    # Lanes share the pages of the image until they write them.
+    def test_copies_written_pages(self):
+        lanes = 1000
+        batch = BatchSimulator(self.image, lanes)
+        batch.set_register("r1", [n % 2 for n in range(lanes)])
+        batch.run()
+        self.assertEqual(batch.used_pages - batch.shared_pages, lanes // 2)
+        self.assertEqual(batch.read_word(self.image.symbol_table["buf"] + 4)
+                         .tolist(), [n % 2 for n in range(lanes)])
+
+    # The page tables only hold the pages the image holds or the lanes write,
+    # however far apart they are.
+    def test_sparse_pages(self):
+        lanes = 1000
+        image = program_image("""
+main:   lhi r2,0x8000
+        lw r4,4(r2)
+        sw 0(r2),r1
+        lw r3,0(r2)
+        trap 0
+""")
+        batch = BatchSimulator(image, lanes, memory_size=0x80001000)
+        pages = batch.table.shape[1]
+        batch.set_register("r1", range(lanes))
+        batch.run()
+        self.assertEqual(batch.state.tolist(), [machine.halted] * lanes)
+        self.assertEqual(batch.table.shape, (lanes, pages + 1))
+        self.assertEqual(batch.register("r3").tolist(), range(lanes))
+        self.assertEqual(batch.register("r4").tolist(), [0] * lanes)
+        self.assertEqual(batch.read_word(0x80000000).tolist(), range(lanes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import cache
+import stats
+from tests.support import assemble
+
+# a word that isn't aligned after the byte of the string
+source = """
+        .asciiz "a"
+x:      .word 1
+        lw r1,x
+        trap 0
+"""
+
+
+class OutputCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        handle, self.out_file = tempfile.mkstemp(".hex")
+        os.close(handle)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        os.remove(self.out_file)
+
+    def _assemble(self):
+        return assemble(source, {
+            "cache_dir": self.path,
+            "no_output": False,
+            "out_file": self.out_file,
+            "stats_callback": lambda s: None
+        })
+
+    # Warnings of the assembly are printed again on a cache hit.
+    def test_hit_warnings(self):
+        asm, printed = self._assemble()
+        self.assertEqual(asm.stats.counters[stats.cache_misses], 1)
+        with open(self.out_file) as f:
+            output = f.read()
+        asm, hit = self._assemble()
+        self.assertEqual(asm.stats.counters[stats.cache_hits], 1)
+        self.assertIn("WARNING line 3: unaligned word", printed)
+        self.assertEqual(hit, printed)
+        with open(self.out_file) as f:
+            self.assertEqual(f.read(), output)
+
+    # The directory is only scanned once the size estimate goes over the
+    # maximum, which removes the oldest entries and stale temporary files.
+    def test_evict(self):
+        entries = cache.OutputCache(self.path, max_size=110)
+        scans = []
+        evict = entries._evict
+
+        def counted_evict():
+            scans.append(True)
+            evict()
+        entries._evict = counted_evict
+        entries.put("aa01", "x" * 40, ["WARNING line 1: a"])
+        self.assertEqual(len(scans), 1)
+        entries.put("aa02", "x" * 40)
+        self.assertEqual(len(scans), 1)
+        stale = os.path.join(self.path, "aa", "old" + cache.temp_ext)
+        open(stale, "w").close()
+        old = time.time() - cache.stale_age - 1
+        os.utime(stale, (old, old))
+        os.utime(entries._entry_path("aa01"), (old, old))
+        entries.put("aa03", "x" * 40)
+        self.assertEqual(len(scans), 2)
+        self.assertFalse(os.path.exists(stale))
+        self.assertIsNone(entries.get("aa01"))
+        self.assertEqual(entries.get("aa02"), ("x" * 40, []))
+        self.assertEqual(entries.get("aa03"), ("x" * 40, []))
+        self.assertEqual(entries._read_size(), 84)
@@ -0,0 +1,60 @@
+import unittest
+from simulator import machine
+from simulator.caches import CacheConfig, CacheSimulation
+from tests.support import program_image
+
+# Writes every word of arr, which is reserved with .space, then reads tail
+# and count. The word after the code has no label of its own.
+source = """
+main:   addi r1,r0,arr
+        addi r2,r0,2048
+loop:   sw 0(r1),r2
+        addi r1,r1,4
+        subi r2,r2,1
+        bnez r2,loop
+        lw r3,count
+        lw r4,tail
+        trap 0
+        .word 5
+tail:   .word 7
+count:  .word 3
+        .align 5
+arr:    .space 8192
+"""
+
+
+class CacheSimulationTest(unittest.TestCase):
+    def setUp(self):
+        self.image = program_image(source)
+        self.simulation = CacheSimulation(CacheConfig())
+        m = machine.Machine(self.image)
+        self.simulation.attach(m)
+        m.run()
+        self.assertEqual(m.state, machine.halted)
+
+    # Words reserved with .space count as accesses to their label.
+    def test_space_by_label(self):
+        report = self.simulation.report(self.image)
+        rows = report.split("Data accesses by label:\n")[1] \
+            .split("Accesses by line:")[0].splitlines()
+        names = dict((row.split(":")[0].strip(), row) for row in rows)
+        self.assertEqual(sorted(names), ["arr", "count", "tail"])
+        self.assertIn(" 2048 accesses", names["arr"])
+        # one miss for each 32 byte line
+        self.assertIn(" 256 misses", names["arr"])
+
+    # Labels cover the data after them up to the next instruction, and
+    # instructions only in the run they label.
+    def test_labels(self):
+        symbols = self.image.symbol_table
+        self.assertEqual(self.image.label(symbols["arr"] + 8188), "arr")
+        self.assertEqual(self.image.label(symbols["loop"] + 12), "loop")
+        self.assertEqual(self.image.label(symbols["tail"]), "tail")
+        self.assertEqual(self.image.label(symbols["main"] + 4), "main")
+        self.assertEqual(self.image.label(symbols["tail"] - 4),
+                         "0x{0:08x}".format(symbols["tail"] - 4))
+        self.assertEqual(self.image.label(symbols["main"] + 8), "loop")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import StringIO
+import sys
+import threading
+import unittest
+from dlx_parser import grammar
+from dlx_parser.context import ParseContext
+
+
+# Parses lines with a context, hiding what it prints.
+# Input:
+#   context - The parse context.
+#   lines - The lines of source text.
+# Returns:
+#   List of the line numbers of the parsed lines.
+def _parse(context, lines):
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        return [context.parse(line)[grammar.line_no] for line in lines]
+    finally:
+        sys.stdout = stdout
+
+
+class ParseContextTest(unittest.TestCase):
+    # Contexts count lines and collect warnings separately.
+    def test_separate(self):
+        first = ParseContext()
+        second = ParseContext()
+        self.assertEqual(_parse(first, ["nop\n", "addi r1,r0,70000\n"]),
+                         [1, 2])
+        self.assertEqual(_parse(second, ["nop\n"]), [1])
+        self.assertEqual(len(first.warnings), 1)
+        self.assertIn("line 2", first.warnings[0])
+        self.assertEqual(second.warnings, [])
+
+    # Contexts used from several threads at once don't share state.
+    def test_threads(self):
+        lines = ["loop: addi r{0},r0,{1}\n".format(n % 32, n)
+                 for n in range(200)]
+        results = {}
+
+        def parse(n):
+            context = ParseContext()
+            results[n] = [
+                (data[grammar.line_no],
+                 data[grammar.instruction][grammar.i_immediate])
+                for data in (context.parse(line) for line in lines)
+            ]
+        threads = [threading.Thread(target=parse, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = [(n + 1, n) for n in range(200)]
+        self.assertEqual(results, dict((n, expected) for n in range(4)))
+
+    # The time spent in the lexer is measured with the clock given.
+    def test_lex_time(self):
+        ticks = [0]
+
+        def clock():
+            ticks[0] += 1
+            return ticks[0]
+        context = ParseContext(clock)
+        _parse(context, ["addi r1,r2,3\n"])
+        self.assertGreater(context.lex_time, 0)
@@ -0,0 +1,79 @@
+import os
+import StringIO
+import tempfile
+import unittest
+from simulator import devices, machine
+from tests.support import program_image
+
+# Waits for the timer, prints a byte, then reads block 1 of the disk and
+# waits for the transfer.
+source = """
+main:   lhi r1,0xffff
+        addi r2,r0,5000
+        sw 260(r1),r2
+wait:   lw r3,264(r1)
+        andi r3,r3,1
+        beqz r3,wait
+        addi r4,r0,65
+        sw 0(r1),r4
+        addi r5,r0,1
+        sw 512(r1),r5
+        addi r6,r0,buf
+        sw 516(r1),r6
+        sw 520(r1),r5
+        sw 524(r1),r5
+poll:   lw r7,528(r1)
+        andi r7,r7,4
+        beqz r7,poll
+        lw r8,buf
+        trap 0
+buf:    .space 512
+"""
+
+
+class DeviceTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.disk = tempfile.mkstemp(".disk")
+        with os.fdopen(handle, "wb") as f:
+            f.write("\0" * devices.block_size + "\0\0\0\x2a")
+            f.write("\0" * (devices.block_size - 4))
+
+    def tearDown(self):
+        os.remove(self.disk)
+
+    # Runs the program with the devices.
+    # Input:
+    #   idle_skip - True to skip polling loops.
+    # Returns:
+    #   (machine, console output)
+    def _run(self, idle_skip):
+        out = StringIO.StringIO()
+        simulation = devices.DeviceSimulation(self.disk, out=out,
+                                              idle_skip=idle_skip)
+        m = machine.Machine(program_image(source))
+        simulation.attach(m)
+        m.run(machine.default_max_steps)
+        self.assertEqual(m.state, machine.halted)
+        self.assertEqual(simulation.scheduler.fired, 2)
+        simulation.devices[-1].f.close()
+        return m, out.getvalue()
+
+    def test_devices(self):
+        m, out = self._run(False)
+        self.assertEqual(out, "A")
+        self.assertEqual(m.register("r8"), 42)
+        self.assertGreater(m.executed, 5000 + devices.default_disk_latency)
+        self.assertEqual(m.skipped, 0)
+
+    # Skipping the polling loops doesn't change the result or the time.
+    def test_idle_skip(self):
+        m, out = self._run(False)
+        skipped, skipped_out = self._run(True)
+        self.assertEqual(skipped_out, out)
+        self.assertEqual(skipped.register("r8"), 42)
+        self.assertEqual(skipped.executed, m.executed)
+        self.assertGreater(skipped.skipped, 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
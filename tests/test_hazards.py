@@ -0,0 +1,56 @@
+import unittest
+from analysis import cfg, hazards
+from analysis.pipeline import PipelineModel
+from tests.support import assemble
+
+# A load used by the next instruction, a multiply whose result is read right
+# away, and a loop branch on the result of the instruction before it.
+source = """
+        addi r2,r0,data
+        lw r1,0(r2)
+        add r3,r1,r1
+        movi2fp f1,r3
+        multf f2,f1,f1
+        addf f3,f2,f2
+loop:   subi r3,r3,1
+        bnez r3,loop
+        trap 0
+data:   .word 3
+"""
+
+
+class HazardTest(unittest.TestCase):
+    def setUp(self):
+        asm, printed = assemble(source)
+        self.assertFalse(asm.error, printed)
+        self.blocks = cfg.build_blocks(asm.program, asm.symbol_table)
+
+    # Each stall is charged to the instruction that waits, with its producer
+    # and register.
+    def test_stalls(self):
+        report = hazards.analyze(self.blocks, PipelineModel())
+        lines = report.line_hazards()
+        self.assertEqual(sorted(lines), [4, 7, 9])
+        load, = lines[4]
+        self.assertEqual((load.kind, load.cycles, load.register),
+                         (hazards.load_use_hazard, 1, "r1"))
+        self.assertEqual(load.producer.line_no, 3)
+        mult, = lines[7]
+        self.assertEqual((mult.kind, mult.cycles, mult.register),
+                         (hazards.raw_hazard, 6, "f2"))
+        # branches read their registers in ID, a cycle before EX
+        branch, = lines[9]
+        self.assertEqual((branch.kind, branch.cycles, branch.register),
+                         (hazards.raw_hazard, 1, "r3"))
+        self.assertEqual(report.stalls(), 8)
+        self.assertIn("1 stall load-use on r1 after lw (line 3)",
+                      report.report())
+
+    # The loop block is charged the branch penalty as if the branch were
+    # taken.
+    def test_branch_penalty(self):
+        report = hazards.analyze(self.blocks, PipelineModel())
+        penalties = dict((result.block.name(), result.branch_penalty)
+                         for result in report.blocks)
+        self.assertEqual(penalties["loop"], 1)
+        self.assertEqual(sum(penalties.values()), 1)
@@ -0,0 +1,57 @@
+import StringIO
+import unittest
+from simulator import machine
+from simulator.devices import DeviceSimulation
+from simulator.hostio import HostIO
+from tests.support import program_image
+
+# Copies the console input to the console output 64 bytes at a time. r1 to
+# r3 are the same at the end of every full iteration.
+source = """
+loop:   addi r1,r0,0
+        addi r2,r0,buf
+        addi r3,r0,64
+        trap 3
+        add r3,r0,r1
+        addi r1,r0,1
+        trap 4
+        bnez r3,loop
+        trap 0
+buf:    .space 64
+"""
+
+
+class HostIOTest(unittest.TestCase):
+    # Runs the copy loop on some input.
+    # Input:
+    #   data - The console input.
+    #   devices - True to run with the devices and idle loop skipping.
+    # Returns:
+    #   (machine, console output)
+    def _copy(self, data, devices):
+        out = StringIO.StringIO()
+        m = machine.Machine(program_image(source))
+        if devices:
+            DeviceSimulation(out=out).attach(m)
+        HostIO(StringIO.StringIO(data), out, out).attach(m)
+        m.run(machine.default_max_steps)
+        return m, out.getvalue()
+
+    def test_copy(self):
+        data = "".join(chr(n % 251) for n in range(640))
+        m, out = self._copy(data, False)
+        self.assertEqual(m.state, machine.halted)
+        self.assertEqual(out, data)
+
+    # Trap handlers change memory and files, so loops with traps aren't
+    # skipped as idle.
+    def test_copy_with_devices(self):
+        data = "".join(chr(n % 251) for n in range(640))
+        m, out = self._copy(data, True)
+        self.assertEqual(m.state, machine.halted)
+        self.assertEqual(out, data)
+        self.assertEqual(m.skipped, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import glob
+import os
+import tempfile
+import unittest
+from tests.support import run
+
+inputs_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Inputs"
+)
+
+
+# Returns the path of a file in the inputs directory.
+# Input:
+#   name - The file name.
+# Returns:
+#   The path.
+def _input(name):
+    return os.path.join(inputs_dir, name)
+
+
+# input file -> the assembler options it is assembled with, for the inputs
+# that exercise optimization passes
+options = {
+    "deadCode.dlx": {"dead_code": True},
+    "delaySlots.dlx": {"delay_slots": True},
+    "layoutJoin.dlx": {"profile": _input("layoutJoin.prof")},
+    "layoutLoop.dlx": {"profile": _input("layoutLoop.prof")},
+    "nops.dlx": {"nops": True},
+    "packData.dlx": {"pack_data": True},
+    "peephole.dlx": {"peephole": True},
+    "rewrites.dlx": {"rewrites": _input("rewrites.json")},
+    "schedule.dlx": {"schedule": True},
+    "strength.dlx": {"strength": True}
+}
+
+
+# Returns the addresses and data of an assembled listing, without the
+# descriptions, which differ in spacing between assembler versions.
+# Input:
+#   text - The listing.
+# Returns:
+#   List of (address, hex data) strings.
+def _words(text):
+    words = []
+    for line in text.splitlines():
+        if line.strip():
+            address, rest = line.split(":", 1)
+            words.append((address.strip().lower(),
+                          rest.split("#", 1)[0].strip().lower()))
+    return words
+
+
+# Each Inputs/*.dlx file assembles to the addresses and data of the .hex file
+# with the same name.
+class InputsTest(unittest.TestCase):
+    def test_inputs(self):
+        names = sorted(glob.glob(os.path.join(inputs_dir, "*.dlx")))
+        self.assertTrue(names)
+        for name in names:
+            handle, out_file = tempfile.mkstemp(".hex")
+            os.close(handle)
+            file_options = dict(options.get(os.path.basename(name), {}))
+            file_options.update({
+                "in_file": name,
+                "out_file": out_file,
+                "no_output": False
+            })
+            try:
+                asm, printed = run(file_options)
+                with open(out_file, "r") as f:
+                    output = f.read()
+            finally:
+                os.remove(out_file)
+            self.assertFalse(asm.error, name + "\n" + printed)
+            with open(name.replace(".dlx", ".hex"), "r") as f:
+                expected = f.read()
+            self.assertEqual(_words(output), _words(expected), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+from tests.support import assemble
+
+
+# Optimization passes that would break programs refuse them.
+class RefusalTest(unittest.TestCase):
+    # Filling delay slots moves instructions, so numeric branch targets
+    # would point at the wrong code.
+    def test_delay_slots_numeric_target(self):
+        asm, printed = assemble("j 0x10\nnop\ntrap 0\n",
+                                {"delay_slots": True})
+        self.assertTrue(asm.error)
+        self.assertIn("numeric addresses", printed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from simulator import machine
+from simulator.paging import PagedMemory, page_size
+from tests.support import program_image
+
+
+class PagedMemoryTest(unittest.TestCase):
+    # Pages are allocated when written, and reads of other pages are zero.
+    def test_sparse(self):
+        memory = PagedMemory(1 << 32)
+        self.assertEqual(memory.read(0xfffffff8, 8), 0)
+        self.assertEqual(memory.pages, {})
+        memory.write(0xfffffffc, 0x12345678, 4)
+        self.assertEqual(memory.read(0xfffffffe, 2), 0x5678)
+        self.assertEqual(sorted(memory.pages), [0xfffff])
+
+    def test_bytes_across_pages(self):
+        memory = PagedMemory(1 << 20)
+        memory.write_bytes(page_size - 2, bytearray("abcd"))
+        self.assertEqual(sorted(memory.pages), [0, 1])
+        self.assertEqual(memory.read_bytes(page_size - 3, 6),
+                         bytearray("\0abcd\0"))
+
+    # Shared pages are copied when written, leaving the buffer as it was.
+    def test_shared_copy(self):
+        shared = "\1" * page_size
+        memory = PagedMemory(1 << 20, {1: shared})
+        self.assertEqual(memory.read(page_size, 1), 1)
+        memory.write(page_size, 7, 1)
+        self.assertEqual(memory.read(page_size, 2), 0x0701)
+        self.assertEqual(shared[0], "\1")
+
+    # A machine with 4 GB of memory only holds the pages it uses.
+    def test_machine(self):
+        image = program_image("""
+main:   lhi r1,0xffff
+        addi r2,r0,9
+        sw -4(r1),r2
+        lw r3,-4(r1)
+        trap 0
+""")
+        m = machine.Machine(image, memory_size=1 << 32)
+        m.run(machine.default_max_steps)
+        self.assertEqual(m.state, machine.halted)
+        self.assertEqual(m.register("r3"), 9)
+        self.assertEqual(sorted(m.memory.pages), [0, 0xfffef])
+
+
+if __name__ == "__main__":
+    unittest.main()
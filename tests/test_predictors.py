@@ -0,0 +1,46 @@
+import unittest
+from simulator import machine, predictors
+from tests.support import program_image
+
+# A backward loop branch taken 9 times, then not taken.
+source = """
+main:   addi r1,r0,10
+loop:   subi r1,r1,1
+        bnez r1,loop
+        trap 0
+"""
+
+
+class PredictorTest(unittest.TestCase):
+    # Each predictor's mispredictions are counted for each branch.
+    def test_loop(self):
+        image = program_image(source)
+        simulation = predictors.BranchSimulation(
+            [predictors.create(name) for name in predictors.names]
+        )
+        m = machine.Machine(image)
+        simulation.attach(m)
+        m.run(machine.default_max_steps)
+        bnez = image.symbol_table["loop"] + 4
+        counts = simulation.branches[bnez]
+        mispredictions = dict(zip(predictors.names, counts[2:]))
+        self.assertEqual(counts[:2], [10, 9])
+        self.assertEqual(mispredictions["taken"], 1)
+        self.assertEqual(mispredictions["not_taken"], 9)
+        self.assertEqual(mispredictions["btfn"], 1)
+        # the first prediction, then the exit
+        self.assertEqual(mispredictions["1bit"], 2)
+        self.assertEqual(mispredictions["2bit"], 2)
+        report = simulation.report(image)
+        self.assertIn("loop+4 : 0x00000008", report)
+        self.assertIn("line 4 :", report)
+
+    def test_create(self):
+        self.assertEqual(predictors.create("gshare:12").name, "gshare:12")
+        self.assertEqual(predictors.create("2bit:10").name, "2bit")
+        for description in ("perceptron", "2bit:0", "2bit:25", "taken:4"):
+            self.assertRaises(ValueError, predictors.create, description)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from analysis.profile import BranchProfile
+from tests.support import run
+from tests.test_inputs import _input
+
+
+class BranchProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # Returns the output of an assembly of an input file.
+    # Input:
+    #   name - The input file name.
+    #   options - Assembler options.
+    # Returns:
+    #   The assembled output.
+    def _output(self, name, options):
+        out_file = os.path.join(self.path, "out.hex")
+        run_options = dict(options)
+        run_options.update({
+            "in_file": _input(name),
+            "out_file": out_file,
+            "no_output": False
+        })
+        asm, printed = run(run_options)
+        self.assertFalse(asm.error, printed)
+        with open(out_file) as f:
+            return f.read()
+
+    # A profile recorded by a run lays out the blocks like the equivalent
+    # text profile.
+    def test_record(self):
+        recorded = os.path.join(self.path, "loop.prof")
+        self._output("layoutLoop.dlx", {"record_profile": recorded})
+        profile = BranchProfile()
+        profile.load(recorded)
+        self.assertEqual(profile.counts, {4: [100, 1]})
+        self.assertEqual(
+            self._output("layoutLoop.dlx", {"profile": recorded}),
+            self._output("layoutLoop.dlx",
+                         {"profile": _input("layoutLoop.prof")})
+        )
+
+    # Profiles are keyed by the addresses of the unoptimized program.
+    def test_record_optimized(self):
+        recorded = os.path.join(self.path, "loop.prof")
+        asm, printed = run({"in_file": _input("layoutLoop.dlx"),
+                            "record_profile": recorded,
+                            "peephole": True})
+        self.assertTrue(asm.error)
+        self.assertIn("optimized program", printed)
+        self.assertFalse(os.path.exists(recorded))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from analysis.pipeline import PipelineModel
+from simulator import machine
+from simulator.profiler import Profiler
+from tests.support import assemble, program_image
+
+# A loop, then two calls of a function with a load-use stall.
+source = """
+main:   addi r1,r0,10
+loop:   subi r1,r1,1
+        bnez r1,loop
+        jal f
+        jal f
+        trap 0
+f:      lw r2,word
+        add r3,r2,r2
+        jr r31
+word:   .word 5
+"""
+
+
+class ProfilerTest(unittest.TestCase):
+    # Runs the program with a profiler.
+    # Input:
+    #   model - The pipeline model, or None for one cycle per instruction.
+    # Returns:
+    #   (the profiler, the image)
+    def _profile(self, model):
+        asm, printed = assemble(source)
+        self.assertFalse(asm.error, printed)
+        image = program_image(source)
+        profiler = Profiler(asm.program, model)
+        m = machine.Machine(image)
+        profiler.attach(m)
+        m.run(machine.default_max_steps)
+        self.assertEqual(m.state, machine.halted)
+        return profiler, image
+
+    # Cycles include the stalls of each instruction as executed and the
+    # branch penalty of each taken branch and jump.
+    def test_cycles(self):
+        profiler, image = self._profile(PipelineModel())
+        labels, lines = profiler.totals(image)
+        self.assertEqual(profiler.counters.totals(), [30, 55])
+        # a stall on r1 each time, and the penalty when taken
+        self.assertEqual(lines[4], [10, 29])
+        # the load-use stall
+        self.assertEqual(lines[9], [2, 4])
+        self.assertEqual(labels["f"], [6, 10])
+        self.assertIn("Profile: 30 instructions, 55 estimated cycles",
+                      profiler.report(image))
+
+    # Cycles are totaled by call stack.
+    def test_folded(self):
+        profiler, _ = self._profile(PipelineModel())
+        self.assertEqual(profiler.folded(), "main 45\nmain;f 10\n")
+
+    def test_without_model(self):
+        profiler, image = self._profile(None)
+        self.assertEqual(profiler.counters.totals(), [30, 30])
+        annotated = profiler.annotate(image, source).splitlines()
+        self.assertEqual(annotated[4].split()[:2], ["10", "10"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from simulator import machine, shared
+from tests.support import program_image
+
+# Sums the words of a table.
+source = """
+main:   addi r1,r0,table
+        addi r2,r0,4
+loop:   lw r3,0(r1)
+        add r4,r4,r3
+        addi r1,r1,4
+        subi r2,r2,1
+        bnez r2,loop
+        sw total,r4
+        trap 0
+table:  .word 1,2,3,4
+total:  .word 0
+"""
+
+
+class SharedImageTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.name = tempfile.mkstemp(".shm")
+        os.close(handle)
+        self.image = program_image(source)
+        shared.publish(self.image, self.name)
+
+    def tearDown(self):
+        os.remove(self.name)
+
+    # An attached image runs like the image it was published from, and
+    # holds the same symbols, lines, and decoded instructions.
+    def test_attach(self):
+        attached = shared.attach(self.name)
+        self.assertEqual(attached.symbol_table, self.image.symbol_table)
+        self.assertEqual(attached.lines, self.image.lines)
+        self.assertEqual(attached.digest(), self.image.digest())
+        self.assertEqual(attached.decoded(8).name, "lw")
+        self.assertIsNone(attached.decoded(attached.symbol_table["table"]))
+        states = []
+        for image in (self.image, attached):
+            m = machine.Machine(image)
+            m.run(machine.default_max_steps)
+            states.append((m.state, m.executed, m.register("r4"),
+                           m.read(image.symbol_table["total"], 4)))
+        self.assertEqual(states[0], states[1])
+        self.assertEqual(states[1][2:], (10, 10))
+
+    # Writes go to the memory of a machine, not to the shared file.
+    def test_copy_on_write(self):
+        attached = shared.attach(self.name)
+        m = machine.Machine(attached)
+        m.run(machine.default_max_steps)
+        other = machine.Machine(shared.attach(self.name))
+        self.assertEqual(other.read(attached.symbol_table["total"], 4), 0)
+
+    def test_not_image(self):
+        with open(self.name, "wb") as f:
+            f.write("not an image" * 10)
+        self.assertRaises(ValueError, shared.attach, self.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
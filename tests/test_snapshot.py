@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from simulator import machine, snapshot
+from tests.support import assemble, program_image
+
+# Counts r1 down from 100, storing the count in a word of its own page.
+source = """
+main:   addi r1,r0,100
+loop:   subi r1,r1,1
+        sw count,r1
+        bnez r1,loop
+mid:    addi r2,r0,7
+        trap 0
+        .align 12
+count:  .word 0
+"""
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.name = os.path.join(self.path, "state.snap")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # A restored machine continues where the saved one stopped.
+    def test_restore(self):
+        image = program_image(source)
+        m = machine.Machine(image)
+        m.run(101)
+        self.assertEqual(snapshot.save(m, self.name), 1)
+        restored = machine.Machine(image)
+        snapshot.restore(restored, self.name)
+        self.assertEqual(restored.pc, m.pc)
+        self.assertEqual(restored.executed, 101)
+        self.assertEqual(restored.read(image.symbol_table["count"], 4), 67)
+        restored.run(machine.default_max_steps)
+        self.assertEqual(restored.state, machine.halted)
+        self.assertEqual(restored.register("r2"), 7)
+
+    # A snapshot is refused by a machine running another image.
+    def test_other_image(self):
+        m = machine.Machine(program_image(source))
+        m.run(10)
+        snapshot.save(m, self.name)
+        other = machine.Machine(program_image(source + "trap 0\n"))
+        self.assertRaises(ValueError, snapshot.restore, other, self.name)
+
+    # Breakpoints, a restored snapshot, and a step limit each run the
+    # program on their own.
+    def test_options_run(self):
+        _, printed = assemble(source, {"breakpoints": ["mid"],
+                                       "snapshot": self.name})
+        self.assertIn("Simulation stopped at mid after 301 instructions",
+                      printed)
+        _, printed = assemble(source, {"restore": self.name})
+        self.assertIn("Simulated 303 instructions", printed)
+        _, printed = assemble(source, {"max_steps": 5})
+        self.assertIn("simulation stopped after 5 instructions", printed)
+
+
+if __name__ == "__main__":
+    unittest.main()
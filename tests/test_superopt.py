@@ -0,0 +1,78 @@
+import os
+import random
+import tempfile
+import unittest
+from dlx_parser.grammar import i_opcode, i_rd, i_rs1, i_immediate
+from optimizer import rewrites, superopt
+
+
+# Returns the source of an instruction with an immediate.
+# Input:
+#   op - The opcode.
+#   rd - The destination register.
+#   rs1 - The source register, or None.
+#   imm - The immediate.
+# Returns:
+#   The instruction's source as defined in the grammar.
+def _immediate(op, rd, rs1, imm):
+    source = {i_opcode: op, i_rd: rd, i_immediate: imm}
+    if rs1 is not None:
+        source[i_rs1] = rs1
+    return source
+
+
+class SuperoptTest(unittest.TestCase):
+    # Chains of immediates fold into one instruction.
+    def test_folds_constants(self):
+        window = [_immediate("addi", "r1", "r2", 1),
+                  _immediate("addi", "r1", "r1", 1)]
+        self.assertEqual(superopt.search(window, ["r1"], 2),
+                         [_immediate("addi", "r1", "r2", 2)])
+        window = [_immediate("slli", "r1", "r2", 3),
+                  _immediate("slli", "r1", "r1", 2)]
+        self.assertEqual(superopt.search(window, ["r1"], 2),
+                         [_immediate("slli", "r1", "r2", 5)])
+
+    # lhi and shifts are checked at full width, where lhi 1 isn't 0.
+    def test_verifies_lhi_at_full_width(self):
+        window = [_immediate("lhi", "r1", None, 1),
+                  _immediate("srli", "r1", "r1", 16)]
+        sequence = [_immediate("addi", "r1", "r0", 1)]
+        self.assertTrue(superopt.verify(window, sequence, ["r1"],
+                                        random.Random(0)))
+        sequence = [_immediate("addi", "r1", "r0", 0)]
+        self.assertFalse(superopt.verify(window, sequence, ["r1"],
+                                         random.Random(0)))
+
+
+class RewriteDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(".json")
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # Windows without a better sequence are searched again at longer
+    # lengths, also after the database is saved and loaded.
+    def test_searched_lengths(self):
+        database = rewrites.RewriteDatabase(self.path)
+        database.put("a", None, 1)
+        database.put("b", [_immediate("addi", "r1", "r2", 2)], 2)
+        database.save()
+        database = rewrites.RewriteDatabase(self.path)
+        database.load()
+        self.assertTrue(database.searched("a", 1))
+        self.assertFalse(database.searched("a", 2))
+        self.assertTrue(database.searched("b", 3))
+        self.assertIsNone(database.lookup("a"))
+        database.put("a", None, 2)
+        self.assertTrue(database.searched("a", 2))
+        self.assertEqual(sorted(database.rewrites),
+                         ["a" + rewrites.length_separator + "2", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from simulator import machine, trace
+from tests.support import program_image
+
+# Stores and reloads a counter in a loop.
+source = """
+main:   addi r1,r0,10
+loop:   sw count,r1
+        lw r2,count
+        subi r1,r2,1
+        bnez r1,loop
+        trap 0
+count:  .word 0
+"""
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.name = tempfile.mkstemp(".trace")
+        os.close(handle)
+        self.image = program_image(source)
+        m = machine.Machine(self.image)
+        recorder = trace.TraceRecorder(
+            trace.TraceWriter(open(self.name, "wb"), chunk_records=7)
+        )
+        recorder.attach(m)
+        m.run(machine.default_max_steps)
+        recorder.close()
+        self.executed = m.executed
+
+    def tearDown(self):
+        os.remove(self.name)
+
+    # Returns the records of the trace.
+    # Input:
+    #   cycle - The cycle of the first record.
+    # Returns:
+    #   List of trace records.
+    def _records(self, cycle=0):
+        with open(self.name, "rb") as f:
+            return list(trace.TraceReader(f).records(cycle))
+
+    # Records hold the address, instruction, register writes, and memory
+    # access of each instruction executed.
+    def test_records(self):
+        records = self._records()
+        self.assertEqual(len(records), self.executed)
+        self.assertEqual([r.cycle for r in records], range(self.executed))
+        count = self.image.symbol_table["count"]
+        store, load = records[1:3]
+        self.assertEqual((store.pc, store.name, store.address,
+                          store.is_store), (4, "sw", count, True))
+        self.assertEqual((load.pc, load.name, load.address, load.is_store),
+                         (8, "lw", count, False))
+        self.assertEqual(load.writes, [(2, 10)])
+        self.assertEqual(records[5].pc, 4)
+        self.assertEqual(records[-1].name, "trap")
+
+    # Reading can start at any cycle, using the index, or the chunk headers
+    # when the trace was cut short.
+    def test_seek(self):
+        records = self._records()
+        with open(self.name, "rb") as f:
+            reader = trace.TraceReader(f)
+            self.assertEqual(len(reader.index()),
+                             (self.executed + 6) // 7)
+        later = self._records(20)
+        self.assertEqual([(r.cycle, r.pc, r.writes) for r in later],
+                         [(r.cycle, r.pc, r.writes) for r in records[20:]])
+        with open(self.name, "rb") as f:
+            data = f.read()
+        with open(self.name, "wb") as f:
+            f.write(data[:data.rindex(trace.index_magic, 0, -1)])
+        self.assertEqual([r.pc for r in self._records(20)],
+                         [r.pc for r in later])
+
+    def test_not_trace(self):
+        with open(self.name, "wb") as f:
+            f.write("not a trace")
+        with open(self.name, "rb") as f:
+            self.assertRaises(ValueError, trace.TraceReader, f)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+import stats
+
+
+# Records spans of assembler execution as Chrome trace events, which can be
+# viewed in chrome://tracing or Perfetto. A tracer may be shared by
+# assemblers running in several threads; each event records the process and
+# thread it came from.
+class Tracer(object):
+    def __init__(self):
+        # timestamps are relative to the creation of the tracer
+        self.origin = stats.clock()
+        self.events = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    # Records a complete span.
+    # Input:
+    #   name - The span name.
+    #   start - The start time, from stats.clock.
+    #   end - The end time, from stats.clock.
+    #   category - The span category.
+    #   args - Optional dictionary of values shown with the span.
+    # Returns:
+    #   n/a
+    def complete(self, name, start, end, category="stage", args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.current_thread().ident
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self._name_thread(event["pid"], event["tid"])
+            self.events.append(event)
+
+    # Returns the trace in the Chrome trace event format.
+    # Input:
+    #   n/a
+    # Returns:
+    #   Dictionary suitable for encoding as JSON.
+    def to_dict(self):
+        with self.lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+    # Writes the trace to a file.
+    # Input:
+    #   name - The file name.
+    # Returns:
+    #   n/a
+    def write(self, name):
+        with open(name, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    # Adds a metadata event naming the thread, the first time it is seen.
+    # Must be called with the lock held.
+    # Input:
+    #   pid - The process id.
+    #   tid - The thread id.
+    # Returns:
+    #   n/a
+    def _name_thread(self, pid, tid):
+        if (pid, tid) in self.threads:
+            return
+        self.threads.add((pid, tid))
+        self.events.append({
+            "name": "thread_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": tid,
+            "args": {"name": threading.current_thread().name}
+        })